@@ -0,0 +1,256 @@
+"""
+Render the thumbnails of many runs from a catalog, e.g. a whole proposal cycle.
+
+Run like:
+ariadne-backfill bmm --since 2021-01-01 --until 2021-05-01 --workers 8
+
+The runs are rendered in a pool of worker processes, each of which opens the
+catalog once. The uid of each run rendered is appended to a checkpoint file,
+so an interrupted backfill resumes where it stopped when run again. Runs
+whose thumbnails are current in the thumbnail index, e.g. because the
+previews service rendered them, are skipped.
+"""
+import argparse
+import concurrent.futures
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from .plot_specs import PlotSpecs
+from .thumbnail_cache import ThumbnailCache
+from .thumbnails import default_thumbnail_root, render_thumbnails, thumbnail_directory
+
+# The catalog, thumbnail index and plot specs of a worker process, set once by _initialize_worker.
+_catalog = None
+_cache = None
+_plot_specs = None
+
+
+def open_named_catalog(name):
+    "Open a catalog by its name in the databroker configuration."
+    import databroker
+
+    return databroker.catalog[name]
+
+
+def _initialize_worker(open_catalog, cache_root=None, plot_specs=None):
+    global _catalog, _cache, _plot_specs
+    _catalog = open_catalog()
+    _plot_specs = plot_specs
+    if cache_root is not None:
+        _cache = ThumbnailCache(cache_root, plot_specs=plot_specs)
+
+
+def _render_run(uid, root):
+    """
+    Render the thumbnails of one run in a worker. Return (uid, stop document, filenames).
+
+    filenames is None if the thumbnails were current, and so not rendered.
+    """
+    run = _catalog[uid]
+    stop = run.metadata["stop"]
+    if _cache is not None and stop is not None and _cache.is_current(uid, stop):
+        return uid, stop, None
+    filenames = render_thumbnails(run.documents(fill="no"), thumbnail_directory(uid, root), plot_specs=_plot_specs)
+    return uid, stop, filenames
+
+
+class Checkpoint:
+    """
+    The uids of the runs already done, one per line in a file that is only appended to.
+
+    Parameters
+    ----------
+    path : String
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as file:
+                self.done = {line.strip() for line in file if line.strip()}
+        except FileNotFoundError:
+            self.done = set()
+
+    def __contains__(self, uid):
+        return uid in self.done
+
+    def add(self, uid):
+        with open(self.path, "a") as file:
+            file.write(f"{uid}\n")
+        self.done.add(uid)
+
+
+class Progress:
+    """
+    Report progress and throughput, at most every ``interval`` seconds.
+
+    Parameters
+    ----------
+    total : Integer
+        Number of runs to do
+    stream : File, optional
+        Default is sys.stderr.
+    interval : Number, optional
+        Seconds. Default is 2.
+    """
+
+    def __init__(self, total, stream=None, interval=2.0):
+        self.total = total
+        self.stream = stream if stream is not None else sys.stderr
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self._start = time.monotonic()
+        self._last_report = float("-inf")
+
+    @property
+    def rate(self):
+        "Runs per second so far"
+        elapsed = time.monotonic() - self._start
+        return (self.done + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def update(self, failed=False):
+        if failed:
+            self.failed += 1
+        else:
+            self.done += 1
+        now = time.monotonic()
+        if now - self._last_report >= self.interval or self.done + self.failed == self.total:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        rate = self.rate
+        remaining = self.total - self.done - self.failed
+        eta = f"{remaining / rate:.0f} s" if rate else "-"
+        print(
+            f"{self.done + self.failed}/{self.total} runs ({self.failed} failed), {rate:.2f} runs/s, ETA {eta}",
+            file=self.stream,
+            flush=True,
+        )
+
+
+def backfill(
+    open_catalog, uids, root=None, max_workers=None, checkpoint=None, cache=None, progress=None, plot_specs=None
+):
+    """
+    Render the thumbnails of runs in a pool of worker processes.
+
+    Parameters
+    ----------
+    open_catalog : Callable
+        Returns the catalog. It is called once in each worker, so it must
+        pickle, e.g. ``functools.partial(open_named_catalog, "bmm")``.
+    uids : Iterable[String]
+    root : String, optional
+        Default is ``default_thumbnail_root()``.
+    max_workers : Integer, optional
+        Default is the number of CPUs.
+    checkpoint : Checkpoint, optional
+        Runs in it are skipped, and each run done is added.
+    cache : ThumbnailCache, optional
+        Runs whose thumbnails are current in it are skipped, and each run
+        done is recorded in it, so that the previews service skips it.
+    progress : Progress, optional
+    plot_specs : PlotSpecs, optional
+        Which plots to render for each plan. Default is the cache's, if
+        given, else ``PLOT_SPECS``.
+
+    Returns
+    -------
+    failed : Dict[String, Exception]
+        Map the uid of each run that could not be rendered to the error
+    """
+    if root is None:
+        root = default_thumbnail_root()
+    if plot_specs is None and cache is not None:
+        plot_specs = cache.plot_specs
+    if checkpoint is not None:
+        uids = [uid for uid in uids if uid not in checkpoint]
+    uids = list(uids)
+    if progress is None:
+        progress = Progress(len(uids))
+    failed = {}
+    if not uids:
+        return failed
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_initialize_worker,
+        initargs=(open_catalog, None if cache is None else cache.root, plot_specs),
+    ) as executor:
+        futures = {executor.submit(_render_run, uid, root): uid for uid in uids}
+        for future in concurrent.futures.as_completed(futures):
+            uid = futures[future]
+            try:
+                _, stop, filenames = future.result()
+            except Exception as error:
+                failed[uid] = error
+                progress.update(failed=True)
+                print(f"Failed to render {uid}: {error!r}", file=progress.stream)
+                continue
+            if cache is not None and stop is not None and filenames is not None:
+                cache.record(uid, stop, filenames)
+            if checkpoint is not None:
+                checkpoint.add(uid)
+            progress.update()
+    return failed
+
+
+def search(catalog, since=None, until=None, query=None):
+    "Return the uids of the runs in a catalog in a time range and/or matching a query."
+    if since is not None or until is not None:
+        from databroker.queries import TimeRange
+
+        catalog = catalog.search(TimeRange(since=since, until=until))
+    if query:
+        catalog = catalog.search(query)
+    return list(catalog)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the thumbnails of many runs from a catalog")
+    parser.add_argument("catalog", help="Databroker catalog name")
+    parser.add_argument("--since", help="Start of time range, e.g. 2021-01-01")
+    parser.add_argument("--until", help="End of time range, e.g. 2021-05-01")
+    parser.add_argument("--query", help='Query on start documents, as JSON, e.g. {"plan_name": "xafs"}')
+    parser.add_argument("--workers", type=int, help="Number of worker processes (default: number of CPUs)")
+    parser.add_argument("--root", help="Directory for thumbnails (default: ariadne in the temporary directory)")
+    parser.add_argument(
+        "--checkpoint", help="File recording the runs done, to resume from (default: in the root directory)"
+    )
+    parser.add_argument("--max-bytes", type=int, help="Bound on the size of the thumbnail directory")
+    parser.add_argument("--plot-specs", help="JSON file of the plots to make for each plan (default: built in)")
+    args = parser.parse_args(argv)
+    plot_specs = PlotSpecs.from_file(args.plot_specs) if args.plot_specs else None
+
+    root = args.root or default_thumbnail_root()
+    os.makedirs(root, exist_ok=True)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(root, f"backfill-{args.catalog}.checkpoint"))
+    cache = ThumbnailCache(root, max_bytes=args.max_bytes, plot_specs=plot_specs)
+    open_catalog = functools.partial(open_named_catalog, args.catalog)
+    query = json.loads(args.query) if args.query else None
+
+    uids = search(open_catalog(), since=args.since, until=args.until, query=query)
+    todo = [uid for uid in uids if uid not in checkpoint]
+    print(f"{len(uids)} runs found, {len(uids) - len(todo)} already done", file=sys.stderr)
+    progress = Progress(len(todo))
+    failed = backfill(
+        open_catalog,
+        todo,
+        root=root,
+        max_workers=args.workers,
+        checkpoint=checkpoint,
+        cache=cache,
+        progress=progress,
+    )
+    progress.report()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
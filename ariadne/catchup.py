@@ -0,0 +1,284 @@
+"""
+Catch up on the run in progress when starting to consume a Kafka topic.
+
+A consumer that starts at the head of a topic in the middle of a scan never
+sees the run's start and descriptor documents, so nothing of that run can be
+shown. Instead, every consumer records where the start documents it sees are
+(topic, partition and offset) in a small local index, and marks the runs whose
+stop documents it sees. On startup, a CatchUpSource looks up the newest run
+not yet stopped, seeks to its start document and replays from there up to the
+head of the topic before going on with the live documents.
+
+The index is shared by the processes on a host that consume the same topics,
+e.g. the Kafka previews service, which runs all the time, and the GUI, so the
+GUI can catch up on runs that started before it did.
+"""
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows; there, processes sharing the index may drop each other's records.
+    fcntl = None
+
+from bluesky.run_engine import Dispatcher, DocumentNames
+
+logger = logging.getLogger(__name__)
+
+
+def default_index_path():
+    "Path of the run-start index shared by the consumers on this host"
+    return os.path.join(tempfile.gettempdir(), "ariadne", "run-starts.json")
+
+
+class RunStartIndex:
+    """
+    The positions of the start documents of recent runs in Kafka topics.
+
+    Parameters
+    ----------
+    path : String
+    max_runs : Integer, optional
+        Number of runs remembered, the newest. Default is 100.
+
+    Examples
+    --------
+
+    >>> index = RunStartIndex(default_index_path())
+    >>> index.observe("start", start_doc, "bmm.bluesky.runengine.documents", 0, 1234)
+    >>> index.newest_open()
+    ('bmm.bluesky.runengine.documents', 0, 1234)
+    """
+
+    def __init__(self, path, max_runs=100):
+        self.path = path
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._runs = self._load()
+
+    def __len__(self):
+        return len(self._runs)
+
+    def __contains__(self, uid):
+        return uid in self._runs
+
+    def observe(self, name, doc, topic, partition, offset):
+        "Record the position of a start document, or that a run stopped."
+        if name == "start":
+            entry = {"topic": topic, "partition": partition, "offset": offset, "stopped": False}
+            entry["time"] = doc.get("time", time.time())
+            with self._lock:
+                self._runs[doc["uid"]] = entry
+                self._save()
+        elif name == "stop":
+            with self._lock:
+                if doc["run_start"] in self._runs:
+                    self._runs[doc["run_start"]]["stopped"] = True
+                    self._save()
+
+    def newest_open(self, topics=None):
+        """
+        Return (topic, partition, offset) of the start of the newest run not stopped, or None.
+
+        Parameters
+        ----------
+        topics : Collection[String], optional
+            Consider only runs in these topics.
+        """
+        with self._lock:
+            runs = sorted(self._runs.values(), key=lambda entry: entry["time"])
+        for entry in reversed(runs):
+            if topics is not None and entry["topic"] not in topics:
+                continue
+            if entry["stopped"]:
+                # Older runs not stopped were abandoned, e.g. by a crash.
+                return None
+            return entry["topic"], entry["partition"], entry["offset"]
+        return None
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        "Merge with what other processes saved and write via a temporary file. Call with the lock held."
+        directory = os.path.dirname(self.path) or None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._file_lock():
+            for uid, entry in self._load().items():
+                mine = self._runs.setdefault(uid, entry)
+                mine["stopped"] = mine["stopped"] or entry["stopped"]
+            for uid in sorted(self._runs, key=lambda uid: self._runs[uid]["time"])[: -self.max_runs]:
+                del self._runs[uid]
+            descriptor, temporary = tempfile.mkstemp(prefix=".run-starts.", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(descriptor, "w") as file:
+                    json.dump(self._runs, file)
+                os.replace(temporary, self.path)
+            except BaseException:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(temporary)
+                raise
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        "Hold the index against other processes, from reading it to replacing it."
+        if fcntl is None:
+            yield
+            return
+        # A file of its own, as the index is replaced on each save.
+        with open(f"{self.path}.lock", "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+
+class CatchUpSource(Dispatcher):
+    """
+    Dispatch documents from Kafka, starting with the newest run still in progress.
+
+    On :meth:`start`, the partitions of the topics are assigned at their
+    heads, except the one holding the start document of the newest run in
+    progress (per the index), which is assigned at that document. Documents
+    are replayed from there, and ``on_caught_up`` is called once the heads
+    as of startup are reached, e.g. to resume rendering suspended during the
+    replay, or after ``catch_up_timeout`` if they are not.
+
+    Parameters
+    ----------
+    consumer : confluent_kafka.Consumer
+        Not subscribed to any topic. Partitions are assigned explicitly.
+    topics : List[String]
+    index : RunStartIndex
+        Consulted on start, and kept up to date with the documents consumed
+    deserializer : Callable, optional
+        From a message's value to (name, doc). Default is msgpack.loads.
+    on_caught_up : Callable, optional
+        Called with no arguments, from the consuming thread
+    poll_timeout : Number, optional
+        Seconds. Default is 0.05.
+    catch_up_timeout : Number, optional
+        Seconds to wait for the replay to reach the heads as of startup,
+        e.g. if messages were deleted meanwhile. Default is 30.
+
+    Examples
+    --------
+
+    >>> source = CatchUpSource(kafka_consumer(servers, "ariadne"), topics, RunStartIndex(default_index_path()))
+    >>> source.subscribe(stream_documents_into_runs(model.add_run))
+    >>> source.start()  # blocks
+    """
+
+    def __init__(
+        self,
+        consumer,
+        topics,
+        index,
+        deserializer=None,
+        on_caught_up=None,
+        poll_timeout=0.05,
+        catch_up_timeout=30.0,
+    ):
+        super().__init__()
+        if deserializer is None:
+            import msgpack
+
+            deserializer = msgpack.loads
+        self.consumer = consumer
+        self.topics = list(topics)
+        self.index = index
+        self.deserializer = deserializer
+        self.on_caught_up = on_caught_up
+        self.poll_timeout = poll_timeout
+        self.catch_up_timeout = catch_up_timeout
+        self.caught_up = False
+        self.replayed = 0
+        self.closed = False
+
+    def start(self):
+        remaining = self._assign()
+        if not remaining:
+            self._set_caught_up()
+        deadline = time.monotonic() + self.catch_up_timeout
+        try:
+            while not self.closed:
+                message = self.consumer.poll(self.poll_timeout)
+                if message is None:
+                    # The first fetch after assigning may take a while, so an
+                    # empty poll does not mean that the replay is over.
+                    if not self.caught_up and time.monotonic() >= deadline:
+                        logger.warning(
+                            "Gave up catching up on %s after %s s", sorted(remaining), self.catch_up_timeout
+                        )
+                        remaining.clear()
+                        self._set_caught_up()
+                    continue
+                if message.error():
+                    logger.error("Kafka error: %s", message.error())
+                    continue
+                topic, partition, offset = message.topic(), message.partition(), message.offset()
+                name, doc = self.deserializer(message.value())
+                self.index.observe(name, doc, topic, partition, offset)
+                self.process(DocumentNames[name], doc)
+                if not self.caught_up:
+                    self.replayed += 1
+                    head = remaining.get((topic, partition))
+                    if head is not None and offset >= head - 1:
+                        del remaining[(topic, partition)]
+                        if not remaining:
+                            self._set_caught_up()
+        finally:
+            self.consumer.close()
+
+    def stop(self):
+        "Stop consuming, after the message being processed."
+        self.closed = True
+
+    def _assign(self):
+        """
+        Assign the partitions of the topics at their heads or at the start of the run in progress.
+
+        Returns
+        -------
+        remaining : Dict[Tuple[String, Integer], Integer]
+            Map (topic, partition) to its head as of now, for the partitions to replay
+        """
+        from confluent_kafka import TopicPartition
+
+        resume = self.index.newest_open(self.topics)
+        assignments = []
+        remaining = {}
+        for topic in self.topics:
+            for partition in sorted(self.consumer.list_topics(topic).topics[topic].partitions):
+                low, head = self.consumer.get_watermark_offsets(TopicPartition(topic, partition))
+                offset = head
+                if resume is not None and resume[:2] == (topic, partition) and low <= resume[2] < head:
+                    offset = resume[2]
+                    remaining[(topic, partition)] = head
+                    logger.info("Catching up on %s[%d] from offset %d to %d", topic, partition, offset, head)
+                assignments.append(TopicPartition(topic, partition, offset))
+        self.consumer.assign(assignments)
+        return remaining
+
+    def _set_caught_up(self):
+        self.caught_up = True
+        if self.on_caught_up is not None:
+            self.on_caught_up()
+
+
+def kafka_consumer(bootstrap_servers, group_id, consumer_config=None):
+    "Make a confluent_kafka.Consumer for a CatchUpSource."
+    from confluent_kafka import Consumer
+
+    config = {"bootstrap.servers": bootstrap_servers, "group.id": group_id, "enable.auto.commit": False}
+    config.update(consumer_config or {})
+    return Consumer(config)
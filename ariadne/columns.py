@@ -0,0 +1,370 @@
+"""
+Array-backed columns of one stream of a BlueskyRun.
+
+Live runs are filled incrementally from their event pages, so reading the
+columns after each event does not rebuild the whole stream. Runs at rest (from
+databroker) are read once, one field at a time, when a field is first needed.
+
+Besides the recorded fields, the columns include the fused fluorescence
+channel of each element whose detector channels are all present (see
+:mod:`ariadne.fluorescence`).
+"""
+import threading
+
+import numpy
+
+from bluesky_widgets.models.utils import lock_if_live, run_is_live, run_is_live_and_not_completed
+
+from .fluorescence import DWELL_TIME, deadtimes_from_configuration, find_channel_groups, fuse_channels
+
+# Descriptor dtypes that are stored as float columns.
+_NUMERIC_DTYPES = {"number", "integer", "boolean"}
+
+
+class RunColumns:
+    """
+    The scalar, numeric columns of one stream of one run.
+
+    Parameters
+    ----------
+    run : BlueskyRun
+    stream_name : String, optional
+        Default is ``"primary"``.
+    capacity : Integer, optional
+        Initial number of rows to allocate for live runs. It doubles as needed.
+
+    Attributes
+    ----------
+    fields : FrozenSet[String]
+        Names of the available columns, including ``"time"``, which is given
+        in seconds since the start of the run, and fused fluorescence
+        channels such as ``"Fe_fluorescence"``.
+    """
+
+    def __init__(self, run, stream_name="primary", *, capacity=512):
+        self.run = run
+        self.stream_name = stream_name
+        self._capacity = max(int(capacity), 1)
+        self._start_time = run.metadata["start"]["time"]
+        self._descriptors = set()
+        self._buffers = {}
+        # Map fused column name to (channel names, deadtimes).
+        self._fused = {}
+        self._length = 0
+        self._live = run_is_live(run)
+        self._dataset = None
+        self.fields = frozenset()
+        if self._live:
+            with lock_if_live(run):
+                for name, doc in run.documents(fill="no"):
+                    self._process(name, doc)
+                if run_is_live_and_not_completed(run):
+                    run.events.new_doc.connect(self._on_new_doc)
+                    run.events.completed.connect(self._on_completed)
+        elif stream_name in run:
+            stream = run[stream_name]
+            self._dataset = stream.to_dask()
+            fields = {
+                name
+                for name, array in self._dataset.data_vars.items()
+                if array.ndim == 1 and array.dtype.kind in "fiub"
+            }
+            fields.add("time")
+            descriptors = stream.metadata.get("descriptors") or [{}]
+            self._add_fused(fields, descriptors[0])
+            self.fields = frozenset(fields)
+            self._length = len(self._dataset["time"])
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def __getitem__(self, field):
+        "Return the column as an array of length len(self). This is a view, not a copy."
+        if field not in self.fields:
+            raise KeyError(field)
+        if self._live:
+            return self._buffers[field][: self._length]
+        try:
+            column = self._buffers[field]
+        except KeyError:
+            # First access to a field of a run at rest: materialize it once.
+            if field in self._fused:
+                column = self._fuse(field, slice(None))
+            else:
+                column = numpy.asarray(self._dataset[field], dtype=float)
+            if field == "time":
+                column = column - self._start_time
+            self._buffers[field] = column
+        return column
+
+    @property
+    def nbytes(self):
+        "Bytes held by the columns"
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def close(self):
+        "Stop listening to a live run."
+        if self._live:
+            self.run.events.new_doc.disconnect(self._on_new_doc)
+            self.run.events.completed.disconnect(self._on_completed)
+
+    def _on_new_doc(self, event):
+        self._process(event.name, event.doc)
+
+    def _on_completed(self, event):
+        self.close()
+
+    def _process(self, name, doc):
+        if name == "descriptor" and doc.get("name") == self.stream_name:
+            self._descriptors.add(doc["uid"])
+            fields = {
+                key
+                for key, data_key in doc["data_keys"].items()
+                if data_key.get("dtype") in _NUMERIC_DTYPES and not data_key.get("shape")
+            }
+            fields.add("time")
+            self._add_fused(fields, doc)
+            for field in fields - set(self._buffers):
+                self._buffers[field] = numpy.full(self._capacity, numpy.nan)
+            self.fields = self.fields | fields
+        elif name == "event_page" and doc["descriptor"] in self._descriptors:
+            self._append(doc)
+        elif name == "event" and doc["descriptor"] in self._descriptors:
+            self._append(
+                {
+                    "time": [doc["time"]],
+                    "data": {key: [value] for key, value in doc["data"].items()},
+                }
+            )
+
+    def _append(self, page):
+        start = self._length
+        stop = start + len(page["time"])
+        self._reserve(stop)
+        data = page["data"]
+        for field, buffer in self._buffers.items():
+            if field == "time":
+                buffer[start:stop] = numpy.asarray(page["time"], dtype=float) - self._start_time
+            elif field in data:
+                buffer[start:stop] = data[field]
+        for field in self._fused:
+            self._buffers[field][start:stop] = self._fuse(field, slice(start, stop))
+        self._length = stop
+
+    def _add_fused(self, fields, descriptor):
+        "Add the fused fluorescence columns that can be made from fields."
+        for field, channels in find_channel_groups(fields).items():
+            if field not in self._fused:
+                self._fused[field] = (channels, deadtimes_from_configuration(descriptor, channels))
+            fields.add(field)
+
+    def _fuse(self, field, rows):
+        "Compute a fused fluorescence column over a slice of rows."
+        channels, deadtimes = self._fused[field]
+        column = self._buffers.__getitem__ if self._live else self.__getitem__
+        counts = numpy.stack([column(channel)[rows] for channel in channels])
+        dwell_time = column(DWELL_TIME)[rows] if DWELL_TIME in self.fields else None
+        return fuse_channels(counts, deadtimes, dwell_time)
+
+    def _reserve(self, length):
+        if length <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < length:
+            capacity *= 2
+        for field, buffer in self._buffers.items():
+            new = numpy.full(capacity, numpy.nan)
+            new[: self._length] = buffer[: self._length]
+            self._buffers[field] = new
+        self._capacity = capacity
+
+
+class CompactColumns:
+    """
+    Fixed float32 columns, standing in for RunColumns of a demoted run.
+
+    Parameters
+    ----------
+    columns : Dict[String, Array]
+        Columns of equal length
+    """
+
+    def __init__(self, columns):
+        self._columns = {field: numpy.asarray(column, dtype=numpy.float32) for field, column in columns.items()}
+        self.fields = frozenset(self._columns)
+        self._length = min((len(column) for column in self._columns.values()), default=0)
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def __getitem__(self, field):
+        return self._columns[field][: self._length]
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values())
+
+    def close(self):
+        pass
+
+
+class CompactRun:
+    """
+    A completed run reduced to its metadata and the columns that are plotted.
+
+    It stands in for the full run in plot builders, which get its columns
+    from a ColumnStore as usual, so that the full run (every document, every
+    stream) can be dropped.
+
+    Parameters
+    ----------
+    metadata : Dict
+        With ``"start"`` and ``"stop"``, as in ``BlueskyRun.metadata``
+    streams : Dict[String, CompactColumns]
+    """
+
+    def __init__(self, metadata, streams):
+        self.metadata = {"start": metadata["start"], "stop": metadata["stop"]}
+        self._streams = dict(streams)
+
+    def __iter__(self):
+        yield from self._streams
+
+    def __contains__(self, stream_name):
+        return stream_name in self._streams
+
+    def __repr__(self):
+        return f"<CompactRun uid={self.metadata['start']['uid']!r}>"
+
+    def columns(self, stream_name):
+        return self._streams[stream_name]
+
+    @property
+    def nbytes(self):
+        return sum(columns.nbytes for columns in self._streams.values())
+
+    @classmethod
+    def from_columns(cls, run, columns, fields):
+        "Keep only the given fields of RunColumns, as float32."
+        stream = CompactColumns({field: columns[field] for field in fields if field in columns})
+        return cls(run.metadata, {columns.stream_name: stream})
+
+
+class ColumnStore:
+    """
+    Share one RunColumns per run among several consumers, with reference counting.
+
+    Every plot builder that shows a run acquires its columns here, so each
+    column is decoded and stored once no matter how many curves use it. The
+    columns are dropped when the last builder releases the run. The store may
+    be used from several threads at once, e.g. by plot builders computing on
+    a worker pool.
+
+    Examples
+    --------
+
+    >>> store = ColumnStore()
+    >>> columns = store.acquire(run)
+    >>> store.acquire(run) is columns
+    True
+    >>> store.release(run)
+    >>> store.release(run)  # Last reference: the columns are dropped.
+    """
+
+    def __init__(self):
+        # Map (run uid, stream name) to [RunColumns, reference count].
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, run):
+        uid = run.metadata["start"]["uid"]
+        with self._lock:
+            return any(key[0] == uid for key in self._entries)
+
+    def acquire(self, run, stream_name="primary"):
+        """
+        Return the shared RunColumns for this run, creating it if needed.
+
+        Each call must be balanced by a call to :meth:`release`.
+        """
+        key = (run.metadata["start"]["uid"], stream_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] += 1
+                return entry[0]
+        # Opening the stream may take a while, so it is not done holding the
+        # lock; if another thread got there first, its columns are used.
+        if isinstance(run, CompactRun):
+            columns = run.columns(stream_name)
+        else:
+            columns = RunColumns(run, stream_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [columns, 0]
+                columns = None
+            entry[1] += 1
+        if columns is not None:
+            columns.close()
+        return entry[0]
+
+    def put(self, run, columns, stream_name="primary"):
+        """
+        Hold columns made elsewhere, e.g. read ahead in another thread, and acquire them.
+
+        If the store already has columns for this run, those are acquired
+        instead, and returned. Each call must be balanced by a call to
+        :meth:`release`; hold the reference until the consumers of the run
+        have acquired the columns.
+        """
+        key = (run.metadata["start"]["uid"], stream_name)
+        with self._lock:
+            entry = self._entries.setdefault(key, [columns, 0])
+            entry[1] += 1
+            return entry[0]
+
+    def acquire_held(self, run, stream_name="primary"):
+        "Acquire the columns of this run if the store already has them, else return None."
+        key = (run.metadata["start"]["uid"], stream_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, run, stream_name="primary"):
+        "Drop one reference to the columns of this run. This is a no-op if none are held."
+        key = (run.metadata["start"]["uid"], stream_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._entries[key]
+        entry[0].close()
+
+    def nbytes(self, run):
+        "Bytes held by the columns of all streams of this run"
+        uid = run.metadata["start"]["uid"]
+        with self._lock:
+            entries = [entry for key, entry in self._entries.items() if key[0] == uid]
+        return sum(entry[0].nbytes for entry in entries)
+
+    def refcount(self, run, stream_name="primary"):
+        "Number of consumers currently holding the columns of this run."
+        with self._lock:
+            entry = self._entries.get((run.metadata["start"]["uid"], stream_name))
+        return 0 if entry is None else entry[1]
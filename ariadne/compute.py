@@ -0,0 +1,71 @@
+"""
+Compute plot data off the GUI thread.
+
+Lines given an executor evaluate their data on its worker threads and keep the
+finished arrays. The plot models are then updated, and ``new_data`` emitted,
+through ``call_soon`` in the GUI thread, which only picks up the finished
+arrays.
+"""
+import concurrent.futures
+import logging
+
+import numpy
+
+logger = logging.getLogger(__name__)
+
+
+def plot_executor(max_workers=None):
+    "A thread pool for computing plot data."
+    return concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ariadne-plot")
+
+
+def submit(executor, func, *args, **kwargs):
+    "Submit func to executor, logging any exception it raises, since no one waits on the result."
+    future = executor.submit(func, *args, **kwargs)
+    future.add_done_callback(_log_exception)
+    return future
+
+
+def _log_exception(future):
+    if future.cancelled():
+        return
+    exception = future.exception()
+    if exception is not None:
+        logger.error("Error computing plot data", exc_info=exception)
+
+
+def downsample(x, y, max_points):
+    """
+    Reduce a line to at most about max_points points, keeping its extremes.
+
+    The points are split into max_points // 2 consecutive buckets, and the
+    minimum and maximum of y in each bucket are kept, in order. Unlike taking
+    every nth point, this does not hide spikes or glitches.
+
+    Parameters
+    ----------
+    x, y : Array
+    max_points : Integer | None
+        None means no limit.
+
+    Returns
+    -------
+    x, y : Array
+    """
+    x = numpy.asarray(x)
+    y = numpy.asarray(y)
+    length = min(len(x), len(y))
+    if max_points is None or length <= max_points:
+        return x, y
+    buckets = max(int(max_points) // 2, 1)
+    size = -(-length // buckets)
+    padded = numpy.full(buckets * size, numpy.nan)
+    padded[:length] = y[:length]
+    padded = padded.reshape(buckets, size)
+    missing = numpy.isnan(padded)
+    low = numpy.argmin(numpy.where(missing, numpy.inf, padded), axis=1)
+    high = numpy.argmax(numpy.where(missing, -numpy.inf, padded), axis=1)
+    offsets = numpy.arange(buckets) * size
+    index = numpy.unique(numpy.concatenate([offsets + low, offsets + high]))
+    index = index[index < length]
+    return x[index], y[index]
@@ -0,0 +1,179 @@
+"""
+Compiled, incremental evaluation of the x and y expressions used in plots.
+
+An expression such as ``"log(I0/It)"`` is parsed once into a code object. When
+it only combines columns element by element (arithmetic and numpy ufuncs), a
+DerivedSignal evaluates it over newly appended rows only and keeps the result
+in a preallocated buffer, so the work done per event does not grow with the
+length of the scan.
+"""
+import ast
+import functools
+
+import numpy
+
+# Same words that bluesky-widgets makes available to expressions: the numpy
+# functions, spelled as (for example) log, np.log, or numpy.log.
+_namespace = {"numpy": numpy, "np": numpy}
+_namespace.update({name: getattr(numpy, name) for name in numpy.__all__})
+_namespace["__builtins__"] = {}
+
+_ELEMENTWISE_NODES = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Constant,
+    ast.Name,
+    ast.Load,
+    ast.operator,
+    ast.unaryop,
+)
+
+
+class CompiledExpression:
+    """
+    A Python expression over named columns, parsed and compiled once.
+
+    Parameters
+    ----------
+    expression : String
+        e.g. ``"I0"``, ``"It/I0"`` or ``"log(I0/It)"``
+
+    Attributes
+    ----------
+    expression : String
+    fields : FrozenSet[String]
+        Names in the expression that must be supplied as columns.
+    column : String | None
+        If the expression is a bare column name, that name.
+    elementwise : Boolean
+        True if row i of the result depends only on row i of the columns, so
+        that the expression may be evaluated over a slice of rows.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        tree = ast.parse(expression.strip(), mode="eval")
+        names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+        self.fields = frozenset(name for name in names if name not in _namespace)
+        self.column = tree.body.id if isinstance(tree.body, ast.Name) and self.fields else None
+        self.elementwise = all(_is_elementwise(node) for node in ast.walk(tree))
+        self._code = compile(tree, f"<{expression}>", "eval")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.expression!r})"
+
+    def __call__(self, columns):
+        """
+        Evaluate over a mapping of column names to arrays.
+        """
+        return eval(self._code, _namespace, {name: columns[name] for name in self.fields})
+
+
+def _is_elementwise(node):
+    if isinstance(node, ast.Call):
+        func = node.func
+        return (
+            isinstance(func, ast.Name)
+            and isinstance(_namespace.get(func.id), numpy.ufunc)
+            and not node.keywords
+        )
+    return isinstance(node, _ELEMENTWISE_NODES)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(expression):
+    """
+    Return the (cached) CompiledExpression for a string expression.
+
+    Raises
+    ------
+    SyntaxError
+        If the expression is not valid Python.
+    """
+    return CompiledExpression(expression)
+
+
+class DerivedSignal:
+    """
+    The values of one expression over the growing columns of one run.
+
+    Parameters
+    ----------
+    expression : String | CompiledExpression
+    capacity : Integer, optional
+        Initial size of the output buffer. It doubles as needed.
+
+    Examples
+    --------
+
+    >>> signal = DerivedSignal("log(I0/It)")
+    >>> signal.update({"I0": I0, "It": It}, len(I0))
+    """
+
+    def __init__(self, expression, capacity=512):
+        if isinstance(expression, str):
+            expression = compile_expression(expression)
+        self.expression = expression
+        self._buffer = numpy.empty(max(int(capacity), 1))
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def values(self):
+        "Values computed so far"
+        return self._buffer[: self._length]
+
+    def update(self, columns, length):
+        """
+        Evaluate any rows in ``[len(self), length)`` and return all the values.
+
+        Parameters
+        ----------
+        columns : Mapping[String, Array]
+            Columns with at least ``length`` rows.
+        length : Integer
+            Number of valid rows in the columns.
+
+        Returns
+        -------
+        values : Array
+            Length ``length``. This is a view, not a copy.
+        """
+        expression = self.expression
+        if expression.column is not None:
+            # Nothing to compute; hand back the column itself.
+            self._buffer = columns[expression.column][:length]
+            self._length = length
+            return self._buffer
+        if not expression.elementwise:
+            # Rows are not independent (e.g. "cumsum(I0)"), so evaluate all of them.
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                values = expression({name: columns[name][:length] for name in expression.fields})
+            self._buffer = numpy.asarray(values)
+            self._length = len(self._buffer)
+            return self._buffer
+        if length < self._length:
+            # The columns were replaced by shorter ones; start over.
+            self._length = 0
+        if length > self._length:
+            start = self._length
+            chunk = {name: columns[name][start:length] for name in expression.fields}
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                values = expression(chunk)
+            self._reserve(length)
+            self._buffer[start:length] = values
+            self._length = length
+        return self._buffer[: self._length]
+
+    def _reserve(self, length):
+        capacity = len(self._buffer)
+        if length <= capacity:
+            return
+        while capacity < length:
+            capacity *= 2
+        buffer = numpy.empty(capacity)
+        buffer[: self._length] = self._buffer[: self._length]
+        self._buffer = buffer
@@ -0,0 +1,97 @@
+"""
+The fused fluorescence channel of the four-element silicon drift detector.
+
+BMM records one column per detector channel, named after the element of
+interest: ``Fe1``, ``Fe2``, ``Fe3``, ``Fe4``. These are combined into one
+column, ``Fe_fluorescence``, summed in one vectorized pass after correcting
+each channel for deadtime. Every fluorescence curve reads that one column.
+
+Deadtime correction uses the non-paralyzable model,
+``N = n / (1 - n * tau / t)``, where ``n`` is the measured count in a dwell
+time ``t`` and ``tau`` is the channel's deadtime in seconds. The deadtime of
+channel ``Fe1`` is read from the descriptor configuration under a key ending
+in ``Fe1_deadtime``. Channels without one are not corrected.
+"""
+import re
+
+import numpy
+
+CHANNELS = 4
+# Column giving the dwell time, in seconds, of each point.
+DWELL_TIME = "dwti_dwell_time"
+
+_channel = re.compile(r"^([A-Z][a-z]?)([1-9])$")
+
+
+def fluorescence_column(element):
+    "Name of the fused fluorescence column of an element, e.g. 'Fe_fluorescence'"
+    return f"{element}_fluorescence"
+
+
+def find_channel_groups(fields):
+    """
+    Find the elements for which all detector channels are present.
+
+    Parameters
+    ----------
+    fields : Iterable[String]
+
+    Returns
+    -------
+    groups : Dict[String, Tuple[String]]
+        Map fused column name to the names of its channels, in order.
+    """
+    fields = set(fields)
+    elements = {match.group(1) for match in map(_channel.match, fields) if match}
+    groups = {}
+    for element in sorted(elements):
+        channels = tuple(f"{element}{i}" for i in range(1, CHANNELS + 1))
+        if fields.issuperset(channels):
+            groups[fluorescence_column(element)] = channels
+    return groups
+
+
+def deadtimes_from_configuration(descriptor, channels):
+    """
+    Read the deadtime (seconds) of each channel from a descriptor's configuration.
+
+    Returns
+    -------
+    deadtimes : Array
+        One per channel; zero where none is given.
+    """
+    deadtimes = numpy.zeros(len(channels))
+    for config in descriptor.get("configuration", {}).values():
+        for key, value in config.get("data", {}).items():
+            for i, channel in enumerate(channels):
+                if key.endswith(f"{channel}_deadtime"):
+                    deadtimes[i] = value
+    return deadtimes
+
+
+def fuse_channels(counts, deadtimes=None, dwell_time=None):
+    """
+    Correct each channel for deadtime and sum them.
+
+    Parameters
+    ----------
+    counts : Array
+        Shape (channels, rows)
+    deadtimes : Array, optional
+        Shape (channels,), in seconds. If None or all zero, no correction is
+        applied.
+    dwell_time : Array, optional
+        Shape (rows,), in seconds. Needed for the correction.
+
+    Returns
+    -------
+    fused : Array
+        Shape (rows,). Rows where a channel is saturated (the correction
+        diverges) are NaN.
+    """
+    counts = numpy.asarray(counts, dtype=float)
+    if deadtimes is not None and dwell_time is not None and numpy.any(deadtimes):
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            live_fraction = 1 - counts * numpy.asarray(deadtimes)[:, None] / numpy.asarray(dwell_time)
+            counts = numpy.where(live_fraction > 0, counts / live_fraction, numpy.nan)
+    return counts.sum(axis=0)
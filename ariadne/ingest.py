@@ -0,0 +1,428 @@
+"""
+Stages between a document source (0MQ, Kafka, a catalog) and the runs built
+from its documents by ``stream_documents_into_runs``.
+
+Each stage is a callable ``stage(name, doc)`` that passes documents on to
+another such callable, so stages can be chained in front of a dispatcher's
+subscriber. The IngestService receives the documents of all the sources and
+delivers them, in batches, to the thread that builds the runs.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+
+from .plot_specs import PLOT_SPECS
+
+logger = logging.getLogger(__name__)
+
+
+def _call_later_in_thread(delay, func):
+    timer = threading.Timer(delay, func)
+    timer.daemon = True
+    timer.start()
+
+
+def merge_event_pages(pages):
+    """
+    Merge event pages of one descriptor into one.
+
+    Unlike ``event_model.merge_event_pages``, this accepts pages without the
+    timestamps of some data keys, e.g. as passed on by FieldProjection; only
+    the timestamps that every page has are kept.
+    """
+    if len(pages) == 1:
+        return pages[0]
+
+    def chain(values):
+        return list(itertools.chain.from_iterable(values))
+
+    first = pages[0]
+    timestamp_keys = set(first["timestamps"]).intersection(*(page["timestamps"] for page in pages[1:]))
+    filled_keys = set(first.get("filled", {})).intersection(*(page.get("filled", {}) for page in pages[1:]))
+    return {
+        "descriptor": first["descriptor"],
+        "seq_num": chain(page["seq_num"] for page in pages),
+        "time": chain(page["time"] for page in pages),
+        "uid": chain(page["uid"] for page in pages),
+        "data": {key: chain(page["data"][key] for page in pages) for key in first["data"]},
+        "timestamps": {key: chain(page["timestamps"][key] for page in pages) for key in timestamp_keys},
+        "filled": {key: chain(page["filled"][key] for page in pages) for key in filled_keys},
+    }
+
+
+class EventPageCoalescer:
+    """
+    Merge consecutive event pages of one descriptor into multi-row pages.
+
+    BMM emits one event page per point. Building runs and updating plots has
+    a cost per page, so for fast scans it pays to pass several rows at once.
+    Pages are buffered while they come from the same descriptor, and the
+    buffer is passed on as one page when it reaches ``max_rows`` rows, when
+    ``max_latency`` seconds have passed since its first page, or just before
+    any other document.
+
+    Parameters
+    ----------
+    callback : Callable
+        Expected signature ``f(name, doc)``
+    max_rows : Integer, optional
+        Default is 50.
+    max_latency : Number, optional
+        Seconds. Default is 0.2. None means no time limit: pages are held until
+        the buffer is full or another document arrives.
+    call_later : Callable, optional
+        Expected signature ``f(delay: float, func: Callable)``. Schedules the
+        flush at ``max_latency``. The default uses a daemon thread.
+
+    Attributes
+    ----------
+    pages_in, pages_out : Integer
+        Numbers of event pages received and passed on
+
+    Examples
+    --------
+
+    >>> dispatcher.subscribe(EventPageCoalescer(stream_documents_into_runs(add_run)))
+    """
+
+    def __init__(self, callback, max_rows=50, max_latency=0.2, call_later=None):
+        self.callback = callback
+        self.max_rows = max_rows
+        self.max_latency = max_latency
+        self._call_later = call_later or _call_later_in_thread
+        # Held while passing documents on, so that a flush from the timer does
+        # not interleave with documents passed on by the caller.
+        self._lock = threading.RLock()
+        self._pages = []
+        self._rows = 0
+        # Incremented on each flush, so a timer set for an earlier buffer does nothing.
+        self._generation = 0
+        self._first_time = None
+        self.pages_in = 0
+        self.pages_out = 0
+
+    def __call__(self, name, doc):
+        with self._lock:
+            if name == "event_page":
+                self.pages_in += 1
+                if self._pages and self._pages[0]["descriptor"] != doc["descriptor"]:
+                    self._flush()
+                self._pages.append(doc)
+                self._rows += len(doc["seq_num"])
+                if len(self._pages) == 1:
+                    self._first_time = time.monotonic()
+                    if self.max_latency is not None:
+                        generation = self._generation
+                        self._call_later(self.max_latency, lambda: self._flush_if(generation))
+                if self._rows >= self.max_rows or self._expired():
+                    self._flush()
+            else:
+                self._flush()
+                self.callback(name, doc)
+
+    def flush(self):
+        "Pass on any buffered pages now."
+        with self._lock:
+            self._flush()
+
+    def _expired(self):
+        return self.max_latency is not None and time.monotonic() - self._first_time >= self.max_latency
+
+    def _flush_if(self, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._flush()
+
+    def _flush(self):
+        if not self._pages:
+            return
+        pages = self._pages
+        self._pages = []
+        self._rows = 0
+        self._generation += 1
+        page = merge_event_pages(pages)
+        self.pages_out += 1
+        self.callback("event_page", page)
+
+
+class FieldProjection:
+    """
+    Pass on only the streams and data keys that the plots of each run read.
+
+    BMM records a baseline stream of some forty motors and temperatures, and
+    each event carries a timestamp per field, none of which the plots show.
+    Dropping them before runs are built saves the memory and the work of
+    building them. The descriptors of the streams kept list only the data keys
+    kept; their configuration, which holds e.g. the detector deadtimes, is
+    kept whole.
+
+    Parameters
+    ----------
+    callback : Callable
+        Expected signature ``f(name, doc)``
+    plot_specs : PlotSpecs, optional
+        Gives the fields to keep, by plan. Default is ``PLOT_SPECS``. Runs of
+        plans with no plots keep all the fields of the streams kept.
+    streams : Collection[String], optional
+        Names of the streams to keep. Default is ``("primary",)``.
+    timestamps : Boolean, optional
+        Keep the timestamps of the data kept. Default is False.
+
+    Examples
+    --------
+
+    >>> dispatcher.subscribe(FieldProjection(stream_documents_into_runs(add_run)))
+    """
+
+    def __init__(self, callback, plot_specs=None, streams=("primary",), timestamps=False):
+        self.callback = callback
+        self.plot_specs = PLOT_SPECS if plot_specs is None else plot_specs
+        self.streams = frozenset(streams)
+        self.timestamps = timestamps
+        # Map run uid to the fields to keep, or None for all of them.
+        self._fields = {}
+        # Map descriptor uid to the data keys to keep, or None for all of them.
+        # Descriptors of streams not kept are absent.
+        self._descriptors = {}
+        # Map run uid to the uids of its descriptors, to forget them on stop.
+        self._run_descriptors = {}
+
+    def __call__(self, name, doc):
+        if name == "start":
+            element = doc.get("XDI", {}).get("Element", {}).get("symbol")
+            self._fields[doc["uid"]] = self.plot_specs.required_fields(doc.get("plan_name"), element)
+            self._run_descriptors[doc["uid"]] = []
+        elif name == "descriptor":
+            doc = self._descriptor(doc)
+            if doc is None:
+                return
+        elif name in ("event", "event_page"):
+            if doc["descriptor"] not in self._descriptors:
+                return
+            doc = self._project(doc, self._descriptors[doc["descriptor"]])
+        elif name == "stop":
+            self._fields.pop(doc["run_start"], None)
+            for uid in self._run_descriptors.pop(doc["run_start"], ()):
+                self._descriptors.pop(uid, None)
+        self.callback(name, doc)
+
+    def _descriptor(self, doc):
+        "Record a descriptor and return it projected, or None if its stream is dropped."
+        if doc.get("name") not in self.streams:
+            return None
+        run_uid = doc["run_start"]
+        fields = self._fields.get(run_uid)
+        self._run_descriptors.setdefault(run_uid, []).append(doc["uid"])
+        if fields is None:
+            self._descriptors[doc["uid"]] = None
+            return doc
+        keys = frozenset(fields & set(doc["data_keys"]))
+        self._descriptors[doc["uid"]] = keys
+        doc = dict(doc)
+        doc["data_keys"] = {key: value for key, value in doc["data_keys"].items() if key in keys}
+        if "object_keys" in doc:
+            doc["object_keys"] = {
+                obj: [key for key in obj_keys if key in keys] for obj, obj_keys in doc["object_keys"].items()
+            }
+        if "hints" in doc:
+            doc["hints"] = {
+                obj: {**hint, "fields": [key for key in hint.get("fields", []) if key in keys]}
+                for obj, hint in doc["hints"].items()
+            }
+        return doc
+
+    def _project(self, doc, keys):
+        "Return an event or event page with only the given data keys, and timestamps if asked for."
+        if keys is None and self.timestamps:
+            return doc
+        doc = dict(doc)
+        if keys is not None:
+            doc["data"] = {key: value for key, value in doc["data"].items() if key in keys}
+        if self.timestamps:
+            if keys is not None:
+                doc["timestamps"] = {key: value for key, value in doc["timestamps"].items() if key in keys}
+        else:
+            doc["timestamps"] = {}
+        if "filled" in doc:
+            doc["filled"] = {key: value for key, value in doc["filled"].items() if key in doc["data"]}
+        return doc
+
+
+class IngestService:
+    """
+    Receive the documents of several sources and deliver them in batches.
+
+    Each source, e.g. a 0MQ or Kafka RemoteDispatcher, runs in a thread of
+    its own and passes its documents to :meth:`put`. The documents of each
+    run go into a bounded queue, drained in order by a task on the service's
+    asyncio event loop, which hands them to ``deliver`` in batches. When a
+    run's queue is full, ``put`` blocks, so a source that outpaces the
+    consumer is held back instead of buffering without limit.
+
+    Parameters
+    ----------
+    deliver : Callable
+        Expected signature ``f(batch)``, where batch is a list of (name, doc)
+        pairs, all of one run. It is called on the event loop's thread. If it
+        returns a concurrent.futures.Future, e.g. because it hands the batch
+        to another thread, the next batch of that run waits for it.
+    max_queue : Integer, optional
+        Documents queued per run. Default is 1000.
+    max_batch : Integer, optional
+        Documents per batch. Default is 200.
+    rate_interval : Number, optional
+        Seconds over which the ingest rate is measured. Default is 1.
+
+    Examples
+    --------
+
+    >>> service = IngestService(bridge)
+    >>> service.start()
+    >>> dispatcher.subscribe(service.put)
+    >>> service.add_source(dispatcher)
+    """
+
+    def __init__(self, deliver, max_queue=1000, max_batch=200, rate_interval=1.0):
+        self.deliver = deliver
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.rate_interval = rate_interval
+        self._loop = None
+        self._thread = None
+        self._sources = []
+        # Map run uid to its queue. Documents not of a known run go under None.
+        self._queues = {}
+        self._tasks = {}
+        # Map descriptor and resource uids to the uid of their run.
+        self._run_of = {}
+        self._received = 0
+        self._delivered = 0
+        self._batches = 0
+        self._rate = 0.0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    @property
+    def stats(self):
+        """
+        Counts of documents received and delivered and of batches delivered,
+        the ingest rate in documents per second, the number of documents
+        queued and the number of runs with a queue.
+        """
+        return {
+            "received": self._received,
+            "delivered": self._delivered,
+            "batches": self._batches,
+            "rate": self._rate,
+            "queued": sum(self.queue_depths().values()),
+            "runs": len(self._queues),
+        }
+
+    def queue_depths(self):
+        "Map the uid of each run with a queue to the number of documents in it."
+        return {uid: queue.qsize() for uid, queue in list(self._queues.items())}
+
+    def start(self):
+        "Run the event loop in a thread of its own."
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ariadne-ingest", daemon=True)
+        self._thread.start()
+
+    def add_source(self, source):
+        """
+        Start a source in a thread of its own.
+
+        Parameters
+        ----------
+        source : Object
+            With a blocking ``start()`` method, e.g. a RemoteDispatcher
+            subscribed to :meth:`put`, directly or through ingestion stages.
+        """
+        thread = threading.Thread(
+            target=source.start, name=f"ariadne-ingest-source-{len(self._sources)}", daemon=True
+        )
+        self._sources.append((source, thread))
+        thread.start()
+
+    def put(self, name, doc):
+        "Queue a document, waiting for room in its run's queue. Call from any thread but the loop's."
+        asyncio.run_coroutine_threadsafe(self._put(name, doc), self._loop).result()
+
+    def close(self):
+        "Stop delivering. Documents still queued are dropped."
+        if self._thread is None:
+            return
+
+        async def cancel():
+            # Including puts waiting for room, whose sources then get CancelledError.
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(cancel(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+
+    async def _put(self, name, doc):
+        uid = self._route(name, doc)
+        try:
+            queue = self._queues[uid]
+        except KeyError:
+            queue = self._queues[uid] = asyncio.Queue(self.max_queue)
+            self._tasks[uid] = self._loop.create_task(self._drain(uid, queue))
+        self._count()
+        await queue.put((name, doc))
+
+    def _route(self, name, doc):
+        "Return the uid of the run a document belongs to, or None if unknown."
+        if name == "start":
+            return doc["uid"]
+        if name in ("descriptor", "resource"):
+            uid = doc.get("run_start")
+            self._run_of[doc["uid"]] = uid
+            return uid
+        if name == "stop":
+            return doc["run_start"]
+        if name in ("event", "event_page"):
+            return self._run_of.get(doc["descriptor"])
+        if name in ("datum", "datum_page"):
+            return self._run_of.get(doc["resource"])
+        return None
+
+    def _count(self):
+        self._received += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.rate_interval:
+            self._rate = (self._received - self._window_count) / elapsed
+            self._window_start = now
+            self._window_count = self._received
+
+    async def _drain(self, uid, queue):
+        "Deliver the documents of one run in batches, until its stop document."
+        stopped = False
+        while not stopped:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                result = self.deliver(batch)
+                if isinstance(result, concurrent.futures.Future):
+                    await asyncio.wrap_future(result)
+            except Exception:
+                logger.exception("Error delivering documents")
+            self._delivered += len(batch)
+            self._batches += 1
+            stopped = uid is not None and any(name == "stop" for name, _ in batch)
+        del self._queues[uid]
+        del self._tasks[uid]
+        for key in [key for key, run_uid in self._run_of.items() if run_uid == uid]:
+            del self._run_of[key]
@@ -1,47 +1,63 @@
 """
 Run like:
-python -m BMM-app.py
+python -m ariadne.kafka_previews
 For each Run, it will generate thumbnails and save them to a temporary
 directory. The filepaths will be printed to the stdout, one per line.
+Thumbnails are rendered in a pool of worker processes (see
+ariadne.thumbnails), so a slow render does not hold up consuming other Runs.
+The plots made for each plan are read from the JSON file named by
+ARIADNE_PLOT_SPECS, if set, instead of the built-in table.
 """
 import functools
 import msgpack
 import msgpack_numpy as mpn
 import os
-import tempfile
 
 from bluesky_widgets.qt.zmq_dispatcher import RemoteDispatcher
 from bluesky_widgets.utils.streaming import stream_documents_into_runs
-from bluesky_kafka import RemoteDispatcher
 from bluesky_widgets.headless.figures import HeadlessFigures
 from bluesky_widgets.models.utils import run_is_live_and_not_completed
 
+from .catchup import CatchUpSource, RunStartIndex, default_index_path, kafka_consumer
+from .ingest import EventPageCoalescer, FieldProjection
+from .plot_specs import PLOT_SPECS, PlotSpecs
 from .plots import AutoBMMPlot
+from .thumbnail_cache import ThumbnailCache
+from .thumbnails import (
+    StreamingExport,
+    ThumbnailRenderer,
+    default_thumbnail_root,
+    export_figures,
+    thumbnail_directory,
+)
 
 
-def auto_plot(catalog, uid, fill='yes', streaming=False):
+def auto_plot(catalog, uid, fill='yes', streaming=False, plot_specs=None):
     if streaming:
-        plotter = stream_documents_into_runs(export_thumbnails_streaming)
+        plotter = stream_documents_into_runs(functools.partial(export_thumbnails_streaming, plot_specs=plot_specs))
     else:
-        plotter = stream_documents_into_runs(export_thumbnails_when_complete)
+        plotter = stream_documents_into_runs(
+            functools.partial(export_thumbnails_when_complete, plot_specs=plot_specs)
+        )
     for name, doc in catalog[uid].canonical(fill=fill):
         plotter(name, doc)
 
 
-def export_thumbnails_when_complete(run):
+def export_thumbnails_when_complete(run, plot_specs=None):
     "Given a BlueskyRun, export thumbnail(s) to a directory when it completes."
-    model = AutoBMMPlot()
+    # Nothing is shown until export, so draw only then.
+    model = AutoBMMPlot(plot_specs=plot_specs, redraw_rate=0)
     model.add_run(run)
     view = HeadlessFigures(model.figures)
 
-    uid = run.metadata["start"]["uid"]
-    directory = os.path.join(tempfile.gettempdir(), "ariadne", uid)
+    directory = thumbnail_directory(run.metadata["start"]["uid"])
     os.makedirs(directory, exist_ok=True)
 
     # If the Run is already done by the time we got it, export now.
     # Otherwise, schedule it to export whenever it finishes.
     def export(*args, **kwargs):
-        filenames = view.export_all(directory)
+        model.redraw.flush()
+        filenames = export_figures(view, directory)
         print("\n".join(f'"{filename}"' for filename in filenames))
         view.close()
 
@@ -52,43 +68,79 @@ def export_thumbnails_when_complete(run):
         export()
 
 
-def export_thumbnails_streaming(run):
-    "Given a BlueskyRun, export thumbnail(s) to a directory while it updates."
-    model = AutoBMMPlot()
+def export_thumbnails_streaming(run, interval=5.0, every=50, plot_specs=None):
+    """
+    Given a BlueskyRun, export thumbnail(s) to a directory while it updates.
+
+    They are exported at most every ``interval`` seconds or ``every`` events,
+    whichever comes first, and always once more when the run completes.
+    """
+    # Nothing is shown until export, so draw only then.
+    model = AutoBMMPlot(plot_specs=plot_specs, redraw_rate=0)
     model.add_run(run)
     view = HeadlessFigures(model.figures)
+    directory = thumbnail_directory(run.metadata["start"]["uid"])
+    exporter = StreamingExport(
+        model,
+        view,
+        directory,
+        interval=interval,
+        every=every,
+        on_exported=lambda filenames: print("\n".join(f'"{filename}"' for filename in filenames)),
+    )
 
-    uid = run.metadata["start"]["uid"]
-    directory = os.path.join(tempfile.gettempdir(), "ariadne", uid)
-    os.makedirs(directory, exist_ok=True)
-
-    # If the Run is already done by the time we got it, export now.
-    # Otherwise, schedule it to export whenever it finishes.
-    def export(*args, **kwargs):
-        filenames = view.export_all(directory)
-        print("\n".join(f'"{filename}"' for filename in filenames))
+    def finish(*args, **kwargs):
+        exporter.export(final=True)
         view.close()
 
-
     if run_is_live_and_not_completed(run):
-        run.events.new_data.connect(export)
+
+        def on_completed(event):
+            run.events.new_data.disconnect(exporter.on_new_data)
+            run.events.completed.disconnect(on_completed)
+            finish()
+
+        run.events.new_data.connect(exporter.on_new_data)
+        run.events.completed.connect(on_completed)
     else:
-        export()
+        finish()
+    return exporter
 
 
 if __name__ == "__main__":
     bootstrap_servers = "kafka1.nsls2.bnl.gov:9092,kafka2.nsls2.bnl.gov:9092,kafka3.nsls2.bnl.gov:9092"
     kafka_deserializer = functools.partial(msgpack.loads, object_hook=mpn.decode)
     topics = ["bmm.bluesky.runengine.documents"]
-    consumer_config = {"auto.commit.interval.ms": 100, "auto.offset.reset": "latest"}
-
-    dispatcher = RemoteDispatcher(
-        topics=topics,
-        bootstrap_servers=bootstrap_servers,
-        group_id="widgets_test",
-        consumer_config=consumer_config,
+    consumer_config = {"auto.offset.reset": "latest"}
+
+    # Start with the run in progress, if any, and keep the index of run starts
+    # that the GUI also uses to catch up.
+    dispatcher = CatchUpSource(
+        kafka_consumer(bootstrap_servers, "widgets_test", consumer_config),
+        topics,
+        RunStartIndex(default_index_path()),
+        deserializer=kafka_deserializer,
     )
 
-    dispatcher.subscribe(stream_documents_into_runs(export_thumbnails_when_complete))
-    dispatcher.subscribe(lambda name, doc: print(name, doc.get('uid'), doc.get('descriptor')))
-    dispatcher.start()
+    plot_specs_path = os.environ.get("ARIADNE_PLOT_SPECS")
+    plot_specs = PlotSpecs.from_file(plot_specs_path) if plot_specs_path else PLOT_SPECS
+
+    # Thumbnails already rendered are skipped, so restarting costs little.
+    max_bytes = os.environ.get("ARIADNE_THUMBNAIL_MAX_BYTES")
+    cache = ThumbnailCache(
+        default_thumbnail_root(), max_bytes=int(max_bytes) if max_bytes else None, plot_specs=plot_specs
+    )
+    renderer = ThumbnailRenderer(
+        max_workers=int(os.environ.get("ARIADNE_THUMBNAIL_WORKERS", 2)), cache=cache, plot_specs=plot_specs
+    )
+    # Thumbnails are made once runs complete, so there is no hurry to pass on pages.
+    coalescer = EventPageCoalescer(
+        stream_documents_into_runs(renderer.export_when_complete), max_rows=500, max_latency=1.0
+    )
+    # Thumbnails show only the primary stream's plotted fields, so drop the rest up front.
+    dispatcher.subscribe(FieldProjection(coalescer, plot_specs=plot_specs))
+    dispatcher.subscribe(lambda name, doc: print(name, doc.get('uid'), doc.get('descriptor'), renderer.stats))
+    try:
+        dispatcher.start()
+    finally:
+        renderer.shutdown()
@@ -2,6 +2,7 @@ import argparse
 
 from bluesky_widgets.qt import gui_qt
 
+from .plot_specs import PlotSpecs
 from .viewer import Viewer
 from .settings import SETTINGS
 
@@ -20,13 +21,16 @@ def main(argv=None):
         "--kafka-topics", help="Kafka servers, comma-separated string, e.g. bmm.bluesky.runengine.documents"
     )
     parser.add_argument("--catalog", help="Databroker catalog")
+    parser.add_argument("--plot-specs", help="JSON file of the plots to make for each plan (default: built in)")
     args = parser.parse_args(argv)
+    if args.plot_specs:
+        # Loaded once, up front, so that a bad table fails now rather than at the first run.
+        SETTINGS.plot_specs = PlotSpecs.from_file(args.plot_specs)
 
     with gui_qt("Ariadne"):
         if args.catalog:
-            import databroker
-
-            SETTINGS.catalog = databroker.catalog[args.catalog]
+            # Opened when first searched, so that the window shows without waiting for databroker.
+            SETTINGS.catalog_name = args.catalog
 
         # Optional: Receive live streaming data.
         if args.zmq:
@@ -0,0 +1,233 @@
+"""
+Live merge of repeated XAFS scans of the same sample on a common energy grid.
+
+Each scan is interpolated onto the grid, and a running mean and variance are
+kept per grid point (Welford's algorithm). A grid point is folded in as soon
+as a scan's data bracket it: energies only increase during a scan, so the
+interpolated value there will not change. The work per event is proportional
+to the number of grid points newly passed, and the memory is proportional to
+the size of the grid, however many scans are merged.
+"""
+import threading
+
+import numpy
+
+from bluesky_widgets.models.plot_specs import Line
+from bluesky_widgets.models.utils import lock_if_live, run_is_live_and_not_completed
+
+from .compute import submit
+from .expressions import DerivedSignal
+
+
+def default_grid(edge_energy, pre_edge=-200.0, post_edge=1000.0, step=0.5):
+    "A uniform energy grid around an edge, in eV."
+    return numpy.arange(edge_energy + pre_edge, edge_energy + post_edge + step / 2, step)
+
+
+class RunningMerge:
+    """
+    Running mean and variance of scans interpolated onto a common grid.
+
+    Parameters
+    ----------
+    grid : Array
+        Increasing energies
+
+    Examples
+    --------
+
+    >>> merge = RunningMerge(numpy.linspace(0, 10, 11))
+    >>> merge.add("a", [0, 10], [0, 10])
+    >>> merge.add("b", [0, 5], [2, 7])  # partial scan, still in progress
+    >>> merge.mean[:3]
+    array([1., 2., 3.])
+    """
+
+    def __init__(self, grid):
+        self.grid = numpy.asarray(grid, dtype=float)
+        self.count = numpy.zeros(len(self.grid), dtype=int)
+        self._mean = numpy.zeros(len(self.grid))
+        self._m2 = numpy.zeros(len(self.grid))
+        # Map scan id to index of the next grid point it has not contributed.
+        self._cursors = {}
+
+    def __contains__(self, scan_id):
+        return scan_id in self._cursors
+
+    @property
+    def scans(self):
+        "Number of scans contributing"
+        return len(self._cursors)
+
+    @property
+    def mean(self):
+        "Mean over scans at each grid point, NaN where there is no data"
+        return numpy.where(self.count > 0, self._mean, numpy.nan)
+
+    @property
+    def variance(self):
+        "Sample variance over scans at each grid point, NaN where there are fewer than two"
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return numpy.where(self.count > 1, self._m2 / (self.count - 1), numpy.nan)
+
+    def add(self, scan_id, energy, mu):
+        """
+        Fold in the grid points that a scan's data now bracket.
+
+        Parameters
+        ----------
+        scan_id : Hashable
+        energy, mu : Array
+            All the points of the scan so far, with increasing energy.
+        """
+        energy = numpy.asarray(energy, dtype=float)
+        mu = numpy.asarray(mu, dtype=float)
+        if not len(energy):
+            return
+        start = self._cursors.get(scan_id)
+        if start is None:
+            start = int(numpy.searchsorted(self.grid, energy[0]))
+        stop = int(numpy.searchsorted(self.grid, energy[-1], side="right"))
+        self._cursors[scan_id] = max(start, stop)
+        if stop <= start:
+            return
+        # Only the data from just below grid[start] onward are needed.
+        first = max(int(numpy.searchsorted(energy, self.grid[start])) - 1, 0)
+        values = numpy.interp(self.grid[start:stop], energy[first:], mu[first:])
+        good = numpy.isfinite(values)
+        index = numpy.arange(start, stop)[good]
+        values = values[good]
+        self.count[index] += 1
+        delta = values - self._mean[index]
+        self._mean[index] += delta / self.count[index]
+        self._m2[index] += delta * (values - self._mean[index])
+
+
+class ScanMerger:
+    """
+    Merge one mu(E) expression over the runs of a group, live, as a Line.
+
+    Parameters
+    ----------
+    x, y : String
+        Expressions for energy and mu
+    column_store : ColumnStore
+        Columns are held only while a run is being merged.
+    grid : Array
+    label : String, optional
+    redraw : RedrawScheduler, optional
+        If given, redraws of the line are requested from it.
+    executor : concurrent.futures.Executor, optional
+        If given, completed runs are read and merged on it rather than in the
+        thread that adds them.
+    call_soon : Callable, optional
+        Expected signature ``f(function)``, calling function with no arguments
+        in the GUI thread. Once a run is merged on the executor, the line
+        emits ``new_data``, or requests its redraw, that way. By default, it
+        does so in the worker thread.
+
+    Attributes
+    ----------
+    merge : RunningMerge
+    line : Line
+        Shows the mean on the grid. It emits ``new_data`` as runs progress.
+    """
+
+    def __init__(self, x, y, column_store, grid, label="merged", redraw=None, executor=None, call_soon=None):
+        self.x = x
+        self.y = y
+        self._column_store = column_store
+        self.merge = RunningMerge(grid)
+        self.line = Line(self._update, label=label, style={"color": "red", "linewidth": 2}, live=True)
+        self._redraw = redraw
+        self._executor = executor
+        self.call_soon = call_soon
+        # Runs may be merged from several threads at once.
+        self._lock = threading.Lock()
+        # The mean as of the last fold, which the line shows.
+        self._data = {"x": self.merge.grid, "y": self.merge.mean}
+        self._uids = set()
+        # Map run uid to callback disconnecting the run from this merger.
+        self._live = {}
+
+    def __len__(self):
+        "Number of runs added"
+        return len(self._uids)
+
+    def _update(self):
+        with self._lock:
+            return self._data
+
+    def add_run(self, run):
+        "Merge a run, now if it is complete or as its data arrive if it is live."
+        uid = run.metadata["start"]["uid"]
+        if uid in self._uids:
+            return
+        self._uids.add(uid)
+        if not run_is_live_and_not_completed(run):
+            if self._executor is None:
+                self._merge_completed(run)
+            else:
+                submit(self._executor, self._merge_completed, run)
+            return
+        stream_name = "primary"
+        fold = self._fold_into_merge(run, self._column_store.acquire(run, stream_name))
+
+        def on_new_data(*args, **kwargs):
+            fold()
+            self._changed()
+
+        def finish(*args, **kwargs):
+            fold()
+            self._changed()
+            if self._redraw is not None:
+                self._redraw.flush()
+            run.events.new_data.disconnect(on_new_data)
+            run.events.completed.disconnect(finish)
+            self._live.pop(uid, None)
+            self._column_store.release(run, stream_name)
+
+        run.events.new_data.connect(on_new_data)
+        run.events.completed.connect(finish)
+        self._live[uid] = finish
+        fold()
+        self._changed()
+
+    def _merge_completed(self, run):
+        stream_name = "primary"
+        columns = self._column_store.acquire(run, stream_name)
+        try:
+            self._fold_into_merge(run, columns)()
+        finally:
+            self._column_store.release(run, stream_name)
+        if self._executor is None or self.call_soon is None:
+            self._changed()
+        else:
+            self.call_soon(self._changed)
+
+    def _changed(self):
+        "Have the line show the mean as of the last fold."
+        if self._redraw is None:
+            self.line.events.new_data()
+        else:
+            self._redraw.request(self.line)
+
+    def _fold_into_merge(self, run, columns):
+        "Return a function folding the data of run so far into the merge and computing the new mean."
+        uid = run.metadata["start"]["uid"]
+        x_signal, y_signal = DerivedSignal(self.x), DerivedSignal(self.y)
+
+        def fold():
+            with lock_if_live(run), self._lock:
+                if not {*x_signal.expression.fields, *y_signal.expression.fields}.issubset(columns.fields):
+                    return
+                length = len(columns)
+                self.merge.add(uid, x_signal.update(columns, length), y_signal.update(columns, length))
+                self._data = {"x": self.merge.grid, "y": self.merge.mean}
+
+        return fold
+
+    def close(self):
+        "Stop following any runs still in progress."
+        for finish in list(self._live.values()):
+            finish()
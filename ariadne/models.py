@@ -1,18 +1,254 @@
 """
 Extending and supplementing the models from bluesky-widgets
 """
-from bluesky_widgets.models.search import Search
+import concurrent.futures
+import functools
+import logging
+import threading
+
+from bluesky_widgets.models.search import RunSearch, Search, SearchInput, SearchResults
 from bluesky_widgets.utils.event import Event
 
+from .prefetch import RunPrefetcher
+from .run_index import SEARCH_FIELDS, IndexedCatalog
+from .search_rows import PagedSearchResults, fetch_uids
+
+logger = logging.getLogger(__name__)
+
 
 class SearchWithButton(Search):
     """
     A Search model with a method to handle a click event.
+
+    If given a RowCache as ``rows``, the results of searching a catalog of
+    runs are PagedSearchResults taking their rows from it, read a page at a
+    time, rather than from the row factory in ``columns`` one run at a time.
+
+    If given a RunIndex as ``index``, searches, by text or by the fields of
+    SEARCH_FIELDS, are searches of the index, and the catalog is read only
+    for the runs selected.
+
+    A catalog of runs is opened (see :meth:`open`), probed for text search,
+    and searched, and the results counted, on ``executor``, so a slow
+    catalog does not hold up the GUI. The results are then shown with
+    ``call_soon``, which should call them in the GUI thread. Until then,
+    ``loading`` is True. The results of a search superseded by another
+    before they are shown are dropped.
+
+    Parameters
+    ----------
+    root_catalog : Catalog, optional
+        As for Search. A catalog of runs is opened as if by :meth:`open`. If
+        None, there are no results until a catalog is opened.
+    *args, **kwargs
+        As for Search
+    rows : RowCache, optional
+    index : RunIndex, optional
+    executor : concurrent.futures.Executor, optional
+        By default, a pool of two threads of this object's own.
+    call_soon : Callable, optional
+        Expected signature ``f(function)``, calling function with no arguments
+        in the GUI thread. By default, functions are called in the thread of
+        the executor.
+
+    Attributes
+    ----------
+    loading : Boolean
+        Whether a catalog is being opened or searched. The ``loading`` event
+        is emitted, with ``loading``, when this changes.
+    """
+
+    def __init__(self, root_catalog=None, *args, rows=None, index=None, executor=None, call_soon=None, **kwargs):
+        # Search would make a RunSearch of a catalog of runs, which probes and
+        # searches it there and then; this one starts empty instead.
+        runs = root_catalog is None or self._has_runs(root_catalog)
+        super().__init__(None if runs else root_catalog, *args, **kwargs)
+        self.events.add(view=Event, loading=Event)
+        self.rows = rows
+        self.index = None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="ariadne-search")
+        self.executor = executor
+        self.call_soon = call_soon
+        self.loading = False
+        # Future of the latest search
+        self.query_future = None
+        self._query_lock = threading.Lock()
+        self._query_generation = 0
+        if not runs:
+            return
+        if rows is None:
+            search_results = SearchResults(self._columns)
+        else:
+            search_results = PagedSearchResults(self._columns, rows)
+        search_results.events.active_row.connect(self._on_active_row)
+        if index is None:
+            search_input = SearchInput()
+        else:
+            search_input = SearchInput(fields=list(SEARCH_FIELDS), text_search_supported=True)
+        self._search = _RunSearch(None, search_input, search_results)
+        self._connect_input(self._search.search_input)
+        if root_catalog is not None:
+            self.open(lambda: (root_catalog, index))
+
+    def open(self, open_catalog):
+        """
+        Open a catalog of runs on the executor, and search it.
+
+        Parameters
+        ----------
+        open_catalog : Callable
+            Expected signature ``f() -> (catalog, index)``, where index is a
+            RunIndex to search instead of the catalog, or None. It is called
+            on the executor.
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+        """
+        query = dict(self._search.search_input.query)
+        with self._query_lock:
+            generation = self._supersede()
+            self.query_future = self.executor.submit(self._open, open_catalog, query, generation)
+        self._set_loading(True)
+        return self.query_future
+
+    def _open(self, open_catalog, query, generation):
+        "Open the catalog, and search it, in a worker thread."
+        try:
+            root_catalog, index = open_catalog()
+            if not self._has_runs(root_catalog):
+                raise TypeError(f"{root_catalog!r} is not a catalog of runs")
+            if index is None:
+                catalog = root_catalog
+                text_search_supported = _supports_text_search(catalog)
+            else:
+                catalog = IndexedCatalog(root_catalog, index)
+                text_search_supported = True
+        except Exception:
+            logger.exception("Failed to open the catalog to search")
+            self._call(functools.partial(self._failed, generation))
+            raise
+        opened = functools.partial(self._set_catalog, root_catalog, catalog, index, text_search_supported, query)
+        self._query(catalog, query, generation, opened)
+
+    def _set_catalog(self, root_catalog, catalog, index, text_search_supported, query):
+        "Search catalog from now on, in the GUI thread."
+        self._root_catalog = root_catalog
+        self.index = index
+        run_search = self._search
+        run_search.catalog = catalog
+        fields = [] if index is None else list(SEARCH_FIELDS)
+        search_input = run_search.search_input
+        if search_input.fields != fields or search_input.text_search_supported != text_search_supported:
+            # The index supports text search whatever the catalog does, so the input is made anew.
+            self._disconnect_input(search_input)
+            self.events.run_search_cleared()
+            search_input = SearchInput(fields=fields, text_search_supported=text_search_supported)
+            run_search.search_input = search_input
+            self._connect_input(search_input)
+            self.events.run_search_ready(search_input=search_input, search_results=run_search.search_results)
+        if dict(search_input.query) != query:
+            # Searched for something else while the catalog was opening
+            self._on_query()
+
+    def _connect_input(self, search_input):
+        # Reloading is searching again: a new search gets the runs added since.
+        search_input.events.query.connect(self._on_query)
+        search_input.events.reload.connect(self._on_query)
+
+    def _disconnect_input(self, search_input):
+        search_input.events.query.disconnect(self._on_query)
+        search_input.events.reload.disconnect(self._on_query)
+
+    def _supersede(self):
+        "Drop the results of the latest search, and return the generation of the next. Hold _query_lock."
+        self._query_generation += 1
+        if self.query_future is not None:
+            # If it has not started, it never will. If it has, its results will be dropped.
+            self.query_future.cancel()
+        return self._query_generation
+
+    def _on_query(self, event=None):
+        run_search = self._search
+        if run_search.catalog is None:
+            # The catalog is still opening; it is searched once it is open.
+            return
+        query = dict(run_search.search_input.query)
+        with self._query_lock:
+            generation = self._supersede()
+            self.query_future = self.executor.submit(self._query, run_search.catalog, query, generation)
+        self._set_loading(True)
+
+    def _query(self, catalog, query, generation, opened=None):
+        "Search, in a worker thread."
+        if generation != self._query_generation and opened is None:
+            return
+        try:
+            results = catalog.search(query)
+            length = len(results)
+            if self.rows is not None and length:
+                # Read the rows first on view too, while still off the GUI thread.
+                self.rows.get(results, fetch_uids(results, 0, self.rows.batch_size))
+        except Exception:
+            logger.exception("Failed to search %r for %r", catalog, query)
+            self._call(functools.partial(self._failed, generation, opened))
+            raise
+        if generation != self._query_generation and opened is None:
+            return
+        self._call(functools.partial(self._show_results, results, length, generation, opened))
+
+    def _show_results(self, results, length, generation, opened=None):
+        if opened is not None:
+            opened()
+        if generation != self._query_generation or self._search is None:
+            return
+        search_results = self._search.search_results
+        if isinstance(search_results, PagedSearchResults):
+            search_results.set_catalog(results, length=length)
+        else:
+            search_results.catalog = results
+        self._set_loading(False)
+
+    def _failed(self, generation, opened=None):
+        if opened is not None:
+            opened()
+        if generation == self._query_generation:
+            self._set_loading(False)
+
+    def _set_loading(self, loading):
+        if loading != self.loading:
+            self.loading = loading
+            self.events.loading(loading=loading)
+
+    def _call(self, function):
+        if self.call_soon is None:
+            function()
+        else:
+            self.call_soon(function)
+
+
+class _RunSearch(RunSearch):
     """
+    A RunSearch made without a catalog, which SearchWithButton opens and searches on its executor.
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.events.add(view=Event)
+    The stock RunSearch probes its catalog for text search and searches it
+    as soon as it is made.
+    """
+
+    def __init__(self, catalog, search_input, search_results):
+        self.catalog = catalog
+        self.search_input = search_input
+        self.search_results = search_results
+
+
+def _supports_text_search(catalog):
+    "Whether the catalog takes $text queries, as only real MongoDB does (see RunSearch)"
+    try:
+        catalog.search({"$text": ""})
+    except NotImplementedError:
+        return False
+    return True
 
 
 class RunAndView:
@@ -22,20 +258,45 @@ class RunAndView:
 
 
 class SearchAndView:
-    def __init__(self, search, databroker_auto_plot_builder):
+    """
+    Search runs and view those selected.
+
+    The runs selected are loaded concurrently, on up to ``max_workers``
+    threads, by a RunPrefetcher, and each is plotted as soon as it is loaded.
+    """
+
+    def __init__(self, search, databroker_auto_plot_builder, max_workers=4):
         self.search = search
         self.databroker_auto_plot_builder = databroker_auto_plot_builder
+        self.prefetcher = RunPrefetcher(
+            self._add_run,
+            plot_specs=databroker_auto_plot_builder.plot_specs,
+            max_workers=max_workers,
+            call_soon=getattr(search, "call_soon", None),
+        )
         self.search.events.view.connect(self._on_view)
 
         self._figures_to_lines = {}
         self.databroker_auto_plot_builder.figures.events.added.connect(self._on_figure_added)
 
     def _on_view(self, event):
-        catalog = self.search.selection_as_catalog
-        if catalog is None:
+        uids = self.search.selected_uids
+        if not uids:
+            return
+        self.prefetcher.submit(self.search.results, uids)
+
+    def _add_run(self, run, columns):
+        store = self.databroker_auto_plot_builder.columns
+        if columns is None:
+            self.databroker_auto_plot_builder.add_run(run)
             return
-        for uid, run in catalog.items():
+        # The plots use the columns already read rather than reading them
+        # again. They are held until every plot has taken them.
+        store.put(run, columns)
+        try:
             self.databroker_auto_plot_builder.add_run(run)
+        finally:
+            store.release(run)
 
     def _on_figure_added(self, event):
         figure = event.item
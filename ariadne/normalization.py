@@ -0,0 +1,265 @@
+"""
+Live normalization of XAFS data as a scan progresses.
+
+This follows the usual (Athena-style) recipe: find E0 as the point of maximum
+derivative near the edge, fit a line to the pre-edge region and a polynomial
+to the post-edge region, and scale the pre-edge-subtracted data by the edge
+step, the difference between the two fits at E0.
+
+The fit regions are fixed relative to the nominal edge energy of the scan, so
+each point is added to the running least-squares sums of its region exactly
+once, and refitting costs the same no matter how long the scan has run. The
+normalized values are kept too: new points are normalized with the fits as
+they are, and all the points again only once the fits have moved by more than
+a set tolerance, which happens less and less often as the scan goes on.
+"""
+import numpy
+
+
+class RunningPolyFit:
+    """
+    Least-squares polynomial fit updated from running sums.
+
+    Parameters
+    ----------
+    degree : Integer
+    center : Number, optional
+        Fit in terms of ``(x - center) / scale`` to keep the sums well
+        conditioned.
+    scale : Number, optional
+
+    Examples
+    --------
+
+    >>> fit = RunningPolyFit(1)
+    >>> fit.add([0, 1, 2], [1, 3, 5])
+    >>> fit([3])
+    array([7.])
+    """
+
+    def __init__(self, degree, center=0.0, scale=1.0):
+        self.degree = int(degree)
+        self.center = center
+        self.scale = scale
+        # Sums of u**k for k <= 2 * degree and of y * u**k for k <= degree.
+        self._power_sums = numpy.zeros(2 * self.degree + 1)
+        self._moment_sums = numpy.zeros(self.degree + 1)
+        self._coefficients = None
+
+    def __len__(self):
+        return int(self._power_sums[0])
+
+    def add(self, x, y):
+        "Add points to the fit."
+        u = (numpy.asarray(x, dtype=float) - self.center) / self.scale
+        y = numpy.asarray(y, dtype=float)
+        if not len(u):
+            return
+        powers = numpy.vander(u, 2 * self.degree + 1, increasing=True)
+        self._power_sums += powers.sum(axis=0)
+        self._moment_sums += (powers[:, :self.degree + 1] * y[:, None]).sum(axis=0)
+        self._coefficients = None
+
+    @property
+    def ready(self):
+        "True once there are enough points to determine the polynomial."
+        return len(self) > self.degree
+
+    @property
+    def coefficients(self):
+        "Coefficients in increasing order of power of (x - center) / scale"
+        if self._coefficients is None:
+            n = self.degree + 1
+            matrix = numpy.array([self._power_sums[i:i + n] for i in range(n)])
+            self._coefficients = numpy.linalg.lstsq(matrix, self._moment_sums, rcond=None)[0]
+        return self._coefficients
+
+    def __call__(self, x):
+        u = (numpy.asarray(x, dtype=float) - self.center) / self.scale
+        return numpy.polynomial.polynomial.polyval(u, self.coefficients)
+
+
+class LiveNormalization:
+    """
+    Normalized mu(E) of one scan, updated as points arrive.
+
+    Parameters
+    ----------
+    edge_energy : Number
+        Nominal edge energy in eV (e.g. ``XDI.Scan.edge_energy``). The fit
+        regions are relative to it.
+    pre_edge : Tuple[Number, Number], optional
+        Pre-edge region, relative to the edge energy. Default is (-150, -30).
+    post_edge : Tuple[Number, Number], optional
+        Post-edge region, relative to the edge energy. Default is (150, inf).
+    post_edge_degree : Integer, optional
+        Degree of the post-edge polynomial. Default is 2.
+    e0_window : Tuple[Number, Number], optional
+        Region, relative to the edge energy, in which to search for E0.
+        Default is (-30, 50).
+    rtol : Number, optional
+        All the points are normalized again once the pre-edge line or the
+        edge step has changed by more than this, relative to the edge step,
+        since they last were. Default is 1e-3. 0 normalizes them all whenever
+        the fits change.
+
+    Attributes
+    ----------
+    e0 : Number | None
+        Energy of maximum derivative found so far
+    edge_step : Number | None
+    renormalizations : Integer
+        Number of times all the points were normalized again
+    """
+
+    def __init__(
+        self,
+        edge_energy,
+        pre_edge=(-150, -30),
+        post_edge=(150, numpy.inf),
+        post_edge_degree=2,
+        e0_window=(-30, 50),
+        rtol=1e-3,
+    ):
+        self.edge_energy = float(edge_energy)
+        self.rtol = rtol
+        self.pre_edge = pre_edge
+        self.post_edge = post_edge
+        self.post_edge_degree = post_edge_degree
+        self.e0_window = e0_window
+        self.renormalizations = 0
+        self._reset()
+
+    def _reset(self):
+        self._pre = RunningPolyFit(1, center=self.edge_energy, scale=100.0)
+        self._post = RunningPolyFit(self.post_edge_degree, center=self.edge_energy, scale=100.0)
+        self._length = 0
+        self._max_derivative = -numpy.inf
+        self.e0 = None
+        # Extent of the scaled energies and of mu so far, to bound how far the fits moved.
+        self._u_max = 0.0
+        self._mu_low = numpy.inf
+        self._mu_high = -numpy.inf
+        # Normalized values of the first _normalized_length points, and the
+        # (kind, pre-edge coefficients, edge step) they were made with.
+        self._normalized = numpy.empty(0)
+        self._normalized_length = 0
+        self._basis = None
+
+    def __len__(self):
+        return self._length
+
+    def update(self, energy, mu, exact=False):
+        """
+        Take in any new points and return the normalized mu over all points.
+
+        Parameters
+        ----------
+        energy, mu : Array
+            All the points so far. Only those not yet seen update the fits.
+        exact : Boolean, optional
+            Normalize with the fits as they are now, to within rounding,
+            rather than rtol, e.g. once the scan is complete.
+
+        Returns
+        -------
+        normalized : Array
+            Pre-edge subtracted and divided by the edge step. Until the fits
+            are possible, it is only pre-edge subtracted, or returned as is.
+            This is a view, not a copy; values already returned are not
+            changed by later updates.
+        """
+        energy = numpy.asarray(energy, dtype=float)
+        mu = numpy.asarray(mu, dtype=float)
+        length = min(len(energy), len(mu))
+        if length < self._length:
+            # Not the same scan any more; start over.
+            self._reset()
+        if length > self._length:
+            self._add(energy, mu, self._length, length)
+            self._length = length
+        basis = self._current_basis()
+        rtol = 0 if exact else self.rtol
+        if self._basis is None or not self._close(self._basis, basis, rtol) or length < self._normalized_length:
+            # Normalize all the points again, into a new buffer.
+            self._basis = basis
+            self._normalized = numpy.empty(max(2 * length, 512))
+            self.renormalizations += 1
+            start = 0
+        else:
+            start = self._normalized_length
+            if length > len(self._normalized):
+                buffer = numpy.empty(2 * length)
+                buffer[:start] = self._normalized[:start]
+                self._normalized = buffer
+        self._normalized[start:length] = self._apply(self._basis, energy[start:length], mu[start:length])
+        self._normalized_length = length
+        return self._normalized[:length]
+
+    def _current_basis(self):
+        if not self._pre.ready:
+            return ("raw", None, None)
+        coefficients = self._pre.coefficients.copy()
+        step = self.edge_step
+        if not step:
+            return ("subtracted", coefficients, None)
+        return ("normalized", coefficients, step)
+
+    def _close(self, old, new, rtol):
+        "Do two bases normalize the points so far to within rtol?"
+        if old[0] != new[0]:
+            return False
+        if old[0] == "raw":
+            return True
+        if old[0] == "normalized":
+            scale = abs(old[2])
+            if abs(new[2] - old[2]) > rtol * scale:
+                return False
+        else:
+            scale = self._mu_high - self._mu_low
+        # Bound on how far the pre-edge line moved over the energies so far.
+        difference = numpy.abs(new[1] - old[1])
+        return difference[0] + difference[1] * self._u_max <= rtol * scale
+
+    def _apply(self, basis, energy, mu):
+        kind, coefficients, step = basis
+        if kind == "raw":
+            return mu
+        u = (energy - self._pre.center) / self._pre.scale
+        subtracted = mu - numpy.polynomial.polynomial.polyval(u, coefficients)
+        if kind == "subtracted":
+            return subtracted
+        return subtracted / step
+
+    @property
+    def edge_step(self):
+        if self.e0 is None or not (self._pre.ready and self._post.ready):
+            return None
+        return float(self._post([self.e0])[0] - self._pre([self.e0])[0])
+
+    def _add(self, energy, mu, start, stop):
+        e, m = energy[start:stop], mu[start:stop]
+        good = numpy.isfinite(e) & numpy.isfinite(m)
+        if good.any():
+            u = numpy.abs(e[good] - self._pre.center) / self._pre.scale
+            self._u_max = max(self._u_max, float(u.max()))
+            self._mu_low = min(self._mu_low, float(m[good].min()))
+            self._mu_high = max(self._mu_high, float(m[good].max()))
+        relative = e - self.edge_energy
+        for fit, (low, high) in ((self._pre, self.pre_edge), (self._post, self.post_edge)):
+            selection = good & (relative >= low) & (relative <= high)
+            fit.add(e[selection], m[selection])
+        # Derivatives between each new point and the one before it.
+        first = max(start, 1)
+        if stop > first:
+            de = energy[first:stop] - energy[first - 1:stop - 1]
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                derivative = (mu[first:stop] - mu[first - 1:stop - 1]) / de
+            midpoints = (energy[first:stop] + energy[first - 1:stop - 1]) / 2
+            relative = midpoints - self.edge_energy
+            low, high = self.e0_window
+            derivative[~numpy.isfinite(derivative) | (relative < low) | (relative > high)] = -numpy.inf
+            i = int(numpy.argmax(derivative))
+            if derivative[i] > self._max_derivative:
+                self._max_derivative = derivative[i]
+                self.e0 = float(midpoints[i])
@@ -0,0 +1,191 @@
+"""
+Declarative table of the plots to make for each kind of BMM plan.
+
+BMM plans record a ``plan_name`` such as ``"rel_scan linescan xafs_y It"`` or
+``"scan_nd xafs fluorescence"``. The second word is the plan type and the last
+word is its subtype. The table maps the plan type to the x axis and the subtype
+to the curves to show, and optionally to a mu(E) to normalize live (for xafs
+plans, whose x axis is the energy). Expressions are Python format strings over:
+
+* the words of ``plan_name``, by position: ``{2}`` is the motor of a linescan
+* ``{element}``, from ``XDI.Element.symbol`` in the start document
+* ``{fluorescence}``, the fused fluorescence channel of that element, e.g.
+  ``Fe_fluorescence`` (see :mod:`ariadne.fluorescence`)
+
+Supporting a new plan type is a matter of adding an entry to the table. The
+built-in table is ``DEFAULT_PLOT_SPECS``; another can be loaded from a JSON
+file, e.g. with ``ariadne --plot-specs``.
+"""
+import collections
+import functools
+import hashlib
+import json
+import string
+
+from .expressions import compile_expression
+from .fluorescence import CHANNELS, DWELL_TIME, fluorescence_column
+
+DEFAULT_PLOT_SPECS = {
+    "plans": {
+        "linescan": {"x": "{2}"},
+        "xafs": {"x": "dcm_energy", "normalize": True},
+    },
+    "ys": {
+        "I0": ["I0"],
+        "It": ["It/I0"],
+        "Ir": ["Ir/It"],
+        "If": ["{fluorescence}/I0"],
+        "trans": ["log(I0/It)", "log(It/Ir)", "I0", "It/I0", "Ir/It"],
+        "fluorescence": ["{fluorescence}/I0", "log(I0/It)", "log(It/Ir)", "I0", "It/I0", "Ir/It"],
+        "ref": ["log(It/Ir)", "It/I0", "Ir/It"],
+    },
+    # mu(E) to show normalized as the scan progresses, by subtype. The x axis
+    # must be the energy.
+    "normalize": {
+        "trans": "log(I0/It)",
+        "fluorescence": "{fluorescence}/I0",
+        "ref": "log(It/Ir)",
+    },
+}
+
+PlotTemplate = collections.namedtuple("PlotTemplate", ["key", "title", "x", "y", "normalize"], defaults=[False])
+PlotTemplate.__doc__ = """
+A ready-made description of one plot: the key that identifies it among the
+plots of a plotter (also its figure title), its x and y expressions, and
+whether y is a mu(E) to show normalized.
+"""
+
+_formatter = string.Formatter()
+
+
+class PlotSpecs:
+    """
+    A compiled plot-spec table with a memoized dispatcher.
+
+    Parameters
+    ----------
+    table : Dict
+        With the structure of ``DEFAULT_PLOT_SPECS``. Each plan type may give
+        its own ``"ys"``, which take precedence over the shared ones, and
+        ``"normalize": true`` to add a normalized plot using the shared
+        ``"normalize"`` entries.
+
+    Examples
+    --------
+
+    >>> specs = PlotSpecs(DEFAULT_PLOT_SPECS)
+    >>> (template,) = specs.lookup("rel_scan linescan xafs_y It", None)
+    >>> template.x, template.y
+    ('xafs_y', 'It/I0')
+    """
+
+    def __init__(self, table):
+        self._table = table
+        plans = table.get("plans", {})
+        shared_ys = table.get("ys", {})
+        normalize = table.get("normalize", {})
+        for template in normalize.values():
+            _check_template(template)
+        # Map plan type to (x, {subtype: ys}, {subtype: mu}), validated once, up front.
+        self._plans = {}
+        for plan, spec in plans.items():
+            ys = dict(shared_ys)
+            ys.update(spec.get("ys", {}))
+            self._plans[plan] = (
+                spec["x"],
+                {subtype: tuple(y) for subtype, y in ys.items()},
+                normalize if spec.get("normalize") else {},
+            )
+            for template in (spec["x"], *(y for y_list in ys.values() for y in y_list)):
+                _check_template(template)
+        self.lookup = functools.lru_cache(maxsize=1024)(self._lookup)
+        # Changes whenever the table does, e.g. to tell whether thumbnails are stale.
+        self.version = hashlib.sha256(json.dumps(table, sort_keys=True).encode()).hexdigest()[:16]
+
+    def __reduce__(self):
+        # Pickled as the table, e.g. to send to worker processes; lookup is not picklable.
+        return (type(self), (self._table,))
+
+    @classmethod
+    def from_file(cls, filename):
+        "Load a table from a JSON file."
+        with open(filename) as file:
+            return cls(json.load(file))
+
+    @property
+    def plans(self):
+        "Supported plan types"
+        return frozenset(self._plans)
+
+    def _lookup(self, plan_name, element):
+        """
+        Return the PlotTemplates for a plan_name and an element, which may be None.
+
+        Unsupported or malformed plan names give an empty tuple, as do
+        curves that need an element when there is none.
+        """
+        if not isinstance(plan_name, str):
+            return ()
+        words = plan_name.split()
+        if len(words) < 2 or words[1] not in self._plans:
+            return ()
+        x_template, ys, normalize = self._plans[words[1]]
+        y_templates = ys.get(words[-1], ())
+        if element:
+            fields = {"element": element, "fluorescence": fluorescence_column(element)}
+        else:
+            fields = {}
+        title = " ".join(words)
+        try:
+            x = x_template.format(*words, **fields)
+        except (IndexError, KeyError):
+            return ()
+        templates = []
+        for y_template in y_templates:
+            try:
+                y = y_template.format(*words, **fields)
+            except (IndexError, KeyError):
+                continue
+            templates.append(PlotTemplate(f"{title}: {y}", title, x, y))
+        if words[-1] in normalize:
+            try:
+                y = normalize[words[-1]].format(*words, **fields)
+            except (IndexError, KeyError):
+                pass
+            else:
+                templates.append(PlotTemplate(f"{title}: normalized {y}", title, x, y, True))
+        return tuple(templates)
+
+    def required_fields(self, plan_name, element):
+        """
+        Return the recorded fields that the plots of a plan read, or None if there are none.
+
+        A fused fluorescence column stands for the detector channels and the
+        dwell time it is computed from. Names that are not recorded fields,
+        such as ``time``, may be included.
+        """
+        templates = self.lookup(plan_name, element)
+        if not templates:
+            return None
+        fields = set()
+        for template in templates:
+            for expr in (template.x, template.y):
+                try:
+                    fields.update(compile_expression(expr).fields)
+                except SyntaxError:
+                    return None
+        if element and fluorescence_column(element) in fields:
+            fields.update(f"{element}{i}" for i in range(1, CHANNELS + 1))
+            fields.add(DWELL_TIME)
+        return frozenset(fields)
+
+
+def _check_template(template):
+    "Raise ValueError if a template does not use only the supported replacement fields."
+    for _, field, _, _ in _formatter.parse(template):
+        if field is None or field.isdigit() or field in ("element", "fluorescence"):
+            continue
+        raise ValueError(f"Unsupported field {{{field}}} in plot spec {template!r}")
+
+
+PLOT_SPECS = PlotSpecs(DEFAULT_PLOT_SPECS)
@@ -1,82 +1,641 @@
+import collections
+import threading
+
 from bluesky_widgets.models.auto_plot_builders import AutoPlotter
 from bluesky_widgets.models.plot_builders import Lines
 from bluesky_widgets.models.plot_specs import Axes, Figure
+from bluesky_widgets.models.utils import lock_if_live, run_is_live_and_not_completed
 
-# plan_name
-# underlying_plan linescan motor type
-# underlying_plan xafs trans/fluorescence/ref
+from .columns import ColumnStore, CompactRun
+from .compute import downsample, submit
+from .expressions import DerivedSignal, compile_expression
+from .merge import ScanMerger, default_grid
+from .normalization import LiveNormalization
+from .plot_specs import PLOT_SPECS
+from .redraw import RedrawScheduler
+from .retention import MemoryBudget, estimate_nbytes
 
 
-class AutoBMMPlot(AutoPlotter):
+class BMMLines(Lines):
+    """
+    Lines whose x and y expressions are compiled once and evaluated incrementally.
+
+    Each expression over the columns of the stream is parsed once, and for
+    each run only the rows added since the last update are evaluated.
+    Anything the engine cannot handle (callables, expressions that use other
+    streams or the run itself) falls back to the generic evaluation in Lines.
+
+    Parameters
+    ----------
+    *args, **kwargs
+        Passed through to Lines
+    column_store : ColumnStore, optional
+        Columns shared with other plot builders. By default, this builder
+        keeps its own.
+    redraw : RedrawScheduler, optional
+        If given, the lines of live runs request redraws from it instead of
+        redrawing on every new event.
+    executor : concurrent.futures.Executor, optional
+        If given, the data of each line (column extraction, expression
+        evaluation, normalization, downsampling) are computed on it, and views
+        only pick up the finished arrays. Lines of runs that are not live
+        appear once their data are ready.
+    max_points : Integer, optional
+        If given, lines are downsampled to about this many points, keeping
+        the extremes. The full data are still used for normalization.
+    call_soon : Callable, optional
+        Expected signature ``f(function)``, calling function with no arguments
+        in the GUI thread. Once data are computed on the executor, lines are
+        created, and redraws requested, that way. By default, they are called
+        in the worker threads.
+    """
+
+    def __init__(
+        self, *args, column_store=None, redraw=None, executor=None, max_points=None, call_soon=None, **kwargs
+    ):
+        # Set before super().__init__, which may already add lines.
+        self._redraw = redraw
+        self._executor = executor
+        self.call_soon = call_soon
+        self.max_points = max_points
+        # Evaluation updates state shared between the lines of a run, so it is
+        # serialized. Take the run's lock (if live) first, then this one.
+        self._compute_lock = threading.RLock()
+        # Map (run uid, y) to the data last computed in the background.
+        self._results = {}
+        # Map (run uid, y) being computed in the background to whether it
+        # must be computed again when done.
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+        if column_store is None:
+            column_store = ColumnStore()
+        self._column_store = column_store
+        # Map run uid to RunColumns and (run uid, expression) to DerivedSignal.
+        self._columns = {}
+        self._signals = {}
+        # Map (run uid, y) to its line, and to a style to give the line when
+        # it is next created (see insert_run).
+        self._lines = {}
+        self._restyle = {}
+        self.runs.events.removed.connect(self._on_run_removed)
+
+    def _add_lines(self, event):
+        run = event.run
+        uid = run.metadata["start"]["uid"]
+        if uid not in self._columns:
+            # Take a reference to columns already held, e.g. read ahead, now,
+            # before they can be dropped; others are acquired when first used.
+            columns = self._column_store.acquire_held(run, self.needs_streams[0])
+            if columns is not None:
+                self._columns[uid] = columns
+        if self._executor is not None and not run_is_live_and_not_completed(event.run):
+            # The lines appear once their data are computed in the background.
+            submit(self._executor, self._add_lines_when_computed, event)
+            return
+        self._add_lines_now(event)
+
+    def _add_lines_when_computed(self, event):
+        run = event.run
+        for y in self.ys:
+            self._keep(run, y)
+        self._call(lambda: self._add_computed_lines(event))
+
+    def _add_computed_lines(self, event):
+        run = event.run
+        if run in self.runs:
+            self._add_lines_now(event)
+        else:
+            self._release(run)
+
+    def _call(self, function):
+        "Call function in the GUI thread, if there is a call_soon."
+        if self.call_soon is None:
+            function()
+        else:
+            self.call_soon(function)
+
+    def _add_lines_now(self, event):
+        run = event.run
+        uid = run.metadata["start"]["uid"]
+        with lock_if_live(run), self._compute_lock:
+            count = len(self.axes.artists)
+            super()._add_lines(event)
+            lines = list(self.axes.artists)[count:]
+        for line, y in zip(lines, self.ys):
+            self._lines[(uid, y)] = line
+            style = self._restyle.pop((uid, y), None)
+            if style is not None:
+                line.style.update(style)
+            self._route_updates(line, run, y)
+
+    def _add_ys(self, event):
+        count = len(self.axes.artists)
+        runs = list(self._run_manager.runs)
+        super()._add_ys(event)
+        lines = list(self.axes.artists)[count:]
+        for line, run in zip(lines, runs):
+            self._lines[(run.metadata["start"]["uid"], event.item)] = line
+            self._route_updates(line, run, event.item)
+
+    def _route_updates(self, line, run, y):
+        """
+        Compute the data of a live line in the background and request its
+        redraws from the scheduler, as configured.
+        """
+        if not line.live or (self._redraw is None and self._executor is None):
+            return
+        run.events.new_data.disconnect(line.events.new_data)
+        run.events.completed.disconnect(line.events.completed)
+
+        def redraw():
+            if self._redraw is None:
+                line.events.new_data()
+            else:
+                self._redraw.request(line)
+
+        def on_new_data(event):
+            if self._executor is None:
+                redraw()
+            else:
+                self._submit(run, y, lambda: self._call(redraw))
+
+        def complete(event):
+            run.events.new_data.disconnect(on_new_data)
+            run.events.completed.disconnect(complete)
+            # Views stop listening for new data once the line completes, so
+            # bring it up to date first.
+            if self._executor is not None:
+                self._keep(run, y)
+                redraw()
+            if self._redraw is not None:
+                self._redraw.flush()
+            line.events.completed()
+
+        run.events.new_data.connect(on_new_data)
+        run.events.completed.connect(complete)
+
+    def _submit(self, run, y, done):
+        "Compute the data of (run, y) in the background, then call done, unless it is already underway."
+        key = (run.metadata["start"]["uid"], y)
+        with self._pending_lock:
+            if key in self._pending:
+                self._pending[key] = True
+                return
+            self._pending[key] = False
+        submit(self._executor, self._compute_in_background, run, y, done)
+
+    def _compute_in_background(self, run, y, done):
+        key = (run.metadata["start"]["uid"], y)
+        try:
+            while True:
+                self._keep(run, y)
+                done()
+                with self._pending_lock:
+                    if not self._pending[key]:
+                        return
+                    self._pending[key] = False
+        finally:
+            with self._pending_lock:
+                self._pending.pop(key, None)
+
+    def _keep(self, run, y):
+        "Compute the data of (run, y) and keep it for the next update."
+        self._results[(run.metadata["start"]["uid"], y)] = self._compute(run, self.x, y)
+
+    def _transform(self, run, x, y):
+        if x == self.x:
+            data = self._results.get((run.metadata["start"]["uid"], y))
+            if data is not None:
+                return data
+        return self._compute(run, x, y)
+
+    def _compute(self, run, x, y):
+        with lock_if_live(run), self._compute_lock:
+            data = self._evaluate(run, x, y)
+        if self.max_points is None:
+            return data
+        x_values, y_values = downsample(data["x"], data["y"], self.max_points)
+        return {"x": x_values, "y": y_values}
+
+    def _evaluate(self, run, x, y):
+        uid = run.metadata["start"]["uid"]
+        with lock_if_live(run):
+            columns = self._columns.get(uid)
+            if columns is None:
+                columns = self._columns[uid] = self._column_store.acquire(run, self.needs_streams[0])
+            signals = [self._signal(uid, expr, columns) for expr in (x, y)]
+            if None in signals:
+                return super()._transform(run, x, y)
+            length = len(columns)
+            x_signal, y_signal = signals
+            return {"x": x_signal.update(columns, length), "y": y_signal.update(columns, length)}
+
+    def _signal(self, uid, expr, columns):
+        "Return a DerivedSignal, or None if expr must go through the generic path."
+        key = (uid, expr)
+        try:
+            return self._signals[key]
+        except KeyError:
+            pass
+        if not isinstance(expr, str) or len(self.needs_streams) != 1:
+            return None
+        try:
+            expression = compile_expression(expr)
+        except SyntaxError:
+            return None
+        if not expression.fields or not expression.fields.issubset(columns.fields):
+            return None
+        signal = self._signals[key] = DerivedSignal(expression)
+        return signal
+
+    def plotted_fields(self):
+        "The columns all the lines are computed from, or None if that is not known."
+        if len(self.needs_streams) != 1:
+            return None
+        fields = set()
+        for expr in (self.x, *self.ys):
+            if not isinstance(expr, str):
+                return None
+            try:
+                fields.update(compile_expression(expr).fields)
+            except SyntaxError:
+                return None
+        return fields
+
+    def insert_run(self, index, run, keep_style_of=None):
+        """
+        Insert a run at a position in runs, e.g. in place of one just removed.
+
+        Parameters
+        ----------
+        index : Integer
+        run : BlueskyRun | CompactRun
+        keep_style_of : Dict[String, Dict], optional
+            Style of the lines to create, by y
+        """
+        uid = run.metadata["start"]["uid"]
+        for y, style in (keep_style_of or {}).items():
+            self._restyle[(uid, y)] = style
+        self.runs.insert(index, run)
+
+    def line_styles(self, run):
+        "The style of the line of each y for a run"
+        uid = run.metadata["start"]["uid"]
+        return {y: dict(line.style) for (uid_, y), line in self._lines.items() if uid_ == uid}
+
+    def release_columns(self):
+        "Give back the columns of every run to the column store."
+        for run in self.runs:
+            self._release(run)
+
+    def _on_run_removed(self, event):
+        self._release(event.item)
+
+    def _release(self, run):
+        uid = run.metadata["start"]["uid"]
+        with self._compute_lock:
+            if self._columns.pop(uid, None) is not None:
+                self._column_store.release(run, self.needs_streams[0])
+            for key in [key for key in self._signals if key[0] == uid]:
+                del self._signals[key]
+            for key in [key for key in self._results if key[0] == uid]:
+                del self._results[key]
+            for key in [key for key in self._lines if key[0] == uid]:
+                line = self._lines.pop(key)
+                # Lines keeps every line it made, by y; forget this one so that
+                # it, and the run its update refers to, can be freed.
+                artists = self._ys_to_artists.get(key[1], [])
+                if line in artists:
+                    artists.remove(line)
+
+
+class NormalizedLines(BMMLines):
+    """
+    Lines of mu(E), normalized live by pre-edge and post-edge fits.
+
+    The x expression must give the energy. The nominal edge energy of each run
+    is read from ``XDI.Scan.edge_energy`` in its start document; runs without
+    one are shown unnormalized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Map (run uid, y) to LiveNormalization.
+        self._normalizations = {}
+
+    def normalization(self, run, y=None):
+        "Return the LiveNormalization of a run (and y), or None."
+        if y is None:
+            y = self.ys[0]
+        return self._normalizations.get((run.metadata["start"]["uid"], y))
+
+    def _evaluate(self, run, x, y):
+        data = super()._evaluate(run, x, y)
+        key = (run.metadata["start"]["uid"], y)
+        normalization = self._normalizations.get(key)
+        if normalization is None:
+            edge_energy = run.metadata["start"].get("XDI", {}).get("Scan", {}).get("edge_energy")
+            if edge_energy is None:
+                return data
+            normalization = self._normalizations[key] = LiveNormalization(edge_energy)
+        # While the scan runs, points are normalized again only once the fits have moved enough.
+        exact = not run_is_live_and_not_completed(run)
+        return {"x": data["x"], "y": normalization.update(data["x"], data["y"], exact=exact)}
+
+    def _release(self, run):
+        super()._release(run)
+        uid = run.metadata["start"]["uid"]
+        with self._compute_lock:
+            for key in [key for key in self._normalizations if key[0] == uid]:
+                del self._normalizations[key]
+
+
+class PlotRegistry:
+    """
+    The plot builders and figures of each plot key, least recently used first.
+
+    A reverse map from plot builder to key makes removing a builder O(1).
+    """
 
     def __init__(self):
+        # Map key to (plot builders, figures), least recently used first.
+        self._entries = collections.OrderedDict()
+        # Map plot builder to key.
+        self._keys = {}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        "Iterate over keys, least recently used first."
+        yield from self._entries
+
+    def add(self, key, plot_builder, figure):
+        "Register a plot builder and its figure under key and mark key as most recently used."
+        builders, figures = self._entries.setdefault(key, ([], []))
+        self._entries.move_to_end(key)
+        builders.append(plot_builder)
+        figures.append(figure)
+        self._keys[plot_builder] = key
+
+    def builders(self, key):
+        "Return the plot builders of key and mark key as most recently used."
+        self._entries.move_to_end(key)
+        return list(self._entries[key][0])
+
+    def figures(self, key):
+        return list(self._entries[key][1])
+
+    def key_of(self, plot_builder):
+        return self._keys.get(plot_builder)
+
+    def discard_builder(self, plot_builder):
+        "Forget a plot builder, and its key if it was the last builder there."
+        key = self._keys.pop(plot_builder, None)
+        if key is None:
+            return
+        builders, _ = self._entries[key]
+        builders.remove(plot_builder)
+        if not builders:
+            del self._entries[key]
+
+    def pop(self, key):
+        "Forget key and return its (plot builders, figures)."
+        builders, figures = self._entries.pop(key)
+        for plot_builder in builders:
+            self._keys.pop(plot_builder, None)
+        return builders, figures
+
+    def least_recently_used(self):
+        return next(iter(self._entries))
+
+
+class AutoBMMPlot(AutoPlotter):
+    """
+    Build the standard BMM plots for linescan and xafs plans.
+
+    Parameters
+    ----------
+    plot_specs : PlotSpecs, optional
+        Which plots to make for which plans. Default is ``PLOT_SPECS``.
+    max_plots : Integer, optional
+        Number of plots (figures with their plot builders) to keep. When a new
+        plot would exceed this, the least recently used one is removed, which
+        also closes its canvas in any view. Default is 50. None means no
+        limit.
+    redraw_rate : Number | None, optional
+        Maximum number of redraws per second of the live lines, which are
+        redrawn together. Default is 10. None redraws on every event, and 0
+        only when ``redraw.flush()`` is called or a run completes.
+    call_later : Callable, optional
+        Passed to RedrawScheduler, to schedule deferred redraws.
+    call_soon : Callable, optional
+        Expected signature ``f(function)``, calling function in the GUI
+        thread. Plot models are updated that way once their data are computed
+        on the executor. See BMMLines.
+    executor : concurrent.futures.Executor, optional
+        If given, plot data are computed on it rather than in the thread that
+        delivers the documents or draws. See BMMLines.
+    max_points : Integer, optional
+        Downsample lines to about this many points. See BMMLines.
+    memory_budget : Integer, optional
+        Bytes. When the completed runs shown exceed this, the oldest (but
+        never the newest) are replaced in every plot by a CompactRun holding
+        only their plotted columns, as float32, and the full runs are dropped.
+        Runs that are pinned or shown by other plot builders are kept. None,
+        the default, means no limit.
+
+    Attributes
+    ----------
+    redraw : RedrawScheduler
+        Its ``stats`` report how many redraws were coalesced.
+    memory : MemoryBudget
+        Bytes held by each completed run, if there is a budget
+
+    Repeated xafs scans of the same sample, element and edge are merged live:
+    once there are two, a "merged" line showing their mean mu(E) on a common
+    energy grid is added to the mu(E) plot.
+    """
+
+    def __init__(
+        self,
+        plot_specs=None,
+        max_plots=50,
+        redraw_rate=10,
+        call_later=None,
+        executor=None,
+        max_points=None,
+        memory_budget=None,
+        call_soon=None,
+    ):
         super().__init__()
-        self._models = {}
+        self.memory = MemoryBudget(memory_budget)
+        self.executor = executor
+        self.call_soon = call_soon
+        self.max_points = max_points
+        self.redraw = RedrawScheduler(redraw_rate, call_later=call_later)
+        self.plot_specs = PLOT_SPECS if plot_specs is None else plot_specs
+        self.max_plots = max_plots
+        self._models = PlotRegistry()
+        # One set of columns per run, shared by all the Lines built here.
+        self.columns = ColumnStore()
+        # Map (key, sample, element, edge) to ScanMerger.
+        self._mergers = {}
 
         self.plot_builders.events.removed.connect(self._on_plot_builder_removed)
 
     def _on_plot_builder_removed(self, event):
         plot_builder = event.item
-        for key in list(self._models):
-            for line in self._models[key]:
-                if line == plot_builder:
-                    del self._models[key]
+        if isinstance(plot_builder, BMMLines):
+            plot_builder.release_columns()
+        key = self._models.key_of(plot_builder)
+        self._models.discard_builder(plot_builder)
+        if key is not None and key not in self._models:
+            self._discard_mergers(key)
 
-    def handle_new_stream(self, run, stream_name):
-        if stream_name != 'primary':
-            return
+    def _discard_mergers(self, key):
+        for group in [group for group in self._mergers if group[0] == key]:
+            self._mergers.pop(group).close()
 
-        # Find out the plan type.
-        plan_name = run.metadata['start'].get('plan_name').split(' ')
-        if len(plan_name) > 1:
-            plan = plan_name[1]
+    def _evict(self):
+        "Remove the least recently used plots until there are at most max_plots."
+        if self.max_plots is None:
+            return
+        while len(self._models) > self.max_plots:
+            key = self._models.least_recently_used()
+            builders, figures = self._models.pop(key)
+            self._discard_mergers(key)
+            for figure in figures:
+                if figure in self.figures:
+                    self.figures.remove(figure)
+            for plot_builder in builders:
+                if plot_builder in self.plot_builders:
+                    self.plot_builders.remove(plot_builder)
 
-        # Skip plan if it is not supported.
-        if plan not in ['xafs', 'linescan']:
+    def handle_new_stream(self, run, stream_name):
+        if stream_name != 'primary':
             return
 
-        # Gather the rest of the parameters.
-        subtype = plan_name[-1] # trans, ref, fluorescence, I0, It, Ir
-        element = run.metadata['start'].get('XDI', {}).get('Element',{}).get('symbol', False)
-        fluorescence = f'{element}1+{element}2+{element}3+{element}4' if element else None
-
-        # Look up what goes on the x-axis.
-        x_lookup = {'linescan': plan_name[2],
-                    'xafs': 'dcm_energy'}
-        x_axis = x_lookup[plan]
-
-        # Look up what goes on the y-axis.
-        y_lookup = {'I0': ['I0'],
-                    'It': ['It/I0'],
-                    'Ir': ['Ir/It'],
-                    'If': [f'({fluorescence})/I0'],
-                    'trans': ['log(I0/It)', 'log(It/Ir)', 'I0', 'It/I0', 'Ir/It'],
-                    'fluorescence': [f'({fluorescence})/I0', 'log(I0/It)',
-                                     'log(It/Ir)', 'I0', 'It/I0', 'Ir/It'],
-                    'ref': ['log(It/Ir)', 'It/I0', 'Ir/It']}
-        y_axes = y_lookup[subtype]
-
-        for y_axis in y_axes:
-            title = ' '.join(plan_name)
-            subtitle = y_axis
-            key = f'{title}: {subtitle}'
+        start = run.metadata['start']
+        element = start.get('XDI', {}).get('Element', {}).get('symbol')
+        templates = self.plot_specs.lookup(start.get('plan_name'), element)
+        for template in templates:
+            key = template.key
             if key in self._models:
-                models = self._models[key]
-                figure = Figure((Axes(),), title=key)
+                # Reuse the figure already shown for this key; the run is
+                # simply added to it as another line.
+                models = self._models.builders(key)
+                figure = self._models.figures(key)[0]
+                for model in models:
+                    model.add_run(run)
             else:
-                model, figure = self.single_plot(f'{title}: {subtitle}',x_axis, y_axis)
-                models = [model]
-                self._models[key] = [model]
-
-            for model in models:
+                model, figure = self.single_plot(key, template.x, template.y, normalize=template.normalize)
+                self._models.add(key, model, figure)
                 model.add_run(run)
                 self.plot_builders.append(model)
                 self.figures.append(figure)
+            if template.normalize:
+                self._merge(run, template)
 
-        return model, figure
+        self._evict()
+        if templates:
+            self._account(run)
+
+    def _account(self, run):
+        "Count the memory held by run once it is complete, then keep within the budget."
+        if self.memory.budget is None:
+            return
+        if run_is_live_and_not_completed(run):
+            def on_completed(event):
+                run.events.completed.disconnect(on_completed)
+                self._account(run)
+
+            run.events.completed.connect(on_completed)
+            return
+        self.memory.add(run, estimate_nbytes(run) + self.columns.nbytes(run))
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        "Demote the oldest runs until the runs held are within the memory budget."
+        held = {
+            run.metadata['start']['uid']
+            for plot_builder in self.plot_builders
+            if isinstance(plot_builder, Lines)
+            for run in plot_builder.runs
+        }
+        for uid in self.memory.uids():
+            if uid not in held:
+                self.memory.discard(uid)
+        for run in self.memory.candidates():
+            self._demote(run)
+
+    def _demote(self, run):
+        "Replace a full run by a CompactRun of its plotted columns, in every plot builder."
+        uid = run.metadata['start']['uid']
+        builders = []
+        fields = set()
+        for plot_builder in self.plot_builders:
+            if not any(run_ is run for run_ in getattr(plot_builder, 'runs', ())):
+                continue
+            plotted = plot_builder.plotted_fields() if isinstance(plot_builder, BMMLines) else None
+            if plotted is None or uid in plot_builder.pinned:
+                return
+            builders.append(plot_builder)
+            fields.update(plotted)
+        if not builders:
+            self.memory.discard(uid)
+            return
+        columns = self.columns.acquire(run)
+        try:
+            if not fields.issubset(columns.fields):
+                return
+            compact = CompactRun.from_columns(run, columns, fields)
+        finally:
+            self.columns.release(run)
+        # Remove the full run everywhere before adding the compact one, so
+        # that the columns of the full run are dropped.
+        replacements = []
+        for plot_builder in builders:
+            index = next(i for i, run_ in enumerate(plot_builder.runs) if run_ is run)
+            replacements.append((plot_builder, index, plot_builder.line_styles(run)))
+            plot_builder.runs.pop(index)
+        for plot_builder, index, styles in replacements:
+            plot_builder.insert_run(index, compact, keep_style_of=styles)
+        self.memory.replace(compact, compact.nbytes)
+
+    def _merge(self, run, template):
+        "Merge the mu(E) of run with earlier scans of the same sample, on the plot of mu(E)."
+        key = f'{template.title}: {template.y}'
+        xdi = run.metadata['start'].get('XDI', {})
+        edge_energy = xdi.get('Scan', {}).get('edge_energy')
+        if key not in self._models or edge_energy is None:
+            return
+        group = (
+            key,
+            xdi.get('Sample', {}).get('name'),
+            xdi.get('Element', {}).get('symbol'),
+            xdi.get('Element', {}).get('edge'),
+        )
+        merger = self._mergers.get(group)
+        if merger is None:
+            merger = ScanMerger(template.x, template.y, self.columns, default_grid(edge_energy),
+                                label=f'merged {group[1] or ""}'.strip(), redraw=self.redraw,
+                                executor=self.executor, call_soon=self.call_soon)
+            self._mergers[group] = merger
+        merger.add_run(run)
+        if len(merger) == 2:
+            (figure,) = self._models.figures(key)
+            figure.axes[0].artists.append(merger.line)
 
-    def single_plot(self, title, x, y):
+    def single_plot(self, title, x, y, normalize=False):
         axes1 = Axes()
         figure = Figure((axes1,), title=title)
-        model = Lines(x=x, ys=[y,], max_runs=10, axes=axes1)
+        lines = NormalizedLines if normalize else BMMLines
+        model = lines(x=x, ys=[y,], max_runs=10, axes=axes1, column_store=self.columns,
+                      redraw=self.redraw, executor=self.executor, max_points=self.max_points,
+                      call_soon=self.call_soon)
         return model, figure
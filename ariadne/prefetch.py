@@ -0,0 +1,148 @@
+"""
+Open runs and read the data their plots need on a pool of threads, ahead of plotting them.
+
+Viewing runs from the catalog means, for each, opening it and reading its
+primary stream, which for a run in MongoDB takes a few queries and the
+decoding of its events. Done one run after the other in the GUI thread,
+viewing 20 runs waits on 20 loads and the GUI is frozen meanwhile. A
+RunPrefetcher loads several runs at once on a bounded pool of threads,
+reading only the columns the plots of each run use, and hands each run over,
+with its columns, as soon as it is loaded.
+"""
+import concurrent.futures
+import functools
+import logging
+import threading
+
+from bluesky_widgets.utils.event import EmitterGroup, Event
+
+from .columns import RunColumns
+from .plot_specs import PLOT_SPECS
+
+logger = logging.getLogger(__name__)
+
+
+class RunPrefetcher:
+    """
+    Load runs from a catalog concurrently, and call back with each as soon as it is loaded.
+
+    Parameters
+    ----------
+    callback : Callable
+        Expected signature ``f(run, columns)``, where columns is the
+        RunColumns of the primary stream, with the fields that the run's
+        plots use already read, or None if the run has no plots.
+    plot_specs : PlotSpecs, optional
+        Default is ``PLOT_SPECS``.
+    max_workers : Integer, optional
+        Runs loaded at once. Default is 4.
+    call_soon : Callable, optional
+        Expected signature ``f(function)``, calling function with no arguments
+        in the GUI thread. callback is called, and the events emitted, that
+        way. By default, they are called in the worker threads.
+
+    Attributes
+    ----------
+    events : EmitterGroup
+        ``progress``, with ``done`` and ``total``, the runs loaded (or failed
+        or cancelled) and to load since the prefetcher was last idle.
+
+    Examples
+    --------
+
+    >>> prefetcher = RunPrefetcher(lambda run, columns: auto_plot_builder.add_run(run))
+    >>> prefetcher.events.progress.connect(lambda event: print(event.done, "of", event.total))
+    >>> prefetcher.submit(catalog, uids)
+    >>> prefetcher.cancel()  # Stop loading the runs not loaded yet.
+    """
+
+    def __init__(self, callback, plot_specs=None, max_workers=4, call_soon=None):
+        self.callback = callback
+        self.plot_specs = PLOT_SPECS if plot_specs is None else plot_specs
+        self.call_soon = call_soon
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ariadne-prefetch"
+        )
+        self.events = EmitterGroup(source=self, progress=Event)
+        self._lock = threading.Lock()
+        self._futures = set()
+        # Bumped on cancel, so that runs loading then are not handed over.
+        self._generation = 0
+        self.done = 0
+        self.total = 0
+
+    @property
+    def busy(self):
+        "Are runs being loaded?"
+        return self.done < self.total
+
+    def submit(self, catalog, uids):
+        "Load the runs with these uids from catalog, and call back with each once loaded."
+        uids = list(uids)
+        if not uids:
+            return
+        with self._lock:
+            generation = self._generation
+            self.total += len(uids)
+            for uid in uids:
+                future = self.executor.submit(self._load, catalog, uid, generation)
+                self._futures.add(future)
+                future.add_done_callback(self._futures.discard)
+        self._call(self._progress)
+
+    def cancel(self):
+        "Do not load the runs not yet loaded, nor hand over those loading."
+        with self._lock:
+            self._generation += 1
+            cancelled = sum(future.cancel() for future in list(self._futures))
+            # Those loading are counted when they finish.
+            self.done += cancelled
+        self._call(self._progress)
+
+    def close(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+    def _load(self, catalog, uid, generation):
+        "Open a run and read the fields its plots use, in a worker thread."
+        run = columns = None
+        try:
+            if generation == self._generation:
+                run = catalog[uid]
+                start = run.metadata["start"]
+                element = start.get("XDI", {}).get("Element", {}).get("symbol")
+                fields = self.plot_specs.required_fields(start.get("plan_name"), element)
+                if fields is not None:
+                    columns = RunColumns(run)
+                    for field in sorted(fields & columns.fields):
+                        # Read now, rather than when first plotted.
+                        columns[field]
+        except Exception:
+            logger.exception("Failed to load run %r", uid)
+            run = None
+        self._call(functools.partial(self._deliver, run, columns, generation))
+
+    def _deliver(self, run, columns, generation):
+        try:
+            if run is not None and generation == self._generation:
+                self.callback(run, columns)
+        except Exception:
+            logger.exception("Failed to view run %r", run.metadata["start"]["uid"])
+        finally:
+            with self._lock:
+                self.done += 1
+            self._progress()
+
+    def _progress(self):
+        with self._lock:
+            done, total = self.done, self.total
+            if done >= total:
+                # Idle: count afresh from the next submission.
+                self.done = self.total = 0
+        self.events.progress(done=done, total=total)
+
+    def _call(self, function):
+        if self.call_soon is None:
+            function()
+        else:
+            self.call_soon(function)
@@ -0,0 +1,137 @@
+"""
+Coalesce redraws of live figures and cap their rate.
+
+Without this, every event of every live run makes each view update and redraw
+every affected artist. With short dwell times this saturates the event loop.
+Instead, artists are marked dirty as data arrive, and all the dirty artists
+are redrawn together at most ``max_rate`` times per second.
+"""
+import threading
+import time
+
+
+def _call_later_in_thread(delay, func):
+    timer = threading.Timer(delay, func)
+    timer.daemon = True
+    timer.start()
+
+
+class RedrawScheduler:
+    """
+    Redraw dirty artists together, at a capped rate.
+
+    Parameters
+    ----------
+    max_rate : Number | None, optional
+        Maximum number of redraws per second. Default is 10. If None, every
+        request is passed through immediately. If 0, requests accumulate until
+        :meth:`flush` is called, which is appropriate for headless use where
+        only the final state is exported.
+    call_later : Callable, optional
+        Expected signature ``f(delay: float, func: Callable)``. Used to
+        schedule a deferred flush. The default uses a daemon thread. A GUI
+        may pass a function that schedules on its own event loop.
+
+    Attributes
+    ----------
+    requests : Integer
+        Number of redraw requests received
+    frames : Integer
+        Number of flushes that redrew at least one artist
+    redraws : Integer
+        Number of artist redraws performed
+    """
+
+    def __init__(self, max_rate=10, call_later=None):
+        self.max_rate = max_rate
+        self._call_later = call_later or _call_later_in_thread
+        self._lock = threading.Lock()
+        # Held while emitting, so that flushes from different threads do not interleave.
+        self._emit_lock = threading.RLock()
+        # Map artist uuid to artist, in the order they became dirty.
+        self._dirty = {}
+        self._pending = False
+        # While above 0, requests accumulate and the timer redraws nothing.
+        self._suspended = 0
+        self._last_flush = float("-inf")
+        self.requests = 0
+        self.frames = 0
+        self.redraws = 0
+
+    @property
+    def stats(self):
+        "Counts of requests, frames drawn, and requests merged into another redraw"
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "frames": self.frames,
+                "redraws": self.redraws,
+                "coalesced": self.requests - self.redraws - len(self._dirty),
+                "pending": len(self._dirty),
+            }
+
+    def request(self, artist):
+        "Mark an artist as needing a redraw."
+        with self._lock:
+            self.requests += 1
+            self._dirty[artist.uuid] = artist
+            if self._suspended:
+                return
+            if self.max_rate is None:
+                delay = 0
+            elif self._pending or self.max_rate == 0:
+                return
+            else:
+                delay = self._last_flush + 1 / self.max_rate - time.monotonic()
+                if delay > 0:
+                    self._pending = True
+        if delay > 0:
+            self._call_later(delay, self._on_timer)
+        else:
+            self.flush()
+
+    def suspend(self):
+        "Hold redraws until as many calls to :meth:`resume`, e.g. while replaying a run."
+        with self._lock:
+            self._suspended += 1
+
+    def resume(self):
+        "Undo one call to :meth:`suspend`, and redraw what became dirty meanwhile once none is left."
+        with self._lock:
+            self._suspended = max(self._suspended - 1, 0)
+            if self._suspended:
+                return
+        self.flush()
+
+    def discard(self, artist):
+        "Drop any pending redraw of an artist, e.g. one that was removed."
+        with self._lock:
+            self._dirty.pop(artist.uuid, None)
+
+    def flush(self):
+        """
+        Redraw every dirty artist now.
+
+        Returns
+        -------
+        artists : List
+            The artists redrawn
+        """
+        with self._emit_lock:
+            with self._lock:
+                dirty = list(self._dirty.values())
+                self._dirty.clear()
+                self._last_flush = time.monotonic()
+                if dirty:
+                    self.frames += 1
+                    self.redraws += len(dirty)
+            for artist in dirty:
+                artist.events.new_data()
+        return dirty
+
+    def _on_timer(self):
+        with self._lock:
+            self._pending = False
+            if self._suspended:
+                return
+        self.flush()
@@ -0,0 +1,116 @@
+"""
+Account for the memory held by the runs a plotter shows.
+
+A full run keeps every document of every stream (for live runs, as Python
+lists) and its columns as float64. Once a run is complete and no longer the
+newest, all a plot needs of it are the few columns it draws. When the runs
+held exceed a byte budget, the oldest are demoted to a CompactRun holding
+just those columns as float32, and the full run is dropped.
+"""
+import collections
+
+from bluesky_widgets.models.utils import lock_if_live, run_is_live
+
+from .columns import CompactRun
+
+# A Python float in a list: the object itself plus the list's pointer to it.
+_BYTES_PER_VALUE = 32
+
+
+def estimate_nbytes(run):
+    """
+    Estimate the bytes held by a run's documents or data, not counting its columns.
+
+    For live runs this counts the values in the event documents; for runs at
+    rest, the size of each stream's dataset.
+    """
+    if isinstance(run, CompactRun):
+        return run.nbytes
+    total = 0
+    if run_is_live(run):
+        with lock_if_live(run):
+            for name, doc in run.documents(fill="no"):
+                if name == "event_page":
+                    values = sum(len(value) for value in doc["data"].values())
+                    values += sum(len(value) for value in doc["timestamps"].values())
+                elif name == "event":
+                    values = len(doc["data"]) + len(doc["timestamps"])
+                else:
+                    continue
+                total += values * _BYTES_PER_VALUE
+        return total
+    for stream_name in run:
+        total += run[stream_name].to_dask().nbytes
+    return total
+
+
+class MemoryBudget:
+    """
+    The bytes held by each completed run of a plotter, against a budget.
+
+    Parameters
+    ----------
+    budget : Integer | None
+        Bytes. None means no limit.
+
+    Examples
+    --------
+
+    >>> memory = MemoryBudget(1000)
+    >>> memory.add(run, 800)
+    >>> memory.add(other_run, 800)
+    >>> list(memory.candidates())  # Demote run to get under budget.
+    [run]
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        # Map run uid to [run, bytes], oldest first.
+        self._runs = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._runs)
+
+    def __contains__(self, uid):
+        return uid in self._runs
+
+    @property
+    def total(self):
+        "Bytes held by all the runs accounted for"
+        return sum(nbytes for _, nbytes in self._runs.values())
+
+    @property
+    def excess(self):
+        "Bytes over budget, or 0"
+        if self.budget is None:
+            return 0
+        return max(self.total - self.budget, 0)
+
+    def add(self, run, nbytes):
+        "Account for a run, as the newest."
+        uid = run.metadata["start"]["uid"]
+        self._runs[uid] = [run, nbytes]
+        self._runs.move_to_end(uid)
+
+    def replace(self, run, nbytes):
+        "Account for a run in place of the one with the same uid, keeping its age."
+        self._runs[run.metadata["start"]["uid"]] = [run, nbytes]
+
+    def discard(self, uid):
+        self._runs.pop(uid, None)
+
+    def uids(self):
+        return list(self._runs)
+
+    def candidates(self):
+        """
+        Yield full runs to demote, oldest first, while over budget.
+
+        The newest run is never a candidate. Check :attr:`excess` again
+        between demotions: iteration stops once it is 0.
+        """
+        for run, _ in list(self._runs.values())[:-1]:
+            if not self.excess:
+                return
+            if not isinstance(run, CompactRun):
+                yield run
@@ -0,0 +1,403 @@
+"""
+A local index of the start documents of BMM runs, for searching without the catalog.
+
+Searching a catalog of years of runs, by element, edge, sample and so on,
+means a query of the database each time, and listing the results means
+reading the start and stop documents of each. A RunIndex keeps what the
+search tab searches by and shows in an SQLite database, with a full-text
+index over the words of the plan name, element, edge, sample, purpose and
+SAF number, so the search tab can find runs and list them without the
+catalog, which it reads only for the runs selected.
+
+The index is built incrementally: from a catalog, reading only the runs
+started since the last time, and from the live document stream.
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+from .search_rows import fetch_metadata
+
+# Fields searched by exact value: their key in the start document, and their column in the index.
+FIELDS = {
+    "plan_name": "plan_name",
+    "scan_id": "scan_id",
+    "purpose": "purpose",
+    "XDI.Element.symbol": "element",
+    "XDI.Element.edge": "edge",
+    "XDI.Sample.name": "sample",
+    "XDI.Facility.SAF": "saf",
+}
+# Fields offered for search in the search tab
+SEARCH_FIELDS = ("XDI.Element.symbol", "XDI.Element.edge", "XDI.Sample.name", "plan_name", "scan_id", "purpose")
+# Columns with a full-text index
+TEXT_COLUMNS = ("plan_name", "element", "edge", "sample", "purpose", "saf", "scan_id")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    uid TEXT UNIQUE NOT NULL,
+    time REAL NOT NULL,
+    stop_time REAL,
+    motors TEXT,
+    scan_id INTEGER,
+    plan_name TEXT,
+    purpose TEXT,
+    element TEXT COLLATE NOCASE,
+    edge TEXT COLLATE NOCASE,
+    sample TEXT COLLATE NOCASE,
+    saf TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_time ON runs (time);
+CREATE INDEX IF NOT EXISTS runs_scan_id ON runs (scan_id);
+CREATE INDEX IF NOT EXISTS runs_element ON runs (element);
+CREATE VIRTUAL TABLE IF NOT EXISTS runs_text USING fts5({});
+CREATE TABLE IF NOT EXISTS synced (catalog TEXT PRIMARY KEY, time REAL NOT NULL);
+""".format(
+    ", ".join(TEXT_COLUMNS)
+)
+
+
+def default_run_index_path():
+    "Path of the run index on this host"
+    return os.path.join(tempfile.gettempdir(), "ariadne", "runs.sqlite")
+
+
+def _get(doc, key):
+    "Get a value from nested dicts by a dotted key, or None."
+    for part in key.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _text_query(text):
+    "An FTS5 query for runs with all the words in text, each as a prefix."
+    return " ".join('"{}"*'.format(word.replace('"', '""')) for word in text.split())
+
+
+class UnsupportedQuery(ValueError):
+    "A catalog query that the index cannot answer"
+
+
+class RunIndex:
+    """
+    An SQLite index of the start documents of runs, searchable by field and by text.
+
+    Parameters
+    ----------
+    path : String, optional
+        Default is ":memory:", an index kept only by this object.
+
+    Examples
+    --------
+
+    Build it from a catalog, then keep it up to date from the live documents.
+
+    >>> index = RunIndex(default_run_index_path())
+    >>> index.update_from_catalog(catalog)
+    >>> dispatcher.subscribe(index.observe)
+
+    Find runs.
+
+    >>> index.search("fe xafs")
+    ['ac694ff6-2444-49af-8898-bfa23d99c28c', ...]
+    >>> index.search(fields={"XDI.Element.symbol": "Fe"}, since=1625122123)
+    ['ac694ff6-2444-49af-8898-bfa23d99c28c', ...]
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        directory = os.path.dirname(path) if path != ":memory:" else None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Used from worker threads too, one at a time.
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM runs").fetchone()[0]
+
+    def __contains__(self, uid):
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM runs WHERE uid = ?", (uid,)).fetchone() is not None
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def add(self, runs):
+        """
+        Add runs, or replace them.
+
+        Parameters
+        ----------
+        runs : Iterable[Tuple[Dict, Dict | None]]
+            (start, stop) documents. stop is None while a run is open.
+        """
+        with self._lock, self._connection:
+            for start, stop in runs:
+                self._add(start, stop)
+
+    def observe(self, name, doc):
+        "A document callback adding runs as they start and recording when they stop."
+        if name == "start":
+            self.add([(doc, None)])
+        elif name == "stop":
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "UPDATE runs SET stop_time = ? WHERE uid = ?", (doc["time"], doc["run_start"])
+                )
+
+    def update_from_catalog(self, catalog, batch_size=500):
+        """
+        Add the runs of a catalog started since it was last read, and the stop documents of open runs.
+
+        Returns
+        -------
+        added : Integer
+            Number of runs read
+        """
+        name = getattr(catalog, "name", None) or ""
+        with self._lock:
+            row = self._connection.execute("SELECT time FROM synced WHERE catalog = ?", (name,)).fetchone()
+            cursor = self._connection.execute("SELECT uid FROM runs WHERE stop_time IS NULL")
+            open_uids = [uid for (uid,) in cursor]
+        newest = None if row is None else row[0]
+        runs = catalog if newest is None else catalog.search({"time": {"$gt": newest}})
+        added = 0
+        batch = []
+        for uid in list(runs) + open_uids:
+            batch.append(uid)
+            if len(batch) == batch_size:
+                newest = self._add_batch(catalog, batch, newest)
+                added += len(batch)
+                batch = []
+        if batch:
+            newest = self._add_batch(catalog, batch, newest)
+            added += len(batch)
+        # Only once all are added, so that an interrupted update is done again next time.
+        if newest is not None:
+            with self._lock, self._connection:
+                self._connection.execute("INSERT OR REPLACE INTO synced VALUES (?, ?)", (name, newest))
+        return added
+
+    def synced(self, catalog):
+        "Has the index been updated from this catalog before?"
+        name = getattr(catalog, "name", None) or ""
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM synced WHERE catalog = ?", (name,)).fetchone()
+        return row is not None
+
+    def search(self, text=None, since=None, until=None, fields=None, offset=0, limit=None):
+        """
+        Find runs, newest first.
+
+        Parameters
+        ----------
+        text : String, optional
+            Words, each matching the start of a word in any of TEXT_COLUMNS
+        since, until : Number, optional
+            Bounds on the start time, as a timestamp
+        fields : Dict, optional
+            Values of FIELDS, matched exactly (but for case)
+        offset, limit : Integer, optional
+            Positions of the runs to return, among all those found
+
+        Returns
+        -------
+        uids : List[String]
+        """
+        where, parameters = self._where(text, since, until, fields)
+        sql = f"SELECT uid FROM runs {where} ORDER BY time DESC"
+        if limit is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            parameters += [-1 if limit is None else limit, offset]
+        with self._lock:
+            return [uid for (uid,) in self._connection.execute(sql, parameters)]
+
+    def count(self, text=None, since=None, until=None, fields=None):
+        "Count the runs that :meth:`search` finds."
+        where, parameters = self._where(text, since, until, fields)
+        with self._lock:
+            return self._connection.execute(f"SELECT count(*) FROM runs {where}", parameters).fetchone()[0]
+
+    def metadata(self, uids):
+        """
+        The parts of the start and stop documents of runs kept in the index.
+
+        Enough to format a row for the table of search results.
+
+        Returns
+        -------
+        metadata : Dict[String, Tuple[Dict, Dict | None]]
+            Map uid to (start, stop). Runs not in the index are left out.
+        """
+        metadata = {}
+        with self._lock:
+            for i in range(0, len(uids), 500):
+                batch = list(uids[i:i + 500])
+                cursor = self._connection.execute(
+                    "SELECT uid, time, stop_time, motors, scan_id, plan_name FROM runs WHERE uid IN ({})".format(
+                        ", ".join("?" * len(batch))
+                    ),
+                    batch,
+                )
+                for uid, time_, stop_time, motors, scan_id, plan_name in cursor:
+                    start = {"uid": uid, "time": time_}
+                    if motors is not None:
+                        start["motors"] = json.loads(motors)
+                    if scan_id is not None:
+                        start["scan_id"] = scan_id
+                    if plan_name is not None:
+                        start["plan_name"] = plan_name
+                    stop = None if stop_time is None else {"run_start": uid, "time": stop_time}
+                    metadata[uid] = (start, stop)
+        return metadata
+
+    @staticmethod
+    def parse_query(query):
+        """
+        Translate a catalog query, as made by the search tab, to keyword arguments of :meth:`search`.
+
+        Raises UnsupportedQuery for anything but a time range, a ``$text``
+        search and the values of FIELDS.
+        """
+        kwargs = {"fields": {}}
+        for key, value in query.items():
+            if key == "time" and isinstance(value, dict) and set(value) <= {"$gte", "$gt", "$lt"}:
+                kwargs["since"] = value.get("$gte", value.get("$gt"))
+                kwargs["until"] = value.get("$lt")
+            elif key == "$text" and isinstance(value, dict) and set(value) == {"$search"}:
+                kwargs["text"] = value["$search"]
+            elif key in FIELDS and isinstance(value, (str, int)):
+                kwargs["fields"][key] = value
+            else:
+                raise UnsupportedQuery(f"Cannot search the index for {key}: {value!r}")
+        return kwargs
+
+    def _add_batch(self, catalog, uids, newest):
+        metadata = fetch_metadata(catalog, uids)
+        self.add(metadata.values())
+        for start, _ in metadata.values():
+            if newest is None or start["time"] > newest:
+                newest = start["time"]
+        return newest
+
+    def _add(self, start, stop):
+        "Add or replace a run. Call with the lock held, in a transaction."
+        values = {
+            "uid": start["uid"],
+            "time": start["time"],
+            "stop_time": None if stop is None else stop["time"],
+            "motors": None if start.get("motors") is None else json.dumps(list(start["motors"])),
+        }
+        for key, column in FIELDS.items():
+            value = _get(start, key)
+            values[column] = value if value is None or column == "scan_id" else str(value)
+        existing = self._connection.execute("SELECT id FROM runs WHERE uid = ?", (start["uid"],)).fetchone()
+        if existing is not None:
+            self._connection.execute("DELETE FROM runs WHERE id = ?", existing)
+            self._connection.execute("DELETE FROM runs_text WHERE rowid = ?", existing)
+        cursor = self._connection.execute(
+            "INSERT INTO runs ({}) VALUES ({})".format(", ".join(values), ", ".join("?" * len(values))),
+            list(values.values()),
+        )
+        self._connection.execute(
+            "INSERT INTO runs_text (rowid, {}) VALUES (?, {})".format(
+                ", ".join(TEXT_COLUMNS), ", ".join("?" * len(TEXT_COLUMNS))
+            ),
+            [cursor.lastrowid] + [None if values[c] is None else str(values[c]) for c in TEXT_COLUMNS],
+        )
+
+    @staticmethod
+    def _where(text, since, until, fields):
+        clauses = []
+        parameters = []
+        if text and text.split():
+            clauses.append("id IN (SELECT rowid FROM runs_text WHERE runs_text MATCH ?)")
+            parameters.append(_text_query(text))
+        if since is not None:
+            clauses.append("time >= ?")
+            parameters.append(since)
+        if until is not None:
+            clauses.append("time < ?")
+            parameters.append(until)
+        for key, value in (fields or {}).items():
+            column = FIELDS[key]
+            if column == "scan_id":
+                try:
+                    parameters.append(int(value))
+                except ValueError:
+                    # Not a number, e.g. while one is typed: no run has it.
+                    clauses.append("0")
+                    continue
+                clauses.append("scan_id = ?")
+            else:
+                clauses.append(f"{column} = ? COLLATE NOCASE")
+                parameters.append(str(value).strip())
+        return ("WHERE " + " AND ".join(clauses)) if clauses else "", parameters
+
+
+class IndexedCatalog:
+    """
+    The runs of a catalog found by searching a RunIndex.
+
+    It stands in for the catalog for the search tab: searches of it and the
+    rows of its results come from the index, and only runs got by uid, e.g.
+    those selected, come from the catalog. Searches the index cannot answer,
+    e.g. for a list of uids, are searches of the catalog.
+
+    Parameters
+    ----------
+    catalog : Catalog
+    index : RunIndex
+    query : Dict, optional
+        As for ``catalog.search``. Default is all the runs in the index.
+    """
+
+    def __init__(self, catalog, index, query=None):
+        self.catalog = catalog
+        self.index = index
+        self.query = dict(query or {})
+        self._kwargs = RunIndex.parse_query(self.query)
+        self.name = getattr(catalog, "name", None)
+        self._length = None
+
+    def __repr__(self):
+        return f"<IndexedCatalog {self.query!r} of {self.name!r}>"
+
+    def search(self, query):
+        combined = {**self.query, **query}
+        try:
+            return type(self)(self.catalog, self.index, combined)
+        except UnsupportedQuery:
+            return self.catalog.search(combined)
+
+    def reload(self):
+        self._length = None
+
+    def __len__(self):
+        if self._length is None:
+            self._length = self.index.count(**self._kwargs)
+        return self._length
+
+    def __iter__(self):
+        yield from self.index.search(**self._kwargs)
+
+    def __getitem__(self, uid):
+        return self.catalog[uid]
+
+    def uids_at(self, offset, limit):
+        "The uids of the runs at some positions in the results, for fetch_uids."
+        return self.index.search(offset=offset, limit=limit, **self._kwargs)
+
+    def run_metadata(self, uids):
+        "The (start, stop) of runs from the index, for fetch_metadata."
+        return self.index.metadata(uids)
@@ -0,0 +1,417 @@
+"""
+Rows of the table of search results, fetched in batches and cached by run uid.
+
+Formatting a row needs only a run's start and stop documents, but getting a
+BlueskyRun from a catalog and describing it, one run per row, is slow. Here
+the start and stop documents of a batch of runs are fetched together (with
+one query of each collection, for MongoDB-backed catalogs), and the formatted
+rows are kept in an LRU cache keyed by uid, across queries. The rows of runs
+still open when fetched are fetched again once their stop document is seen,
+or after a while.
+
+For catalogs too large to list, PagedSearchResults reads the results a page
+at a time, by position, and keeps only a bounded number of pages, loading
+those around the rows on view in the background.
+"""
+import collections
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+
+from bluesky_widgets.models.search import SearchResults
+from bluesky_widgets.utils.event import Event
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_metadata(catalog, uids):
+    """
+    Fetch the start and stop documents of runs in a catalog, in bulk where possible.
+
+    Parameters
+    ----------
+    catalog : Catalog
+    uids : List[String]
+
+    Returns
+    -------
+    metadata : Dict[String, Tuple[Dict, Dict | None]]
+        Map uid to (start, stop). Runs not found are left out.
+    """
+    if hasattr(catalog, "run_metadata"):
+        # E.g. an IndexedCatalog, which has them at hand.
+        return catalog.run_metadata(uids)
+    if hasattr(catalog, "_run_start_collection") and hasattr(catalog, "_run_stop_collection"):
+        # MongoDB: one query per collection for the whole batch.
+        projection = {"_id": False}
+        starts = {
+            doc["uid"]: doc for doc in catalog._run_start_collection.find({"uid": {"$in": list(uids)}}, projection)
+        }
+        stops = {
+            doc["run_start"]: doc
+            for doc in catalog._run_stop_collection.find({"run_start": {"$in": list(starts)}}, projection)
+        }
+        return {uid: (start, stops.get(uid)) for uid, start in starts.items()}
+    entries = getattr(catalog, "_entries", None)
+    metadata = {}
+    for uid in uids:
+        if isinstance(entries, dict) and uid in entries:
+            # In-memory catalogs (e.g. JSONL) keep the documents in their entries.
+            entry_metadata = entries[uid].describe()["metadata"]
+        else:
+            try:
+                entry_metadata = catalog[uid].metadata
+            except KeyError:
+                continue
+        metadata[uid] = (entry_metadata["start"], entry_metadata.get("stop"))
+    return metadata
+
+
+def fetch_uids(catalog, offset, limit):
+    """
+    List the uids of the runs at some positions in a catalog, in its order.
+
+    For MongoDB-backed catalogs, the server skips to the position, and an
+    IndexedCatalog looks it up in its index, so the time taken does not grow
+    with the number of runs before it. Other catalogs (e.g. JSONL or msgpack
+    files) are iterated over from the start, so for those it does: reading
+    deep into a large catalog of that kind is slow. Search such catalogs
+    through a RunIndex instead.
+
+    Parameters
+    ----------
+    catalog : Catalog
+    offset : Integer
+    limit : Integer
+
+    Returns
+    -------
+    uids : List[String]
+    """
+    if hasattr(catalog, "uids_at"):
+        return catalog.uids_at(offset, limit)
+    if hasattr(catalog, "_run_start_collection"):
+        # As databroker iterates over the catalog: newest first.
+        find_kwargs = {"sort": [("time", -1)]}
+        find_kwargs.update(getattr(catalog, "_find_kwargs", {}))
+        cursor = catalog._run_start_collection.find(
+            catalog._query, {"uid": True, "_id": False}, skip=offset, limit=limit, **find_kwargs
+        )
+        return [doc["uid"] for doc in cursor]
+    return list(itertools.islice(iter(catalog), offset, offset + limit))
+
+
+class RowCache:
+    """
+    Formatted rows of search results, keyed by run uid, least recently used evicted first.
+
+    Parameters
+    ----------
+    row_factory : Callable
+        Expected signature ``f(start, stop) -> tuple``, where stop may be None
+    max_rows : Integer, optional
+        Default is 10000.
+    batch_size : Integer, optional
+        Rows fetched together on a miss. Default is 100.
+    open_ttl : Number, optional
+        Seconds after which the row of a run open when fetched is fetched
+        again, in case its stop document was not seen. Default is 30.
+
+    Examples
+    --------
+
+    >>> rows = RowCache(extract_results_row_from_metadata)
+    >>> rows.get(catalog, uids)
+    [('18511', 'scan_nd xafs transmission', ...), ...]
+    >>> dispatcher.subscribe(rows.observe)  # Refresh rows of runs as they stop.
+    """
+
+    def __init__(self, row_factory, max_rows=10000, batch_size=100, open_ttl=30.0):
+        self.row_factory = row_factory
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.open_ttl = open_ttl
+        self._lock = threading.Lock()
+        # Map uid to (row, time fetched if the run was open, else None).
+        self._rows = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, uid):
+        with self._lock:
+            return self._cached(uid) is not None
+
+    @property
+    def stats(self):
+        return {"rows": len(self), "hits": self.hits, "misses": self.misses, "batches": self.batches}
+
+    def get(self, catalog, uids):
+        """
+        Return the rows of runs, fetching those not cached in one batch.
+
+        Returns
+        -------
+        rows : List[Tuple | None]
+            In the order of uids. None for runs not found.
+        """
+        rows = {}
+        missing = []
+        with self._lock:
+            for uid in uids:
+                row = self._cached(uid)
+                if row is None:
+                    missing.append(uid)
+                else:
+                    rows[uid] = row
+                    self._rows.move_to_end(uid)
+            self.hits += len(rows)
+            self.misses += len(missing)
+        if missing:
+            rows.update(self._fetch(catalog, missing))
+        return [rows.get(uid) for uid in uids]
+
+    def invalidate(self, uid):
+        "Forget the row of a run, e.g. because it stopped."
+        with self._lock:
+            self._rows.pop(uid, None)
+
+    def observe(self, name, doc):
+        "A document callback that invalidates the rows of runs as they stop."
+        if name == "stop":
+            self.invalidate(doc["run_start"])
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+
+    def _cached(self, uid):
+        try:
+            row, opened = self._rows[uid]
+        except KeyError:
+            return None
+        if opened is not None and time.monotonic() - opened > self.open_ttl:
+            return None
+        return row
+
+    def _fetch(self, catalog, uids):
+        fetched = {}
+        now = time.monotonic()
+        for i in range(0, len(uids), self.batch_size):
+            batch = uids[i:i + self.batch_size]
+            metadata = fetch_metadata(catalog, batch)
+            with self._lock:
+                self.batches += 1
+                for uid, (start, stop) in metadata.items():
+                    row = fetched[uid] = self.row_factory(start, stop)
+                    self._rows[uid] = (row, now if stop is None else None)
+                    self._rows.move_to_end(uid)
+                while len(self._rows) > self.max_rows:
+                    self._rows.popitem(last=False)
+        return fetched
+
+
+class PagedSearchResults(SearchResults):
+    """
+    SearchResults read a page of rows at a time, keeping a bounded number of pages.
+
+    Nothing is read from the catalog when it is set, or reloaded, but its
+    length. Rows are read by page, from their position in the catalog, and
+    the pages least recently used are dropped, so the time to show the
+    results and the memory they take do not grow with their number.
+
+    A view asks for the rows it shows with :meth:`request`, which loads the
+    pages holding them, and ``prefetch`` pages either side, in the
+    background, and reads the rows it has with :meth:`peek`. The
+    ``page_loaded`` event, emitted from a worker thread, tells it which rows
+    to show again. :meth:`get_data` and :meth:`get_uid_by_row` wait for the
+    page instead.
+
+    Parameters
+    ----------
+    columns : Tuple
+        As for SearchResults. Only the headings are used.
+    rows : RowCache
+    page_size : Integer, optional
+        Default is ``rows.batch_size``.
+    prefetch : Integer, optional
+        Pages loaded on each side of those requested. Default is 1.
+    max_pages : Integer, optional
+        Pages kept. Should be more than a view shows at once, plus
+        ``2 * prefetch``. Default is 20.
+    executor : concurrent.futures.Executor, optional
+        Loads the pages. By default, a pool of two threads of this object's own.
+
+    Examples
+    --------
+
+    >>> results = PagedSearchResults(columns, RowCache(extract_results_row_from_metadata))
+    >>> results.catalog = catalog.search(query)
+    >>> results.request(0, 40)  # The rows on view
+    >>> results.peek(0, 0)  # None until the first page is loaded
+    '18511'
+    """
+
+    def __init__(self, columns, rows, page_size=None, prefetch=1, max_pages=20, executor=None):
+        self.rows = rows
+        self.page_size = page_size or rows.batch_size
+        self.prefetch = prefetch
+        self.max_pages = max_pages
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="ariadne-search-pages"
+            )
+        self.executor = executor
+        self._lock = threading.Lock()
+        # Map page number to a list of (uid, row).
+        self._pages = collections.OrderedDict()
+        self._pending = {}
+        self._wanted = range(0)
+        # Bumped whenever the catalog changes, so that pages of the old one are dropped.
+        self._generation = 0
+        self._length = 0
+        super().__init__(columns)
+        self.events.add(page_loaded=Event)
+        self.events.begin_reset.connect(self._on_begin_reset)
+
+    @property
+    def catalog(self):
+        "Catalog of current results"
+        return self._catalog
+
+    @catalog.setter
+    def catalog(self, catalog):
+        self.set_catalog(catalog)
+
+    def set_catalog(self, catalog, length=None):
+        """
+        Set the catalog of results.
+
+        Parameters
+        ----------
+        catalog : Catalog
+        length : Integer, optional
+            The length of the catalog, if known, e.g. counted in a worker thread
+        """
+        self.events.begin_reset()
+        with self._lock:
+            self._catalog = catalog
+            self._length = length
+        self._selected_rows.clear()
+        self.events.end_reset()
+
+    def _on_begin_reset(self, event):
+        # The catalog is about to change, or to be reloaded (by RunSearch).
+        with self._lock:
+            self._generation += 1
+            self._length = None
+            self._pages.clear()
+            self._pending.clear()
+            self._wanted = range(0)
+
+    @property
+    def length(self):
+        "Number of results"
+        if self._length is None:
+            self._length = len(self._catalog)
+        return self._length
+
+    @property
+    def pages(self):
+        "Numbers of the pages loaded"
+        with self._lock:
+            return sorted(self._pages)
+
+    def request(self, first, last):
+        """
+        Load the pages holding rows first to last (inclusive), and those around them, in the background.
+
+        Pages loading that are no longer wanted are not loaded, if not started.
+        """
+        length = self.length
+        if length == 0:
+            return
+        last_page = (length - 1) // self.page_size
+        first_page = max(first // self.page_size - self.prefetch, 0)
+        stop_page = min(last // self.page_size + self.prefetch, last_page) + 1
+        with self._lock:
+            self._wanted = range(first_page, stop_page)
+            # Nearest the requested rows first.
+            pages = sorted(self._wanted, key=lambda page: page < first // self.page_size)
+            for page in pages:
+                if page in self._pages:
+                    self._pages.move_to_end(page)
+                elif page not in self._pending:
+                    self._pending[page] = self.executor.submit(self._load_page, page, self._generation)
+
+    def peek(self, row, column):
+        "Return the content of a cell if its page is loaded, else None, without waiting."
+        with self._lock:
+            page = self._pages.get(row // self.page_size)
+        if page is None:
+            return None
+        index = row % self.page_size
+        if index >= len(page):
+            # The catalog got shorter since its length was taken.
+            return None
+        row_content = page[index][1]
+        return None if row_content is None else row_content[column]
+
+    def get_uid_by_row(self, row):
+        page = self._page(row // self.page_size) if 0 <= row < self.length else None
+        if page is None or row % self.page_size >= len(page):
+            raise ValueError(f"Cannot get row {row}. Catalog has {self.length} rows.")
+        return page[row % self.page_size][0]
+
+    def get_data(self, row, column):
+        "Return the content of a cell, waiting for its page, or None if there is no such row (any more)."
+        page = self._page(row // self.page_size)
+        if page is None or row % self.page_size >= len(page):
+            return None
+        uid, row_content = page[row % self.page_size]
+        if row_content is None:
+            raise KeyError(uid)
+        return row_content[column]
+
+    def _page(self, page):
+        "Return a page, loading it now if need be."
+        with self._lock:
+            if page in self._pages:
+                self._pages.move_to_end(page)
+                return self._pages[page]
+            generation = self._generation
+        return self._load_page(page, generation, force=True)
+
+    def _load_page(self, page, generation, force=False):
+        with self._lock:
+            if generation != self._generation:
+                return None
+            if not force and page not in self._wanted:
+                # Scrolled past it before it was loaded.
+                self._pending.pop(page, None)
+                return None
+            catalog = self._catalog
+        try:
+            uids = fetch_uids(catalog, page * self.page_size, self.page_size)
+            content = list(zip(uids, self.rows.get(catalog, uids)))
+        except Exception:
+            logger.exception("Failed to load page %d of search results", page)
+            with self._lock:
+                self._pending.pop(page, None)
+            raise
+        with self._lock:
+            if generation != self._generation:
+                return content
+            self._pending.pop(page, None)
+            self._pages[page] = content
+            self._pages.move_to_end(page)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        first = page * self.page_size
+        self.events.page_loaded(first=first, last=first + len(content) - 1)
+        return content
@@ -1,3 +1,7 @@
+from .plot_specs import PLOT_SPECS
+from .run_index import default_run_index_path
+from .search_rows import RowCache
+
 headings = (
     "Scan ID",
     "Plan Name",
@@ -12,11 +16,16 @@ def extract_results_row_from_run(run):
     """
     Given a BlueskyRun, format a row for the table of search results.
     """
+    metadata = run.metadata
+    return extract_results_row_from_metadata(metadata["start"], metadata["stop"])
+
+
+def extract_results_row_from_metadata(start, stop):
+    """
+    Given the start and stop documents of a run (stop may be None), format a row for the table of search results.
+    """
     from datetime import datetime
 
-    metadata = run.describe()["metadata"]
-    start = metadata["start"]
-    stop = metadata["stop"]
     start_time = datetime.fromtimestamp(start["time"])
     motors = start.get("motors", "-")
     if stop is None:
@@ -36,12 +45,41 @@ def extract_results_row_from_run(run):
 
 
 columns = (headings, extract_results_row_from_run)
+# Rows of search results, formatted from the runs' start and stop documents, cached across queries
+rows = RowCache(extract_results_row_from_metadata)
 
 
 class Settings:
     columns = columns
+    rows = rows
     catalog = None
+    # Name of a catalog to open when first searched, if catalog is None
+    catalog_name = None
     subscribe_to = []
+    # Which plots to make for each plan, for all the plotters (main loads another table with --plot-specs)
+    plot_specs = PLOT_SPECS
+    # Local index of the runs' start documents, searched instead of the catalog (None: search the catalog)
+    run_index_path = default_run_index_path()
+    # Build each tab, and the models it shows, only when it is first shown
+    lazy_tabs = True
+    # Documents queued per live run before the sources are held back, and delivered to the GUI per batch
+    ingest_queue = 1000
+    ingest_batch = 200
+    # Consecutive event pages are merged, up to this many rows or this many seconds after the first
+    coalesce_rows = 50
+    coalesce_latency = 0.2
+    # Live runs keep only the primary stream and the fields plotted; keep their timestamps too?
+    keep_timestamps = False
+    # Maximum redraws per second of live plots
+    redraw_rate = 10
+    # Threads computing plot data, off the GUI thread (None: as many as the executor likes)
+    plot_workers = None
+    # Runs selected for viewing loaded at once
+    view_workers = 4
+    # Lines are downsampled to about this many points for display (None: never)
+    max_plot_points = 5000
+    # Bytes of completed runs each plotter holds before demoting the oldest to compact columns
+    plot_memory_budget = 256 * 2**20
 
 
 SETTINGS = Settings()
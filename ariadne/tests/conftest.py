@@ -0,0 +1,68 @@
+import time
+
+import event_model
+import numpy
+import pytest
+
+
+def xafs_documents(
+    plan_name="scan_nd xafs fluorescence",
+    element="Fe",
+    num=200,
+    deadtime=0.0,
+    sample="sample",
+    seed=0,
+):
+    """
+    Generate the documents of a synthetic BMM xafs run, one event_page per point.
+
+    The absorption is a smooth step at 7112 eV, as for the Fe K edge.
+    """
+    rng = numpy.random.default_rng(seed)
+    energy = numpy.linspace(6912.0, 7912.0, num)
+    mu = 0.2 + 0.001 * (energy - 7112) / 100 + 1 / (1 + numpy.exp(-(energy - 7112) / 2))
+    I0 = numpy.full(num, 1e5)
+    It = I0 * numpy.exp(-mu)
+    Ir = It * 0.5
+    channels = numpy.outer(numpy.arange(1, 5), 1000 * mu + rng.normal(0, 1, num))
+    data = {"dcm_energy": energy, "I0": I0, "It": It, "Ir": Ir, "dwti_dwell_time": numpy.full(num, 0.5)}
+    data.update({f"{element}{i + 1}": channels[i] for i in range(4)})
+
+    bundle = event_model.compose_run(
+        metadata={
+            "plan_name": plan_name,
+            "XDI": {
+                "Element": {"symbol": element, "edge": "K"},
+                "Sample": {"name": sample},
+                "Scan": {"edge_energy": 7112.0},
+            },
+        },
+    )
+    yield "start", bundle.start_doc
+    data_keys = {key: {"source": "synthetic", "dtype": "number", "shape": []} for key in data}
+    configuration = {
+        "xs": {
+            "data": {f"xs_{element}{i}_deadtime": deadtime for i in range(1, 5)},
+            "timestamps": {f"xs_{element}{i}_deadtime": 0 for i in range(1, 5)},
+            "data_keys": {
+                f"xs_{element}{i}_deadtime": {"source": "synthetic", "dtype": "number", "shape": []}
+                for i in range(1, 5)
+            },
+        }
+    }
+    descriptor_bundle = bundle.compose_descriptor(
+        name="primary", data_keys=data_keys, configuration=configuration, object_keys={"xs": list(data)}
+    )
+    yield "descriptor", descriptor_bundle.descriptor_doc
+    now = time.time()
+    for i in range(num):
+        row = {key: [float(value[i])] for key, value in data.items()}
+        yield "event_page", descriptor_bundle.compose_event_page(
+            data=row, timestamps={key: [now] for key in row}, seq_num=[i + 1], time=[now + i]
+        )
+    yield "stop", bundle.compose_stop()
+
+
+@pytest.fixture
+def fluorescence_documents():
+    return list(xafs_documents())
@@ -0,0 +1,56 @@
+import functools
+import io
+from pathlib import Path
+
+from databroker._drivers.jsonl import BlueskyJSONLCatalog
+
+from ..backfill import Checkpoint, Progress, backfill
+from ..thumbnail_cache import ThumbnailCache
+
+UIDS = ["1dccff46-2576-4da2-8971-4de1ee4e98b7", "d748dbdc-cec4-4211-b626-801f1799cb56"]
+
+
+def test_backfill_resumes_from_checkpoint(tmp_path):
+    open_catalog = functools.partial(BlueskyJSONLCatalog, f"{Path(__file__).parent.resolve()}/*.jsonl", name="bmm")
+    root = tmp_path / "thumbnails"
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint"))
+    checkpoint.add(UIDS[0])
+    cache = ThumbnailCache(str(root))
+    output = io.StringIO()
+
+    failed = backfill(
+        open_catalog,
+        UIDS,
+        root=str(root),
+        max_workers=2,
+        checkpoint=checkpoint,
+        cache=cache,
+        progress=Progress(1, stream=output),
+    )
+    assert failed == {}
+    # Only the run not in the checkpoint was rendered.
+    assert [path.name for path in root.iterdir() if path.is_dir()] == [UIDS[1]]
+    assert UIDS[1] in cache
+    assert Checkpoint(str(tmp_path / "checkpoint")).done == set(UIDS)
+    assert "1/1 runs (0 failed)" in output.getvalue()
+    assert "runs/s" in output.getvalue()
+
+
+def test_backfill_skips_current_thumbnails(tmp_path):
+    open_catalog = functools.partial(BlueskyJSONLCatalog, f"{Path(__file__).parent.resolve()}/*.jsonl", name="bmm")
+    root = tmp_path / "thumbnails"
+    # As if the previews service had rendered the first run already.
+    (root / UIDS[0]).mkdir(parents=True)
+    rendered = root / UIDS[0] / "plot.png"
+    rendered.write_bytes(b"x")
+    cache = ThumbnailCache(str(root))
+    cache.record(UIDS[0], open_catalog()[UIDS[0]].metadata["stop"], [str(rendered)])
+
+    failed = backfill(
+        open_catalog, UIDS, root=str(root), max_workers=2, cache=cache, progress=Progress(2, stream=io.StringIO())
+    )
+    assert failed == {}
+    assert [path.name for path in (root / UIDS[0]).iterdir()] == ["plot.png"]
+    assert list((root / UIDS[1]).iterdir())
+    assert cache.is_current(UIDS[0], open_catalog()[UIDS[0]].metadata["stop"])
+    assert UIDS[1] in cache
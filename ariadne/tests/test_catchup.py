@@ -0,0 +1,217 @@
+import json
+import threading
+import time
+
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..catchup import CatchUpSource, RunStartIndex
+from ..plots import AutoBMMPlot
+from .conftest import xafs_documents
+
+TOPIC = "bmm.bluesky.runengine.documents"
+
+
+class FakeMessage:
+    def __init__(self, topic, partition, offset, value):
+        self._topic, self._partition, self._offset, self._value = topic, partition, offset, value
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def error(self):
+        return None
+
+
+class FakeBroker:
+    "An in-process stand-in for a Kafka broker: topics of partitions of messages."
+
+    def __init__(self, partitions=1):
+        self.partitions = partitions
+        self.topics = {}
+        self.lock = threading.Lock()
+
+    def produce(self, topic, value, partition=0):
+        with self.lock:
+            log = self.topics.setdefault(topic, [[] for _ in range(self.partitions)])[partition]
+            log.append(value)
+            return len(log) - 1
+
+
+class FakeConsumer:
+    "The part of confluent_kafka.Consumer that CatchUpSource uses, reading from a FakeBroker."
+
+    def __init__(self, broker, stall=0):
+        self.broker = broker
+        self.positions = {}
+        self.closed = False
+        # Number of polls after assigning that find nothing, as with a real
+        # broker still fetching.
+        self.stall = stall
+
+    def list_topics(self, topic):
+        partitions = {i: None for i in range(self.broker.partitions)}
+        return type("Metadata", (), {"topics": {topic: type("Topic", (), {"partitions": partitions})}})
+
+    def get_watermark_offsets(self, topic_partition):
+        with self.broker.lock:
+            log = self.broker.topics.get(topic_partition.topic, [[]] * self.broker.partitions)
+            return 0, len(log[topic_partition.partition])
+
+    def assign(self, topic_partitions):
+        self.positions = {(tp.topic, tp.partition): tp.offset for tp in topic_partitions}
+
+    def poll(self, timeout):
+        if self.stall:
+            self.stall -= 1
+            time.sleep(timeout)
+            return None
+        with self.broker.lock:
+            for (topic, partition), offset in self.positions.items():
+                log = self.broker.topics.get(topic, [[]] * self.broker.partitions)[partition]
+                if offset < len(log):
+                    self.positions[(topic, partition)] = offset + 1
+                    return FakeMessage(topic, partition, offset, log[offset])
+        time.sleep(min(timeout, 0.01))
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+def publish(broker, documents, index=None):
+    "Produce documents, recording them in the index as a consumer that was running all along would."
+    for name, doc in documents:
+        offset = broker.produce(TOPIC, json.dumps([name, doc]).encode())
+        if index is not None:
+            index.observe(name, doc, TOPIC, 0, offset)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_index_finds_the_newest_run_in_progress(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = RunStartIndex(path, max_runs=3)
+    assert index.newest_open() is None
+    for i, (time_, uid) in enumerate([(1, "a"), (2, "b"), (3, "c")]):
+        index.observe("start", {"uid": uid, "time": time_}, TOPIC, 0, 10 * i)
+    assert index.newest_open() == (TOPIC, 0, 20)
+    assert index.newest_open(topics=["other"]) is None
+    # Another process sees the stop; this one learns of it when it next saves.
+    RunStartIndex(path).observe("stop", {"run_start": "c"}, TOPIC, 0, 25)
+    index.observe("start", {"uid": "d", "time": 4}, TOPIC, 0, 30)
+    index.observe("stop", {"run_start": "d"}, TOPIC, 0, 35)
+    assert index.newest_open() is None
+    reloaded = RunStartIndex(path)
+    assert len(reloaded) == 3 and "a" not in reloaded
+
+
+def test_catch_up_on_the_run_in_progress(tmp_path):
+    broker = FakeBroker()
+    index = RunStartIndex(str(tmp_path / "index.json"))
+    publish(broker, xafs_documents(num=20, seed=0), index)
+    *in_progress, stop = xafs_documents(num=60, seed=1)
+    publish(broker, in_progress[:32], index)
+
+    model = AutoBMMPlot(redraw_rate=10)
+    model.redraw.suspend()
+    frames_when_caught_up = []
+
+    def on_caught_up():
+        frames_when_caught_up.append(model.redraw.frames)
+        model.redraw.resume()
+
+    # As read by the GUI starting up, from the index kept by the other consumer.
+    index = RunStartIndex(index.path)
+    consumer = FakeConsumer(broker, stall=5)
+    source = CatchUpSource(consumer, [TOPIC], index, deserializer=json.loads, on_caught_up=on_caught_up)
+    source.subscribe(stream_documents_into_runs(model.add_run))
+    thread = threading.Thread(target=source.start, daemon=True)
+    thread.start()
+    try:
+        wait_for(lambda: source.caught_up)
+        # Only the run in progress is replayed, from its start document, without drawing.
+        assert source.replayed == 32
+        assert frames_when_caught_up == [0]
+        (builder, *_) = model.plot_builders
+        (run,) = builder.runs
+        assert run.metadata["start"]["uid"] == in_progress[0][1]["uid"]
+        assert model.redraw.frames == 1
+
+        publish(broker, in_progress[32:] + [stop])
+        wait_for(lambda: run.metadata["stop"] is not None)
+    finally:
+        source.stop()
+        thread.join()
+    assert len(run.primary.read()["dcm_energy"]) == 60
+    assert source.consumer.closed
+
+
+def test_start_at_the_head_when_no_run_is_in_progress(tmp_path):
+    broker = FakeBroker()
+    index = RunStartIndex(str(tmp_path / "index.json"))
+    publish(broker, xafs_documents(num=5), index)
+    received = []
+    source = CatchUpSource(FakeConsumer(broker), [TOPIC], index, deserializer=json.loads)
+    source.subscribe(lambda name, doc: received.append(name))
+    thread = threading.Thread(target=source.start, daemon=True)
+    thread.start()
+    try:
+        wait_for(lambda: source.caught_up)
+        publish(broker, xafs_documents(num=2))
+        wait_for(lambda: "stop" in received)
+    finally:
+        source.stop()
+        thread.join()
+    assert received == ["start", "descriptor", "event_page", "event_page", "stop"]
+    assert source.replayed == 0
+
+
+def test_give_up_catching_up_after_timeout(tmp_path):
+    broker = FakeBroker()
+    index = RunStartIndex(str(tmp_path / "index.json"))
+    *in_progress, stop = xafs_documents(num=5)
+    publish(broker, in_progress, index)
+    source = CatchUpSource(
+        FakeConsumer(broker, stall=1000), [TOPIC], index, deserializer=json.loads, catch_up_timeout=0.2
+    )
+    thread = threading.Thread(target=source.start, daemon=True)
+    thread.start()
+    try:
+        time.sleep(0.1)
+        assert not source.caught_up
+        wait_for(lambda: source.caught_up)
+    finally:
+        source.stop()
+        thread.join()
+    assert source.replayed == 0
+
+
+def test_consumers_sharing_the_index_keep_each_others_runs(tmp_path):
+    path = str(tmp_path / "index.json")
+    # Two consumers, e.g. the GUI and the previews service, recording starts at once.
+    indexes = [RunStartIndex(path, max_runs=1000) for _ in range(2)]
+
+    def record(i, index):
+        for j in range(50):
+            index.observe("start", {"uid": f"{i}-{j}", "time": j}, TOPIC, 0, j)
+
+    threads = [threading.Thread(target=record, args=(i, index)) for i, index in enumerate(indexes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(RunStartIndex(path, max_runs=1000)) == 100
@@ -0,0 +1,114 @@
+import concurrent.futures
+import queue
+import threading
+from pathlib import Path
+
+import numpy
+
+from databroker._drivers.jsonl import BlueskyJSONLCatalog
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..compute import downsample
+from ..plots import AutoBMMPlot
+from .conftest import xafs_documents
+
+
+def lines_by_title(model):
+    return {
+        (figure.title, artist.label): artist.update()
+        for figure in model.figures
+        for axes in figure.axes
+        for artist in axes.artists
+    }
+
+
+def assert_same_lines(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, data in expected.items():
+        numpy.testing.assert_allclose(actual[key]["x"], data["x"])
+        numpy.testing.assert_allclose(actual[key]["y"], data["y"])
+
+
+def test_downsample_keeps_extremes():
+    x = numpy.arange(10_000.0)
+    y = numpy.zeros_like(x)
+    y[1234] = 5
+    y[8765] = -5
+    y[9999] = numpy.nan
+    x_small, y_small = downsample(x, y, 100)
+    assert len(x_small) <= 100
+    assert numpy.all(numpy.diff(x_small) > 0)
+    assert 1234 in x_small and 8765 in x_small
+    assert len(downsample(x[:50], y[:50], 100)[0]) == 50
+
+
+def test_live_lines_computed_in_background_match():
+    expected_model = AutoBMMPlot()
+    plotter = stream_documents_into_runs(expected_model.add_run)
+    for name, doc in xafs_documents():
+        plotter(name, doc)
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        model = AutoBMMPlot(executor=executor)
+        plotter = stream_documents_into_runs(model.add_run)
+        for name, doc in xafs_documents():
+            plotter(name, doc)
+    assert_same_lines(lines_by_title(model), lines_by_title(expected_model))
+
+
+def test_completed_runs_are_plotted_once_computed():
+    runs = []
+    plotter = stream_documents_into_runs(runs.append)
+    for name, doc in xafs_documents():
+        plotter(name, doc)
+    (run,) = runs
+
+    expected_model = AutoBMMPlot()
+    expected_model.add_run(run)
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        model = AutoBMMPlot(executor=executor, max_points=50)
+        model.add_run(run)
+    actual = lines_by_title(model)
+    expected = lines_by_title(expected_model)
+    assert actual.keys() == expected.keys()
+    for key, data in expected.items():
+        assert len(actual[key]["y"]) <= 50
+        assert numpy.nanmax(actual[key]["y"]) == numpy.nanmax(data["y"])
+
+
+def test_lines_computed_in_background_are_added_in_the_gui_thread():
+    runs = []
+    plotter = stream_documents_into_runs(runs.append)
+    for name, doc in xafs_documents():
+        plotter(name, doc)
+    (run,) = runs
+
+    calls = queue.Queue()
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        model = AutoBMMPlot(executor=executor, call_soon=calls.put)
+        model.add_run(run)
+    # The data are computed, but the lines are not made until called here.
+    assert all(not axes.artists for figure in model.figures for axes in figure.axes)
+    added_in = set()
+    for figure in model.figures:
+        for axes in figure.axes:
+            axes.artists.events.added.connect(lambda event: added_in.add(threading.get_ident()))
+    while not calls.empty():
+        calls.get()()
+    assert added_in == {threading.get_ident()}
+
+    expected_model = AutoBMMPlot()
+    expected_model.add_run(run)
+    assert_same_lines(lines_by_title(model), lines_by_title(expected_model))
+
+
+def test_columns_shared_when_computed_in_background():
+    catalog = BlueskyJSONLCatalog(f"{Path(__file__).parent.resolve()}/*.jsonl", name="bmm")
+    run = catalog["ac694ff6-2444-49af-8898-bfa23d99c28c"]
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        model = AutoBMMPlot(executor=executor)
+        model.add_run(run)
+    # All six plots computed from one set of columns, which are still held.
+    (columns,) = {id(builder._columns[run.metadata["start"]["uid"]]) for builder in model.plot_builders}
+    assert len(model.columns) == 1
+    assert model.columns.refcount(run) == len(model.plot_builders) == 6
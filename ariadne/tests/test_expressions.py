@@ -0,0 +1,34 @@
+import numpy
+import pytest
+
+from ..expressions import DerivedSignal, compile_expression
+
+
+@pytest.mark.parametrize(
+    "expression,fields,elementwise",
+    [
+        ("I0", {"I0"}, True),
+        ("log(I0/It)", {"I0", "It"}, True),
+        ("(Fe1+Fe2+Fe3+Fe4)/I0", {"Fe1", "Fe2", "Fe3", "Fe4", "I0"}, True),
+        ("cumsum(I0)", {"I0"}, False),
+        ("I0[::10]", {"I0"}, False),
+    ],
+)
+def test_compile_expression(expression, fields, elementwise):
+    compiled = compile_expression(expression)
+    assert compiled.fields == fields
+    assert compiled.elementwise == elementwise
+    assert compile_expression(expression) is compiled
+
+
+@pytest.mark.parametrize("expression", ["log(I0/It)", "It/I0", "I0", "cumsum(It)"])
+def test_derived_signal_incremental(expression):
+    rng = numpy.random.default_rng(0)
+    columns = {"I0": rng.uniform(1, 2, 1000), "It": rng.uniform(1, 2, 1000)}
+    namespace = {"log": numpy.log, "cumsum": numpy.cumsum}
+    signal = DerivedSignal(expression, capacity=4)
+    for length in (0, 1, 2, 3, 10, 11, 500, 1000):
+        values = signal.update(columns, length)
+        assert len(values) == length
+        expected = eval(expression, namespace, {key: value[:length] for key, value in columns.items()})
+        numpy.testing.assert_allclose(values, expected)
@@ -0,0 +1,37 @@
+import numpy
+
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..fluorescence import find_channel_groups, fuse_channels
+from ..plots import AutoBMMPlot
+from .conftest import xafs_documents
+
+
+def test_find_channel_groups():
+    fields = ["I0", "It", "Fe1", "Fe2", "Fe3", "Fe4", "Mn1", "Mn2", "dcm_energy"]
+    assert find_channel_groups(fields) == {"Fe_fluorescence": ("Fe1", "Fe2", "Fe3", "Fe4")}
+
+
+def test_fuse_channels_deadtime():
+    counts = numpy.array([[100.0, 200.0], [50.0, 0.0]])
+    numpy.testing.assert_allclose(fuse_channels(counts), [150.0, 200.0])
+    # 100 counts in 1 s with 1 ms deadtime: 10% dead.
+    fused = fuse_channels(counts, deadtimes=numpy.array([1e-3, 0.0]), dwell_time=numpy.array([1.0, 1.0]))
+    numpy.testing.assert_allclose(fused, [100 / 0.9 + 50, 200 / 0.8])
+
+
+def test_fluorescence_curve_uses_fused_channel():
+    model = AutoBMMPlot()
+    plotter = stream_documents_into_runs(model.add_run)
+    for name, doc in xafs_documents(deadtime=1e-5):
+        plotter(name, doc)
+
+    titles = [figure.title for figure in model.figures]
+    assert "scan_nd xafs fluorescence: Fe_fluorescence/I0" in titles
+    builder = model.plot_builders[titles.index("scan_nd xafs fluorescence: Fe_fluorescence/I0")]
+    (artist,) = builder.axes.artists
+    (run,) = builder.runs
+    primary = run.primary.read()
+    counts = numpy.stack([primary[f"Fe{i}"].values for i in range(1, 5)])
+    expected = fuse_channels(counts, numpy.full(4, 1e-5), primary["dwti_dwell_time"].values) / primary["I0"].values
+    numpy.testing.assert_allclose(artist.update()["y"], expected)
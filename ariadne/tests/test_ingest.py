@@ -0,0 +1,208 @@
+import concurrent.futures
+import threading
+import time
+from pathlib import Path
+
+import numpy
+import pytest
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+from databroker._drivers.jsonl import BlueskyJSONLCatalog
+
+from ..ingest import EventPageCoalescer, FieldProjection, IngestService
+from ..plot_specs import PLOT_SPECS
+from ..plots import AutoBMMPlot
+from .conftest import xafs_documents
+
+XAFS_UID = "ac694ff6-2444-49af-8898-bfa23d99c28c"
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return BlueskyJSONLCatalog(f"{Path(__file__).parent.resolve()}/*.jsonl", name="bmm")
+
+
+def test_pages_are_coalesced_up_to_max_rows():
+    received = []
+    coalescer = EventPageCoalescer(lambda name, doc: received.append((name, doc)), max_rows=30, max_latency=None)
+    for name, doc in xafs_documents(num=100):
+        coalescer(name, doc)
+    names = [name for name, _ in received]
+    assert names == ["start", "descriptor"] + ["event_page"] * 4 + ["stop"]
+    assert [len(doc["seq_num"]) for name, doc in received if name == "event_page"] == [30, 30, 30, 10]
+    assert (coalescer.pages_in, coalescer.pages_out) == (100, 4)
+
+
+def test_timer_flushes_pending_pages():
+    scheduled = []
+    received = []
+    coalescer = EventPageCoalescer(
+        lambda name, doc: received.append(name),
+        max_rows=1000,
+        call_later=lambda delay, func: scheduled.append(func),
+    )
+    documents = list(xafs_documents(num=5))
+    for name, doc in documents[:-1]:
+        coalescer(name, doc)
+    assert received == ["start", "descriptor"]
+    (func,) = scheduled
+    func()
+    assert received == ["start", "descriptor", "event_page"]
+    # A stale timer does nothing.
+    func()
+    assert received == ["start", "descriptor", "event_page"]
+
+
+def test_runs_built_from_coalesced_pages_have_all_the_data():
+    runs = []
+    coalescer = EventPageCoalescer(stream_documents_into_runs(runs.append), max_rows=64, max_latency=None)
+    for name, doc in xafs_documents(num=100):
+        coalescer(name, doc)
+    (run,) = runs
+    energy = run.primary.read()["dcm_energy"].values
+    numpy.testing.assert_allclose(energy, numpy.linspace(6912.0, 7912.0, 100))
+
+
+def _plotted(documents):
+    model = AutoBMMPlot(redraw_rate=0)
+    router = stream_documents_into_runs(model.add_run)
+    for name, doc in documents:
+        router(name, doc)
+    model.redraw.flush()
+    return model, {
+        (builder.axes.title, artist.label): artist.update()
+        for builder in model.plot_builders
+        for artist in builder.axes.artists
+    }
+
+
+def test_projection_keeps_only_what_the_plots_read(catalog):
+    documents = list(catalog[XAFS_UID].documents(fill="no"))
+    assert any(name == "descriptor" and doc["name"] == "baseline" for name, doc in documents)
+    passed = []
+    projection = FieldProjection(lambda name, doc: passed.append((name, doc)))
+    for name, doc in documents:
+        projection(name, doc)
+
+    start = documents[0][1]
+    fields = PLOT_SPECS.required_fields(start["plan_name"], start.get("XDI", {}).get("Element", {}).get("symbol"))
+    descriptors = [doc for name, doc in passed if name == "descriptor"]
+    assert [doc["name"] for doc in descriptors] == ["primary"]
+    assert set(descriptors[0]["data_keys"]) <= fields
+    for name, doc in passed:
+        if name == "event_page":
+            assert set(doc["data"]) <= fields
+            assert doc["timestamps"] == {}
+    # Nothing is held once the run stops.
+    assert not projection._fields and not projection._descriptors
+
+    model, projected = _plotted(passed)
+    (run,) = model.plot_builders[0].runs
+    assert list(run) == ["primary"]
+    _, expected = _plotted(documents)
+    assert projected.keys() == expected.keys()
+    for key, data in expected.items():
+        numpy.testing.assert_array_equal(projected[key]["x"], data["x"])
+        numpy.testing.assert_array_equal(projected[key]["y"], data["y"])
+
+
+def test_projection_keeps_timestamps_when_asked():
+    passed = []
+    projection = FieldProjection(lambda name, doc: passed.append((name, doc)), timestamps=True)
+    for name, doc in xafs_documents(num=3):
+        projection(name, doc)
+    pages = [doc for name, doc in passed if name == "event_page"]
+    assert pages and all(set(page["timestamps"]) == set(page["data"]) for page in pages)
+
+
+@pytest.mark.parametrize("plan_name", ["scan_nd xafs fluorescence", "count"])
+def test_projected_pages_are_coalesced_into_runs(plan_name):
+    # As the GUI and the previews service chain them.
+    documents = list(xafs_documents(plan_name=plan_name, num=30))
+    model = AutoBMMPlot(redraw_rate=0)
+    chain = FieldProjection(EventPageCoalescer(stream_documents_into_runs(model.add_run), max_latency=None))
+    for name, doc in documents:
+        chain(name, doc)
+    model.redraw.flush()
+    _, expected = _plotted(documents)
+    actual = {
+        (builder.axes.title, artist.label): artist.update()
+        for builder in model.plot_builders
+        for artist in builder.axes.artists
+    }
+    assert actual.keys() == expected.keys()
+    for key, data in expected.items():
+        numpy.testing.assert_array_equal(actual[key]["x"], data["x"])
+        numpy.testing.assert_array_equal(actual[key]["y"], data["y"])
+
+
+def test_plans_without_plots_keep_all_fields():
+    passed = []
+    projection = FieldProjection(lambda name, doc: passed.append((name, doc)))
+    documents = list(xafs_documents(plan_name="count", num=3))
+    for name, doc in documents:
+        projection(name, doc)
+    assert [doc["data"] for name, doc in passed if name == "event_page"] == [
+        doc["data"] for name, doc in documents if name == "event_page"
+    ]
+
+
+def test_service_delivers_each_run_in_order_in_batches():
+    batches = []
+    service = IngestService(batches.append, max_batch=25)
+    service.start()
+    first = list(xafs_documents(num=40, seed=0))
+    second = list(xafs_documents(num=40, seed=1))
+    try:
+        for a, b in zip(first, second):
+            service.put(*a)
+            service.put(*b)
+        # A document of no known run, delivered on its own.
+        service.put("event_page", {"descriptor": "unknown"})
+        while service.stats["delivered"] < service.stats["received"]:
+            time.sleep(0.01)
+    finally:
+        service.close()
+
+    for documents in (first, second):
+        ids = {id(doc) for _, doc in documents}
+        delivered = [doc for batch in batches for _, doc in batch if id(doc) in ids]
+        assert [id(doc) for doc in delivered] == [id(doc) for _, doc in documents]
+    assert all(len(batch) <= 25 for batch in batches)
+    stats = service.stats
+    assert stats["received"] == stats["delivered"] == len(first) + len(second) + 1
+    assert stats["batches"] == len(batches)
+    # The runs' queues went away with their stop documents.
+    assert list(service.queue_depths()) == [None]
+
+
+def test_service_holds_back_sources_when_delivery_lags():
+    pending = []
+
+    def deliver(batch):
+        future = concurrent.futures.Future()
+        pending.append(future)
+        return future
+
+    service = IngestService(deliver, max_queue=5, max_batch=1)
+    service.start()
+    documents = list(xafs_documents(num=20))
+    done = threading.Event()
+
+    def source():
+        for name, doc in documents:
+            service.put(name, doc)
+        done.set()
+
+    thread = threading.Thread(target=source, daemon=True)
+    thread.start()
+    try:
+        # One batch is being delivered and five documents are queued; the source waits.
+        assert not done.wait(0.5)
+        assert service.stats["queued"] == 5
+        while not done.is_set():
+            while pending:
+                pending.pop(0).set_result(None)
+            done.wait(0.01)
+    finally:
+        service.close()
+    assert service.stats["received"] == len(documents)
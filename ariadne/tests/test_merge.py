@@ -0,0 +1,89 @@
+import concurrent.futures
+import queue
+import threading
+
+import numpy
+
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..merge import RunningMerge
+from ..plots import AutoBMMPlot
+from .conftest import xafs_documents
+
+
+def test_running_merge_matches_batch_statistics():
+    rng = numpy.random.default_rng(0)
+    grid = numpy.linspace(7000, 7500, 101)
+    scans = []
+    merge = RunningMerge(grid)
+    for i in range(5):
+        energy = numpy.sort(rng.uniform(6990, 7510, 300))
+        mu = numpy.sin(energy / 50) + rng.normal(0, 0.01, len(energy))
+        scans.append(numpy.interp(grid, energy, mu))
+        # Feed the scan point by point, as if live.
+        for length in range(1, len(energy) + 1):
+            merge.add(i, energy[:length], mu[:length])
+    numpy.testing.assert_allclose(merge.mean, numpy.mean(scans, axis=0))
+    numpy.testing.assert_allclose(merge.variance, numpy.var(scans, axis=0, ddof=1))
+    assert (merge.count == 5).all()
+
+
+def test_repeated_scans_are_merged():
+    model = AutoBMMPlot()
+    plotter = stream_documents_into_runs(model.add_run)
+    for seed in range(3):
+        for name, doc in xafs_documents(plan_name="scan_nd xafs trans", num=150, seed=seed):
+            plotter(name, doc)
+
+    (merger,) = model._mergers.values()
+    assert len(merger) == 3
+    title = "scan_nd xafs trans: log(I0/It)"
+    (figure,) = [figure for figure in model.figures if figure.title == title]
+    artists = figure.axes[0].artists
+    assert merger.line in artists
+    assert len(artists) == 4
+    # Nothing is retained by the merger once the runs are complete.
+    assert not merger._live
+    merged = merger.line.update()
+    assert numpy.isfinite(merged["y"]).sum() > 1000
+
+
+def test_completed_scans_are_merged_in_background():
+    runs = []
+    plotter = stream_documents_into_runs(runs.append)
+    for seed in range(3):
+        for name, doc in xafs_documents(plan_name="scan_nd xafs trans", num=150, seed=seed):
+            plotter(name, doc)
+
+    expected_model = AutoBMMPlot()
+    for run in runs:
+        expected_model.add_run(run)
+    (expected,) = expected_model._mergers.values()
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        model = AutoBMMPlot(executor=executor)
+        for run in runs:
+            model.add_run(run)
+    (merger,) = model._mergers.values()
+    assert len(merger) == 3
+    numpy.testing.assert_allclose(merger.line.update()["y"], expected.line.update()["y"])
+
+
+def test_merges_computed_in_background_are_shown_in_the_gui_thread():
+    runs = []
+    plotter = stream_documents_into_runs(runs.append)
+    for seed in range(2):
+        for name, doc in xafs_documents(plan_name="scan_nd xafs trans", num=150, seed=seed):
+            plotter(name, doc)
+
+    calls = queue.Queue()
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        model = AutoBMMPlot(executor=executor, redraw_rate=None, call_soon=calls.put)
+        for run in runs:
+            model.add_run(run)
+    (merger,) = model._mergers.values()
+    emitted_in = set()
+    merger.line.events.new_data.connect(lambda event: emitted_in.add(threading.get_ident()))
+    while not calls.empty():
+        calls.get()()
+    assert emitted_in == {threading.get_ident()}
+    assert numpy.isfinite(merger.line.update()["y"]).sum() > 1000
@@ -0,0 +1,83 @@
+import threading
+from pathlib import Path
+
+import pytest
+from databroker._drivers.jsonl import BlueskyJSONLCatalog
+
+from ..models import SearchWithButton
+from ..search_rows import RowCache
+from ..settings import columns, extract_results_row_from_metadata
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return BlueskyJSONLCatalog(f"{Path(__file__).parent.resolve()}/*.jsonl", name="bmm")
+
+
+def test_searches_are_made_off_the_calling_thread_and_superseded(catalog, monkeypatch):
+    searching = threading.Event()
+    proceed = threading.Event()
+    search_catalog = type(catalog).search
+
+    def slow_search(self, query):
+        if query.get("plan_name") == "slow":
+            searching.set()
+            proceed.wait(10)
+        return search_catalog(self, query)
+
+    monkeypatch.setattr(type(catalog), "search", slow_search)
+    shown = []
+    search = SearchWithButton(
+        catalog, columns=columns, rows=RowCache(extract_results_row_from_metadata), call_soon=shown.append
+    )
+    search.query_future.result()
+    (show,) = shown
+    show()
+    results = search.run_search.search_results
+    assert results.length == 3
+
+    search.input.query = {"plan_name": "slow"}
+    assert searching.wait(10)
+    slow = search.query_future
+    # Not waiting for the slow search, a newer one supersedes it.
+    search.input.query = {"plan_name": "scan_nd xafs trans"}
+    proceed.set()
+    slow.result()
+    search.query_future.result()
+    # Only the newer search's results are shown.
+    (_, show) = shown
+    show()
+    assert results.length == 1 and results.get_data(0, 0) == 18511
+
+
+def test_catalog_is_opened_and_probed_off_the_calling_thread(catalog, monkeypatch):
+    searched_in = set()
+    search_catalog = type(catalog).search
+
+    def search_and_record_thread(self, query):
+        searched_in.add(threading.get_ident())
+        return search_catalog(self, query)
+
+    monkeypatch.setattr(type(catalog), "search", search_and_record_thread)
+    opened_in = set()
+
+    def open_catalog():
+        opened_in.add(threading.get_ident())
+        return catalog, None
+
+    shown = []
+    search = SearchWithButton(
+        columns=columns, rows=RowCache(extract_results_row_from_metadata), call_soon=shown.append
+    )
+    loading = []
+    search.events.loading.connect(lambda event: loading.append(event.loading))
+    search.open(open_catalog).result()
+    assert threading.get_ident() not in opened_in | searched_in
+    # Loading until the results are shown
+    results = search.run_search.search_results
+    assert search.loading and results.length == 0
+    (show,) = shown
+    show()
+    assert not search.loading and loading == [True, False]
+    assert results.length == 3
+    assert not search.input.text_search_supported
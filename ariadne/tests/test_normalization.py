@@ -0,0 +1,69 @@
+import numpy
+
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..normalization import LiveNormalization, RunningPolyFit
+from ..plots import AutoBMMPlot, NormalizedLines
+from .conftest import xafs_documents
+
+
+def test_running_poly_fit_matches_polyfit():
+    rng = numpy.random.default_rng(0)
+    x = numpy.linspace(7200, 8000, 300)
+    y = 1 + 2e-4 * (x - 7112) - 3e-7 * (x - 7112) ** 2 + rng.normal(0, 1e-3, len(x))
+    fit = RunningPolyFit(2, center=7112, scale=100)
+    for chunk in numpy.array_split(numpy.arange(len(x)), 17):
+        fit.add(x[chunk], y[chunk])
+    expected = numpy.polynomial.polynomial.Polynomial.fit(x, y, 2)
+    numpy.testing.assert_allclose(fit(x), expected(x), rtol=1e-9)
+
+
+def test_live_normalization_is_incremental():
+    energy = numpy.linspace(6912, 7912, 400)
+    mu = 0.3 + 1e-4 * (energy - 7112) + 1.5 / (1 + numpy.exp(-(energy - 7112) / 2))
+    normalization = LiveNormalization(7112.0)
+    for length in range(1, len(energy) + 1, 7):
+        normalization.update(energy[:length], mu[:length])
+    normalized = normalization.update(energy, mu)
+    assert abs(normalization.e0 - 7112) < 3
+    assert abs(normalization.edge_step - 1.5) < 0.05
+    assert abs(normalized[energy < 7000].mean()) < 0.01
+    assert abs(normalized[energy > 7300].mean() - 1) < 0.05
+
+
+def test_normalized_plot():
+    model = AutoBMMPlot()
+    plotter = stream_documents_into_runs(model.add_run)
+    for name, doc in xafs_documents(plan_name="scan_nd xafs trans", num=300):
+        plotter(name, doc)
+        if name == "event_page":
+            for builder in model.plot_builders:
+                for artist in builder.axes.artists:
+                    artist.update()
+
+    (builder,) = [builder for builder in model.plot_builders if isinstance(builder, NormalizedLines)]
+    assert builder.figure.title == "scan_nd xafs trans: normalized log(I0/It)"
+    (run,) = builder.runs
+    normalization = builder.normalization(run)
+    assert abs(normalization.e0 - 7112) < 5
+    (artist,) = builder.axes.artists
+    data = artist.update()
+    assert abs(numpy.mean(data["y"][data["x"] > 7400]) - 1) < 0.05
+
+
+def test_points_are_normalized_again_only_when_the_fits_move():
+    energy = numpy.linspace(6912, 8112, 2000)
+    rng = numpy.random.default_rng(1)
+    mu = 0.3 + 1e-4 * (energy - 7112) + 1.5 / (1 + numpy.exp(-(energy - 7112) / 2)) + rng.normal(0, 1e-3, 2000)
+    normalization = LiveNormalization(7112.0)
+    renormalized_at = []
+    for length in range(1, len(energy) + 1):
+        count = normalization.renormalizations
+        normalized = normalization.update(energy[:length], mu[:length])
+        if normalization.renormalizations > count:
+            renormalized_at.append(length)
+    # Only while the fits are young: the second half of the scan costs the same per point.
+    assert max(renormalized_at) < len(energy) / 2
+    # Within the tolerance of normalizing all the points each time.
+    exact = LiveNormalization(7112.0, rtol=0)
+    numpy.testing.assert_allclose(normalized, exact.update(energy, mu), atol=3e-3)
@@ -0,0 +1,63 @@
+import json
+import pickle
+
+import pytest
+
+from ..plot_specs import DEFAULT_PLOT_SPECS, PlotSpecs, PLOT_SPECS
+
+
+@pytest.mark.parametrize(
+    "plan_name,element,expected",
+    [
+        ("rel_scan linescan xafs_y It", None, [("xafs_y", "It/I0")]),
+        ("scan_nd xafs ref", "Fe", [("dcm_energy", "log(It/Ir)"), ("dcm_energy", "It/I0"),
+                                    ("dcm_energy", "Ir/It"), ("dcm_energy", "log(It/Ir)")]),
+        ("scan_nd xafs If", "Fe", [("dcm_energy", "Fe_fluorescence/I0")]),
+        # Curves that need an element are skipped when there is none.
+        ("scan_nd xafs If", None, []),
+        ("count", None, []),
+        ("scan_nd areascan It", None, []),
+        (None, None, []),
+    ],
+)
+def test_lookup(plan_name, element, expected):
+    templates = PLOT_SPECS.lookup(plan_name, element)
+    assert [(template.x, template.y) for template in templates] == expected
+    for template in templates:
+        if template.normalize:
+            assert template.key == f"{plan_name}: normalized {template.y}"
+        else:
+            assert template.key == f"{plan_name}: {template.y}"
+
+
+def test_new_plan_type_from_table():
+    table = dict(DEFAULT_PLOT_SPECS)
+    table["plans"] = dict(table["plans"], timescan={"x": "time", "ys": {"It": ["It/I0", "I0"]}})
+    specs = PlotSpecs(table)
+    assert [template.y for template in specs.lookup("count timescan It", None)] == ["It/I0", "I0"]
+    # The shared table is unchanged for the other plans.
+    assert [template.y for template in specs.lookup("rel_scan linescan xafs_y It", None)] == ["It/I0"]
+
+
+def test_from_file_and_pickle(tmp_path):
+    table = dict(DEFAULT_PLOT_SPECS, plans={"linescan": {"x": "{2}"}})
+    path = tmp_path / "plot_specs.json"
+    path.write_text(json.dumps(table))
+    specs = PlotSpecs.from_file(str(path))
+    assert specs.plans == {"linescan"}
+    # As sent to worker processes.
+    copy = pickle.loads(pickle.dumps(specs))
+    assert copy.version == specs.version
+    assert copy.lookup("rel_scan linescan xafs_y It", None) == specs.lookup("rel_scan linescan xafs_y It", None)
+
+
+def test_bad_field():
+    with pytest.raises(ValueError):
+        PlotSpecs({"plans": {"linescan": {"x": "{motor}"}}})
+
+
+def test_required_fields():
+    assert PLOT_SPECS.required_fields("rel_scan linescan xafs_y It", None) == {"xafs_y", "It", "I0"}
+    # A fused fluorescence column needs its channels and the dwell time.
+    assert PLOT_SPECS.required_fields("scan_nd xafs If", "Fe") >= {"Fe1", "Fe2", "Fe3", "Fe4", "dwti_dwell_time"}
+    assert PLOT_SPECS.required_fields("count", None) is None
@@ -1,3 +1,4 @@
+import numpy
 import os
 import pytest
 import tempfile
@@ -7,7 +8,9 @@ from databroker._drivers.jsonl import BlueskyJSONLCatalog
 from databroker.core import BlueskyRunFromGenerator
 from bluesky_widgets.utils.streaming import stream_documents_into_runs
 from bluesky_live.run_builder import RunBuilder
+from bluesky_widgets.models.utils import call_or_eval
 from ..kafka_previews import export_thumbnails_when_complete
+from ..plots import AutoBMMPlot, NormalizedLines
 
 
 @pytest.fixture(scope='module')
@@ -43,3 +46,70 @@ def test_plots(catalog, uid, titles):
 
         # Might need to remove the plots after the test.
         # os.remove(plot_file)
+
+
+@pytest.mark.parametrize(
+    "uid",
+    ["1dccff46-2576-4da2-8971-4de1ee4e98b7", "ac694ff6-2444-49af-8898-bfa23d99c28c"],
+)
+def test_incremental_lines_match_generic_evaluation(catalog, uid):
+    model = AutoBMMPlot()
+    plotter = stream_documents_into_runs(model.add_run)
+    for name, doc in catalog[uid].documents(fill='no'):
+        plotter(name, doc)
+        if name == 'event_page':
+            for builder in model.plot_builders:
+                for artist in builder.axes.artists:
+                    artist.update()
+
+    assert model.plot_builders
+    for builder in model.plot_builders:
+        if isinstance(builder, NormalizedLines):
+            continue
+        (run,) = builder.runs
+        expected = call_or_eval({"x": builder.x, "y": builder.ys[0]}, run, ["primary"])
+        (artist,) = builder.axes.artists
+        actual = artist.update()
+        numpy.testing.assert_allclose(actual["x"], expected["x"])
+        numpy.testing.assert_allclose(actual["y"], expected["y"])
+
+
+def test_columns_shared_across_lines(catalog):
+    model = AutoBMMPlot()
+    plotter = stream_documents_into_runs(model.add_run)
+    for name, doc in catalog["ac694ff6-2444-49af-8898-bfa23d99c28c"].documents(fill='no'):
+        plotter(name, doc)
+    for builder in model.plot_builders:
+        for artist in builder.axes.artists:
+            artist.update()
+
+    (run,) = model.plot_builders[0].runs
+    assert len(model.columns) == 1
+    assert model.columns.refcount(run) == len(model.plot_builders) == 6
+
+    model.discard_run(run)
+    assert len(model.columns) == 0
+
+
+def test_least_recently_used_plots_are_evicted(catalog):
+    model = AutoBMMPlot(max_plots=1)
+    for uid in ["1dccff46-2576-4da2-8971-4de1ee4e98b7", "d748dbdc-cec4-4211-b626-801f1799cb56"]:
+        model.add_run(catalog[uid])
+
+    assert len(model.figures) == len(model.plot_builders) == 1
+    assert model.figures[0].title == "rel_scan linescan xafs_pitch It: It/I0"
+    assert list(model._models) == [model.figures[0].title]
+
+
+def test_repeated_plot_key_reuses_figure(catalog):
+    model = AutoBMMPlot()
+    run = catalog["ac694ff6-2444-49af-8898-bfa23d99c28c"]
+    model.add_run(run)
+    figures = list(model.figures)
+    model.add_run(run)
+
+    assert list(model.figures) == figures
+    assert len(model.plot_builders) == len(figures) == 6
+    for builder in model.plot_builders:
+        assert len(builder.runs) == 2
+        assert len(builder.axes.artists) == 2
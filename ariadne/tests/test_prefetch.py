@@ -0,0 +1,104 @@
+import threading
+from pathlib import Path
+
+import pytest
+from databroker._drivers.jsonl import BlueskyJSONLCatalog
+
+from ..models import SearchAndView, SearchWithButton
+from ..plots import AutoBMMPlot
+from ..prefetch import RunPrefetcher
+from ..search_rows import RowCache
+from ..settings import columns, extract_results_row_from_metadata
+
+XAFS_UID = "ac694ff6-2444-49af-8898-bfa23d99c28c"
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return BlueskyJSONLCatalog(f"{Path(__file__).parent.resolve()}/*.jsonl", name="bmm")
+
+
+class GatedCatalog:
+    "Stands in for a slow catalog: getting a run waits until it is let through."
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.gates = {uid: threading.Event() for uid in catalog}
+        self.waiting = threading.Semaphore(0)
+
+    def __getitem__(self, uid):
+        self.waiting.release()
+        assert self.gates[uid].wait(10)
+        return self.catalog[uid]
+
+
+def test_runs_are_loaded_concurrently_and_handed_over_as_loaded(catalog):
+    delivered = []
+    progress = []
+    prefetcher = RunPrefetcher(lambda run, columns: delivered.append((run, columns)), max_workers=3)
+    prefetcher.events.progress.connect(lambda event: progress.append((event.done, event.total)))
+    gated = GatedCatalog(catalog)
+    uids = list(catalog)
+    prefetcher.submit(gated, uids)
+    # All three are being loaded at once.
+    for _ in uids:
+        assert gated.waiting.acquire(timeout=10)
+    gated.gates[uids[2]].set()
+    while not delivered:
+        pass
+    # The last is handed over first, as it was loaded first.
+    ((run, run_columns),) = delivered
+    assert run.metadata["start"]["uid"] == uids[2]
+    for uid in uids[:2]:
+        gated.gates[uid].set()
+    prefetcher.executor.shutdown(wait=True)
+    assert len(delivered) == 3
+    assert progress[0] == (0, 3) and progress[-1] == (3, 3) and not prefetcher.busy
+    # The columns the plots use are read.
+    ((run, run_columns),) = [item for item in delivered if item[0].metadata["start"]["uid"] == XAFS_UID]
+    assert {"dcm_energy", "It", "I0"} <= set(run_columns._buffers)
+
+
+def test_cancel(catalog):
+    delivered = []
+    prefetcher = RunPrefetcher(lambda run, columns: delivered.append(run), max_workers=1)
+    gated = GatedCatalog(catalog)
+    prefetcher.submit(gated, list(catalog))
+    assert gated.waiting.acquire(timeout=10)
+    prefetcher.cancel()
+    for gate in gated.gates.values():
+        gate.set()
+    prefetcher.executor.shutdown(wait=True)
+    # Neither the run loading nor those waiting are handed over.
+    assert delivered == []
+    assert not prefetcher.busy
+
+
+def test_view_selected_runs(catalog):
+    rows = RowCache(extract_results_row_from_metadata)
+    search = SearchWithButton(catalog, columns=columns, rows=rows)
+    search.query_future.result()
+    auto_plot_builder = AutoBMMPlot()
+    search_and_view = SearchAndView(search, auto_plot_builder)
+    prefetched = {}
+    add_run = search_and_view.prefetcher.callback
+
+    def record(run, run_columns):
+        prefetched[run.metadata["start"]["uid"]] = run_columns
+        add_run(run, run_columns)
+
+    search_and_view.prefetcher.callback = record
+    results = search.run_search.search_results
+    uids = list(catalog)
+    results.selected_rows.extend(range(len(uids)))
+    search.events.view()
+    search_and_view.prefetcher.executor.shutdown(wait=True)
+    shown = {run.metadata["start"]["uid"] for builder in auto_plot_builder.plot_builders for run in builder.runs}
+    assert shown == set(uids)
+    # The plots hold the columns read ahead, rather than reading them again,
+    # though the xafs run was also merged (which takes and gives back its columns).
+    xafs_builders = [builder for builder in auto_plot_builder.plot_builders
+                     if any(run.metadata["start"]["uid"] == XAFS_UID for run in builder.runs)]
+    (run,) = xafs_builders[0].runs
+    assert all(builder._columns[XAFS_UID] is prefetched[XAFS_UID] for builder in xafs_builders)
+    assert auto_plot_builder.columns.refcount(run) == len(xafs_builders)
@@ -0,0 +1,102 @@
+import types
+
+from bluesky_widgets.utils.event import EmitterGroup, Event
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..plots import AutoBMMPlot
+from ..redraw import RedrawScheduler
+from .conftest import xafs_documents
+
+
+class FakeArtist:
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.events = EmitterGroup(source=self, new_data=Event)
+        self.draws = 0
+        self.events.new_data.connect(self._on_new_data)
+
+    def _on_new_data(self, event):
+        self.draws += 1
+
+
+def test_requests_are_coalesced_until_the_timer_fires():
+    scheduled = []
+    redraw = RedrawScheduler(max_rate=10, call_later=lambda delay, func: scheduled.append(func))
+    a, b = FakeArtist("a"), FakeArtist("b")
+    # The first request is drawn at once; the burst after it waits for the timer.
+    redraw.request(a)
+    assert a.draws == 1
+    for _ in range(100):
+        redraw.request(a)
+        redraw.request(b)
+    assert (a.draws, b.draws) == (1, 0)
+    assert len(scheduled) == 1
+    (func,) = scheduled
+    func()
+    assert (a.draws, b.draws) == (2, 1)
+    assert redraw.stats == {"requests": 201, "frames": 2, "redraws": 3, "coalesced": 198, "pending": 0}
+
+
+def test_unlimited_and_manual_rates():
+    artist = FakeArtist("a")
+    redraw = RedrawScheduler(max_rate=None)
+    for _ in range(3):
+        redraw.request(artist)
+    assert artist.draws == 3
+
+    artist = FakeArtist("a")
+    redraw = RedrawScheduler(max_rate=0)
+    for _ in range(3):
+        redraw.request(artist)
+    assert artist.draws == 0
+    redraw.flush()
+    assert artist.draws == 1
+
+
+def test_suspended_requests_are_drawn_on_resume():
+    scheduled = []
+    redraw = RedrawScheduler(max_rate=10, call_later=lambda delay, func: scheduled.append(func))
+    artist = FakeArtist("a")
+    redraw.request(artist)
+    redraw.request(artist)
+    redraw.suspend()
+    redraw.suspend()
+    for _ in range(10):
+        redraw.request(artist)
+    # The timer set before suspending draws nothing.
+    (func,) = scheduled
+    func()
+    assert artist.draws == 1
+    redraw.resume()
+    assert artist.draws == 1
+    redraw.resume()
+    assert artist.draws == 2
+
+
+def test_live_lines_redraw_once_when_only_flushed_on_completion():
+    model = AutoBMMPlot(redraw_rate=0)
+    plotter = stream_documents_into_runs(model.add_run)
+    *documents, stop = xafs_documents(num=50)
+    for name, doc in documents:
+        plotter(name, doc)
+
+    lines = [artist for figure in model.figures for axes in figure.axes for artist in axes.artists]
+    counts = types.SimpleNamespace(new_data=0, completed_after_new_data=0)
+
+    def on_new_data(event):
+        counts.new_data += 1
+
+    def on_completed(event):
+        counts.completed_after_new_data += counts.new_data > 0
+
+    for line in lines:
+        line.events.new_data.connect(on_new_data)
+        line.events.completed.connect(on_completed)
+    assert counts.new_data == 0
+
+    plotter(*stop)
+    # Each line is redrawn once, with all its data, before it is marked complete.
+    assert counts.new_data == len(lines)
+    assert counts.completed_after_new_data == len(lines)
+    assert not any(line.live for line in lines)
+    assert model.redraw.stats["requests"] >= 50 * len(lines)
@@ -0,0 +1,68 @@
+import gc
+import weakref
+
+import numpy
+
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..columns import CompactColumns, CompactRun
+from ..plots import AutoBMMPlot, BMMLines
+from .conftest import xafs_documents
+
+
+def lines_of(model):
+    return {
+        (figure.title, artist.label): (artist.update(), dict(artist.style))
+        for figure in model.figures
+        for axes in figure.axes
+        for artist in axes.artists
+    }
+
+
+def test_old_runs_are_demoted_to_compact_columns():
+    model = AutoBMMPlot(memory_budget=1)
+    plotter = stream_documents_into_runs(model.add_run)
+    for seed in range(3):
+        for name, doc in xafs_documents(num=100, seed=seed):
+            plotter(name, doc)
+
+    builders = [builder for builder in model.plot_builders if isinstance(builder, BMMLines)]
+    # Only the columns that some plot uses are kept.
+    plotted = set().union(*(builder.plotted_fields() for builder in builders))
+    for builder in builders:
+        *older, newest = builder.runs
+        assert all(isinstance(run, CompactRun) for run in older)
+        assert not isinstance(newest, CompactRun)
+        for run in older:
+            assert run.columns("primary").fields == plotted
+            assert isinstance(model.columns.acquire(run), CompactColumns)
+            model.columns.release(run)
+    assert len(model.memory) == 3
+
+
+def test_demoted_runs_are_freed():
+    model = AutoBMMPlot(memory_budget=1)
+    runs = []
+    plotter = stream_documents_into_runs(lambda run: (runs.append(weakref.ref(run)), model.add_run(run)))
+    for seed in range(3):
+        for name, doc in xafs_documents(num=50, seed=seed):
+            plotter(name, doc)
+    del plotter
+    gc.collect()
+    assert [run() is None for run in runs] == [True, True, False]
+
+
+def test_demoted_lines_keep_their_data_and_style():
+    model = AutoBMMPlot(memory_budget=1)
+    plotter = stream_documents_into_runs(model.add_run)
+    for seed in range(2):
+        for name, doc in xafs_documents(num=100, seed=seed):
+            plotter(name, doc)
+        if seed == 0:
+            before = lines_of(model)
+    after = lines_of(model)
+    for key, (data, style) in before.items():
+        new_data, new_style = after[key]
+        assert new_style == style
+        numpy.testing.assert_allclose(new_data["x"], data["x"], rtol=1e-6)
+        numpy.testing.assert_allclose(new_data["y"], data["y"], rtol=1e-4, atol=1e-6)
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+from databroker._drivers.jsonl import BlueskyJSONLCatalog
+
+from ..models import SearchWithButton
+from ..run_index import IndexedCatalog, RunIndex, UnsupportedQuery
+from ..search_rows import RowCache
+from ..settings import columns, extract_results_row_from_metadata, extract_results_row_from_run
+
+XAFS_UID = "ac694ff6-2444-49af-8898-bfa23d99c28c"
+LINESCAN_UIDS = ["d748dbdc-cec4-4211-b626-801f1799cb56", "1dccff46-2576-4da2-8971-4de1ee4e98b7"]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return BlueskyJSONLCatalog(f"{Path(__file__).parent.resolve()}/*.jsonl", name="bmm")
+
+
+@pytest.fixture
+def index(catalog):
+    index = RunIndex()
+    assert index.update_from_catalog(catalog) == 3
+    return index
+
+
+def test_search_by_text_and_field(index, catalog):
+    assert index.search("xafs trans") == [XAFS_UID]
+    assert index.search("305224") == [XAFS_UID]  # The SAF number
+    assert index.search("linesc") == LINESCAN_UIDS  # Newest first
+    assert index.search(fields={"XDI.Element.symbol": "fe"}) == [XAFS_UID]
+    assert index.search(fields={"scan_id": "7261"}) == LINESCAN_UIDS[1:]
+    assert index.search(fields={"scan_id": "72x"}) == []
+    start = catalog[XAFS_UID].metadata["start"]["time"]
+    assert index.search(until=start + 1) == [XAFS_UID]  # The oldest
+    assert index.search(since=start + 1) == LINESCAN_UIDS
+    assert index.search(offset=1, limit=1) == LINESCAN_UIDS[1:]
+    assert index.count("alignment") == 2
+
+
+def test_rows_from_the_index_match_those_from_the_catalog(index, catalog):
+    rows = RowCache(extract_results_row_from_metadata)
+    uids = list(catalog)
+    expected = [extract_results_row_from_run(catalog[uid]) for uid in uids]
+    assert rows.get(IndexedCatalog(catalog, index), uids) == expected
+
+
+def test_update_incrementally(catalog):
+    index = RunIndex()
+    documents = [(name, doc) for name, doc in catalog[XAFS_UID].documents(fill="no") if name in ("start", "stop")]
+    # As from a live stream: started, then stopped.
+    index.observe(*documents[0])
+    (start, stop) = index.metadata([XAFS_UID])[XAFS_UID]
+    assert stop is None
+    index.observe(*documents[-1])
+    (start, stop) = index.metadata([XAFS_UID])[XAFS_UID]
+    assert stop["time"] == documents[-1][1]["time"]
+    assert not index.synced(catalog)
+    assert index.update_from_catalog(catalog) == 3
+    assert index.synced(catalog) and len(index) == 3
+    # Nothing new since.
+    assert index.update_from_catalog(catalog) == 0
+
+
+def test_indexed_catalog(index, catalog):
+    indexed = IndexedCatalog(catalog, index)
+    results = indexed.search({"$text": {"$search": "alignment"}, "XDI.Facility.SAF": "307482"})
+    assert isinstance(results, IndexedCatalog)
+    assert len(results) == 2 and list(results) == LINESCAN_UIDS
+    assert results[XAFS_UID].metadata["start"]["uid"] == XAFS_UID
+    # Searches the index cannot answer go to the catalog.
+    selection = indexed.search({"uid": {"$in": [XAFS_UID]}})
+    assert list(selection) == [XAFS_UID] and not isinstance(selection, IndexedCatalog)
+    with pytest.raises(UnsupportedQuery):
+        RunIndex.parse_query({"num_points": {"$gt": 10}})
+
+
+def test_search_with_an_index(index, catalog):
+    rows = RowCache(extract_results_row_from_metadata)
+    search = SearchWithButton(catalog, columns=columns, rows=rows, index=index)
+    search_input = search.input
+    assert search_input.text_search_supported
+    results = search.run_search.search_results
+    search.query_future.result()
+    assert isinstance(results.catalog, IndexedCatalog) and results.length == 3
+    search_input.field_search.update({"XDI.Element.symbol": "Fe"})
+    search.query_future.result()
+    assert results.length == 1 and results.get_data(0, 0) == 18511
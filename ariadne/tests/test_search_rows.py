@@ -0,0 +1,137 @@
+from pathlib import Path
+
+import event_model
+import pytest
+from databroker._drivers.jsonl import BlueskyJSONLCatalog
+
+from ..search_rows import PagedSearchResults, RowCache, fetch_metadata, fetch_uids
+from ..settings import columns, extract_results_row_from_metadata, extract_results_row_from_run
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return BlueskyJSONLCatalog(f"{Path(__file__).parent.resolve()}/*.jsonl", name="bmm")
+
+
+def test_rows_match_those_made_one_run_at_a_time(catalog):
+    uids = list(catalog)
+    rows = RowCache(extract_results_row_from_metadata)
+    expected = [extract_results_row_from_run(catalog[uid]) for uid in uids]
+    assert rows.get(catalog, uids + ["missing"]) == expected + [None]
+
+
+def test_misses_are_fetched_in_batches(catalog):
+    uids = list(catalog)
+    rows = RowCache(extract_results_row_from_metadata, batch_size=2)
+    rows.get(catalog, uids)
+    assert rows.stats == {"rows": 3, "hits": 0, "misses": 3, "batches": 2}
+    rows.get(catalog, uids)
+    assert rows.stats == {"rows": 3, "hits": 3, "misses": 3, "batches": 2}
+
+
+def test_least_recently_used_rows_are_evicted(catalog):
+    a, b, c = list(catalog)
+    rows = RowCache(extract_results_row_from_metadata, max_rows=2)
+    rows.get(catalog, [a, b])
+    rows.get(catalog, [a])
+    rows.get(catalog, [c])
+    assert a in rows and b not in rows and c in rows
+
+
+def test_rows_of_open_runs_are_fetched_again_when_they_stop():
+    fetched = []
+
+    def row_factory(start, stop):
+        fetched.append(start["uid"])
+        return (start["uid"], stop is not None)
+
+    class Catalog:
+        "Stands in for a catalog of one run, at first open."
+
+        stop = None
+
+        def __getitem__(self, uid):
+            return type("Run", (), {"metadata": {"start": {"uid": uid}, "stop": self.stop}})
+
+    catalog = Catalog()
+    rows = RowCache(row_factory, open_ttl=60)
+    assert rows.get(catalog, ["a"]) == [("a", False)]
+    assert rows.get(catalog, ["a"]) == [("a", False)]
+    catalog.stop = {"run_start": "a"}
+    rows.observe("stop", catalog.stop)
+    assert rows.get(catalog, ["a"]) == [("a", True)]
+    assert fetched == ["a", "a"]
+    # Without seeing the stop document, after open_ttl.
+    rows = RowCache(row_factory, open_ttl=0)
+    catalog.stop = None
+    rows.get(catalog, ["a"])
+    assert "a" not in rows
+
+
+def test_fetch_metadata(catalog):
+    uids = list(catalog)
+    metadata = fetch_metadata(catalog, uids)
+    for uid in uids:
+        start, stop = metadata[uid]
+        assert start == catalog[uid].metadata["start"]
+        assert stop == catalog[uid].metadata["stop"]
+
+
+@pytest.fixture(scope="module")
+def large_catalog():
+    from databroker.in_memory import BlueskyInMemoryCatalog
+
+    catalog = BlueskyInMemoryCatalog()
+    for i in range(250):
+        bundle = event_model.compose_run(metadata={"plan_name": "scan_nd xafs fluorescence", "scan_id": i})
+        start, stop = bundle.start_doc, bundle.compose_stop()
+        catalog.upsert(start, stop, iter, ([("start", start), ("stop", stop)],), {})
+    return catalog
+
+
+def test_paged_search_results_load_only_the_pages_requested(large_catalog):
+    loaded = []
+    results = PagedSearchResults(columns, RowCache(extract_results_row_from_metadata), page_size=20, max_pages=4)
+    results.events.page_loaded.connect(lambda event: loaded.append((event.first, event.last)))
+    results.catalog = large_catalog
+    assert results.length == 250 and results.pages == []
+    assert results.peek(100, 0) is None
+
+    results.request(100, 110)
+    results.executor.shutdown(wait=True)
+    # The page of rows 100 to 119, and one page either side.
+    assert sorted(loaded) == [(80, 99), (100, 119), (120, 139)]
+    uids = list(large_catalog)
+    assert results.peek(105, 0) == extract_results_row_from_run(large_catalog[uids[105]])[0]
+    assert results.get_uid_by_row(100) == uids[100]
+    assert results.get_uid_by_row(139) == uids[139]
+    # The last page is short; pages beyond max_pages are dropped, least recently used first.
+    assert results.get_data(249, 1) == extract_results_row_from_run(large_catalog[uids[249]])[1]
+    results.get_uid_by_row(0)
+    assert results.pages == [0, 5, 6, 12]
+    with pytest.raises(ValueError):
+        results.get_uid_by_row(250)
+
+
+def test_paged_search_results_drop_pages_of_the_previous_catalog(large_catalog, catalog):
+    results = PagedSearchResults(columns, RowCache(extract_results_row_from_metadata), page_size=20)
+    results.catalog = large_catalog
+    results.get_uid_by_row(0)
+    results.catalog = catalog
+    assert results.pages == [] and results.length == 3
+    assert results.get_uid_by_row(2) == list(catalog)[2]
+
+
+def test_fetch_uids(large_catalog):
+    assert fetch_uids(large_catalog, 240, 20) == list(large_catalog)[240:]
+
+
+def test_paged_search_results_of_a_catalog_that_got_shorter(catalog):
+    results = PagedSearchResults(columns, RowCache(extract_results_row_from_metadata), page_size=20)
+    # As if the length were counted when the catalog had more runs.
+    results.set_catalog(catalog, length=10)
+    assert results.get_data(2, 0) == extract_results_row_from_run(catalog[list(catalog)[2]])[0]
+    assert results.peek(5, 0) is None
+    assert results.get_data(5, 0) is None
+    with pytest.raises(ValueError):
+        results.get_uid_by_row(5)
@@ -0,0 +1,33 @@
+import os
+
+from bluesky_widgets.headless.figures import HeadlessFigures
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..plots import AutoBMMPlot
+from ..thumbnails import StreamingExport
+from .conftest import xafs_documents
+
+
+def test_streaming_export_is_rate_limited_and_final(tmp_path):
+    model = AutoBMMPlot(redraw_rate=0)
+    view = HeadlessFigures(model.figures)
+    exported = []
+    exporter = StreamingExport(model, view, str(tmp_path), interval=3600, every=40, on_exported=exported.append)
+
+    def add_run(run):
+        model.add_run(run)
+        run.events.new_data.connect(exporter.on_new_data)
+        run.events.completed.connect(lambda event: exporter.export(final=True))
+
+    router = stream_documents_into_runs(add_run)
+    for name, doc in xafs_documents(num=100):
+        router(name, doc)
+
+    # Two exports for the 100 events (at 40 and 80), then the final one.
+    assert exporter.exports == 3
+    assert all(len(filenames) == len(model.figures) for filenames in exported)
+    # Only complete images are ever visible under their names.
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(filename) for filename in exported[-1])
+    # Nothing changed since the final export, so nothing is rendered again.
+    assert exporter.export() == []
+    view.close()
@@ -0,0 +1,60 @@
+import os
+
+from ..plot_specs import DEFAULT_PLOT_SPECS, PlotSpecs
+from ..thumbnail_cache import ThumbnailCache
+
+
+def write_thumbnail(root, uid, size):
+    directory = os.path.join(root, uid)
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, "plot.png")
+    with open(filename, "wb") as file:
+        file.write(b"x" * size)
+    return filename
+
+
+def test_current_until_stop_or_plot_specs_change(tmp_path):
+    root = str(tmp_path)
+    stop = {"uid": "s", "run_start": "a", "exit_status": "success", "time": 1.0}
+    cache = ThumbnailCache(root)
+    assert not cache.is_current("a", stop)
+    cache.record("a", stop, [write_thumbnail(root, "a", 10)])
+    assert cache.is_current("a", dict(reversed(list(stop.items()))))
+    assert not cache.is_current("a", {**stop, "exit_status": "abort"})
+
+    # The index survives a restart.
+    assert ThumbnailCache(root).is_current("a", stop)
+
+    table = dict(DEFAULT_PLOT_SPECS, plans={"linescan": {"x": "{2}"}})
+    assert not ThumbnailCache(root, plot_specs=PlotSpecs(table)).is_current("a", stop)
+
+    os.remove(os.path.join(root, "a", "plot.png"))
+    assert not cache.is_current("a", stop)
+
+
+def test_oldest_thumbnails_are_evicted(tmp_path):
+    root = str(tmp_path)
+    cache = ThumbnailCache(root, max_bytes=250)
+    for uid in "abc":
+        cache.record(uid, {"uid": uid}, [write_thumbnail(root, uid, 100)])
+    assert "a" not in cache
+    assert not os.path.exists(os.path.join(root, "a"))
+    assert cache.nbytes == 200
+    # Re-recording a run makes it the newest.
+    cache.record("b", {"uid": "b"}, [write_thumbnail(root, "b", 100)])
+    cache.record("d", {"uid": "d"}, [write_thumbnail(root, "d", 100)])
+    assert sorted(os.listdir(root)) == ["b", "d", "index.json"]
+
+
+def test_processes_sharing_a_root_keep_each_others_records(tmp_path):
+    root = str(tmp_path)
+    service = ThumbnailCache(root, max_bytes=250)
+    backfill = ThumbnailCache(root, max_bytes=250)
+    service.record("a", {"uid": "a"}, [write_thumbnail(root, "a", 100)])
+    backfill.record("b", {"uid": "b"}, [write_thumbnail(root, "b", 100)])
+    assert service.is_current("b", {"uid": "b"})
+    assert "a" in ThumbnailCache(root) and "b" in ThumbnailCache(root)
+    # Eviction counts the thumbnails of both.
+    service.record("c", {"uid": "c"}, [write_thumbnail(root, "c", 100)])
+    assert "a" not in backfill and "b" in backfill and "c" in backfill
+    assert not os.path.exists(os.path.join(root, "a"))
@@ -0,0 +1,81 @@
+import concurrent.futures
+from pathlib import Path
+
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from ..plot_specs import DEFAULT_PLOT_SPECS, PlotSpecs
+from ..thumbnail_cache import ThumbnailCache
+from ..thumbnails import ThumbnailRenderer, figure_titles, render_thumbnails, thumbnail_filename
+from .conftest import xafs_documents
+
+
+def test_render_one_figure(tmp_path):
+    documents = list(xafs_documents(num=20))
+    title = figure_titles(documents[0][1])[0]
+    (filename,) = render_thumbnails(documents, str(tmp_path), titles=(title,))
+    assert filename == thumbnail_filename(str(tmp_path), title)
+    assert Path(filename).stat().st_size
+
+
+def test_renderer_exports_every_figure_in_the_pool(tmp_path):
+    exported = []
+    renderer = ThumbnailRenderer(max_workers=2, root=str(tmp_path), on_exported=exported.extend)
+    try:
+        runs = []
+        router = stream_documents_into_runs(runs.append)
+        for name, doc in xafs_documents(num=20):
+            router(name, doc)
+        (run,) = runs
+        futures = renderer.submit(run)
+        assert renderer.stats["runs"] == 1
+        concurrent.futures.wait(futures, timeout=120)
+    finally:
+        renderer.shutdown()
+    titles = figure_titles(run.metadata["start"])
+    # One task for the run, exporting every figure.
+    assert len(futures) == 1
+    directory = tmp_path / run.metadata["start"]["uid"]
+    expected = sorted(thumbnail_filename(str(directory), title) for title in titles)
+    assert sorted(str(path) for path in directory.iterdir()) == expected
+    assert sorted(exported) == expected
+    assert renderer.queue_depth == 0
+    assert renderer.stats == {"runs": 1, "skipped": 0, "queued": 0, "running": 0, "done": 1, "failed": 0}
+
+
+def test_renderer_skips_runs_with_current_thumbnails(tmp_path):
+    runs = []
+    router = stream_documents_into_runs(runs.append)
+    for name, doc in xafs_documents(num=20):
+        router(name, doc)
+    (run,) = runs
+    cache = ThumbnailCache(str(tmp_path))
+    renderer = ThumbnailRenderer(max_workers=1, root=str(tmp_path), on_exported=list, cache=cache)
+    try:
+        renderer.submit(run)
+    finally:
+        # Once the workers are shut down, every done callback has run.
+        renderer.shutdown()
+    assert cache.is_current(run.metadata["start"]["uid"], run.metadata["stop"])
+    # The skipped run is not submitted to the (shut down) pool at all.
+    assert renderer.submit(run) == []
+    assert renderer.stats["runs"] == 2
+    assert renderer.stats["skipped"] == 1
+
+
+def test_renderer_uses_its_plot_specs(tmp_path):
+    table = dict(DEFAULT_PLOT_SPECS, ys={"fluorescence": ["It/I0"]})
+    table["plans"] = {"xafs": {"x": "dcm_energy"}}
+    plot_specs = PlotSpecs(table)
+    runs = []
+    router = stream_documents_into_runs(runs.append)
+    for name, doc in xafs_documents(num=20):
+        router(name, doc)
+    (run,) = runs
+    renderer = ThumbnailRenderer(max_workers=1, root=str(tmp_path), on_exported=list, plot_specs=plot_specs)
+    try:
+        (future,) = renderer.submit(run)
+        filenames = future.result(timeout=120)
+    finally:
+        renderer.shutdown()
+    (title,) = figure_titles(run.metadata["start"], plot_specs)
+    assert filenames == [thumbnail_filename(str(tmp_path / run.metadata["start"]["uid"]), title)]
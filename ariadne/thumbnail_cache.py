@@ -0,0 +1,186 @@
+"""
+An index of the thumbnails already rendered, so they are not rendered again.
+
+For each run uid, the index records a digest of the stop document and the
+version of the plot specs the thumbnails were made with. If neither changed,
+the thumbnails are current, so replays, restarts and backfills skip them. The
+index also bounds the size of the thumbnail directory by deleting the
+thumbnails of the runs rendered longest ago.
+
+Several processes may share a root, e.g. the previews service and a backfill.
+Each re-reads the index when another has changed it, and updates it under a
+file lock, so none drops the records of the others.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows; there, processes sharing a root may drop each other's records.
+    fcntl = None
+
+from .plot_specs import PLOT_SPECS
+
+INDEX_FILENAME = "index.json"
+
+
+def document_digest(doc):
+    "A digest of a document that does not depend on the order of its keys"
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ThumbnailCache:
+    """
+    Index of the thumbnails under a root directory, one directory per run uid.
+
+    Parameters
+    ----------
+    root : String
+    max_bytes : Integer, optional
+        When the thumbnails take more than this, those of the runs recorded
+        longest ago are deleted. None, the default, means no limit.
+    plot_specs : PlotSpecs, optional
+        Thumbnails made with another version of the plot specs are stale.
+        Default is ``PLOT_SPECS``.
+
+    Examples
+    --------
+
+    >>> cache = ThumbnailCache(root, max_bytes=2**30)
+    >>> if not cache.is_current(uid, stop_doc):
+    ...     filenames = render(...)
+    ...     cache.record(uid, stop_doc, filenames)
+    """
+
+    def __init__(self, root, max_bytes=None, plot_specs=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.plot_specs = PLOT_SPECS if plot_specs is None else plot_specs
+        self._lock = threading.Lock()
+        self._path = os.path.join(root, INDEX_FILENAME)
+        # (mtime, size) of the index file when last read
+        self._stat = None
+        self._entries = {}
+        self._reload()
+
+    def __len__(self):
+        with self._lock:
+            self._reload()
+            return len(self._entries)
+
+    def __contains__(self, uid):
+        with self._lock:
+            self._reload()
+            return uid in self._entries
+
+    @property
+    def nbytes(self):
+        "Bytes of all the thumbnails recorded"
+        with self._lock:
+            self._reload()
+            return sum(entry["bytes"] for entry in self._entries.values())
+
+    def is_current(self, uid, stop_doc):
+        "True if the thumbnails of this run were made from this stop document and these plot specs"
+        with self._lock:
+            self._reload()
+            entry = self._entries.get(uid)
+        return (
+            entry is not None
+            and entry["stop"] == document_digest(stop_doc)
+            and entry["plot_specs"] == self.plot_specs.version
+            and all(os.path.exists(filename) for filename in entry["files"])
+        )
+
+    def record(self, uid, stop_doc, filenames):
+        "Record the thumbnails of a run, then evict old ones if over the size limit."
+        entry = {
+            "stop": document_digest(stop_doc),
+            "plot_specs": self.plot_specs.version,
+            "files": sorted(filenames),
+            "bytes": sum(os.path.getsize(filename) for filename in filenames),
+            "time": time.time(),
+        }
+        with self._lock, self._file_lock():
+            self._reload(force=True)
+            self._entries.pop(uid, None)
+            self._entries[uid] = entry
+            self._evict()
+            self._save()
+
+    def discard(self, uid):
+        "Forget a run and delete its thumbnails."
+        with self._lock, self._file_lock():
+            self._reload(force=True)
+            if self._entries.pop(uid, None) is not None:
+                self._delete(uid)
+                self._save()
+
+    def _evict(self):
+        "Delete the thumbnails recorded longest ago until within max_bytes. Call with the lock held."
+        if self.max_bytes is None:
+            return
+        total = sum(entry["bytes"] for entry in self._entries.values())
+        # Entries are kept in the order they were recorded, oldest first.
+        for uid in list(self._entries):
+            if total <= self.max_bytes or len(self._entries) == 1:
+                break
+            total -= self._entries.pop(uid)["bytes"]
+            self._delete(uid)
+
+    def _delete(self, uid):
+        shutil.rmtree(os.path.join(self.root, uid), ignore_errors=True)
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        "Hold the index against other processes, while reading it then writing it back."
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.root, exist_ok=True)
+        # Lock the directory itself, as the index file is replaced on each save.
+        descriptor = os.open(self.root, os.O_RDONLY)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(descriptor)
+
+    def _reload(self, force=False):
+        "Read the index again if another process changed it. Call with the lock held."
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            return
+        if not force and (stat.st_mtime_ns, stat.st_size) == self._stat:
+            return
+        try:
+            with open(self._path) as file:
+                entries = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        # Oldest first, as _evict expects.
+        self._entries = dict(sorted(entries.items(), key=lambda item: item[1]["time"]))
+        self._stat = (stat.st_mtime_ns, stat.st_size)
+
+    def _save(self):
+        "Write the index via a temporary file, so a crash cannot leave it half written."
+        os.makedirs(self.root, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(prefix=f".{INDEX_FILENAME}.", suffix=".tmp", dir=self.root)
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(self._entries, file)
+            os.replace(temporary, self._path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temporary)
+            raise
+        stat = os.stat(self._path)
+        self._stat = (stat.st_mtime_ns, stat.st_size)
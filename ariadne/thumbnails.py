@@ -0,0 +1,364 @@
+"""
+Render thumbnails of completed runs in a pool of worker processes.
+
+Rendering and PNG encoding take far longer than consuming a run's documents,
+so the process that consumes documents only hands each completed run (its
+documents, which pickle) to the pool, one task per run, and goes on to the
+next run. Each worker rebuilds the run from the documents once, builds its
+plots and renders all its figures.
+"""
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from bluesky_widgets.models.utils import lock_if_live, run_is_live_and_not_completed
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+
+from .plot_specs import PLOT_SPECS
+
+logger = logging.getLogger(__name__)
+
+
+def default_thumbnail_root():
+    "Directory under which thumbnails go by default, one directory per run uid"
+    return os.path.join(tempfile.gettempdir(), "ariadne")
+
+
+def thumbnail_directory(uid, root=None):
+    "Directory of the thumbnails of one run, by default under default_thumbnail_root()."
+    if root is None:
+        root = default_thumbnail_root()
+    return os.path.join(root, uid)
+
+
+def thumbnail_filename(directory, title, format="png"):
+    "Path of the thumbnail of a figure. Titles may contain '/', as in 'It/I0', which becomes '_div_'."
+    return str(Path(directory, f"{title.replace('/', '_div_')}.{format}"))
+
+
+def export_atomically(figure, filename, format="png"):
+    """
+    Export a HeadlessFigure via a temporary file in the same directory.
+
+    The file appears under its name only once it is complete, so readers
+    (e.g. a web server) never see a partly written image.
+    """
+    directory, name = os.path.split(filename)
+    descriptor, temporary = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory or None)
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            figure.figure.savefig(file, format=format)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, filename)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporary)
+        raise
+
+
+def export_figures(view, directory, format="png"):
+    """
+    Export each figure of a HeadlessFigures to a file named by its title.
+
+    Returns
+    -------
+    filenames : List[String]
+    """
+    filenames = []
+    for figure_spec in view.model:
+        filename = thumbnail_filename(directory, figure_spec.title, format)
+        export_atomically(view.figures[figure_spec.uuid], filename, format=format)
+        filenames.append(filename)
+    return filenames
+
+
+def figure_titles(start, plot_specs=None):
+    "Titles of the figures AutoBMMPlot makes for a run, from its start document, by default with PLOT_SPECS."
+    if plot_specs is None:
+        plot_specs = PLOT_SPECS
+    element = start.get("XDI", {}).get("Element", {}).get("symbol")
+    return [template.key for template in plot_specs.lookup(start.get("plan_name"), element)]
+
+
+def render_thumbnails(documents, directory, titles=None, format="png", plot_specs=None):
+    """
+    Build the plots of one run from its documents and export them.
+
+    Parameters
+    ----------
+    documents : Iterable[Tuple[String, Dict]]
+        (name, doc) pairs of a complete run
+    directory : String
+    titles : Collection[String], optional
+        Export only the figures with these titles. By default, export all.
+    format : String, optional
+        Default is "png".
+    plot_specs : PlotSpecs, optional
+        Default is ``PLOT_SPECS``.
+
+    Returns
+    -------
+    filenames : List[String]
+    """
+    # Imported here, where it is needed, so that a process that never renders
+    # does not pay for it.
+    from bluesky_widgets.headless.figures import HeadlessFigure
+
+    from .plots import AutoBMMPlot
+
+    model = AutoBMMPlot(plot_specs=plot_specs, redraw_rate=0)
+    router = stream_documents_into_runs(model.add_run)
+    for name, doc in documents:
+        router(name, doc)
+    model.redraw.flush()
+
+    os.makedirs(directory, exist_ok=True)
+    filenames = []
+    for figure_spec in model.figures:
+        if titles is not None and figure_spec.title not in titles:
+            continue
+        figure = HeadlessFigure(figure_spec)
+        try:
+            filename = thumbnail_filename(directory, figure_spec.title, format)
+            export_atomically(figure, filename, format=format)
+        finally:
+            figure.close_figure()
+        filenames.append(filename)
+    return filenames
+
+
+class StreamingExport:
+    """
+    Export the thumbnails of a live run as it progresses, at a bounded rate.
+
+    An export happens when data arrive and either ``every`` events have
+    arrived or ``interval`` seconds have passed since the last one, whichever
+    comes first. Only the figures whose lines changed since then (or that were
+    never exported) are rendered again.
+
+    Parameters
+    ----------
+    model : AutoBMMPlot
+        Made with ``redraw_rate=0``, so that lines are redrawn only on export
+    view : HeadlessFigures
+        Of ``model.figures``
+    directory : String
+    interval : Number, optional
+        Seconds. Default is 5.
+    every : Integer, optional
+        Events. Default is 50.
+    format : String, optional
+        Default is "png".
+    on_exported : Callable, optional
+        Called with the list of filenames written by each export
+
+    Examples
+    --------
+
+    >>> export = StreamingExport(model, view, directory)
+    >>> run.events.new_data.connect(export.on_new_data)
+    >>> run.events.completed.connect(lambda event: export.export(final=True))
+    """
+
+    def __init__(self, model, view, directory, interval=5.0, every=50, format="png", on_exported=None):
+        self.model = model
+        self.view = view
+        self.directory = directory
+        self.interval = interval
+        self.every = every
+        self.format = format
+        self.on_exported = on_exported
+        # UUIDs of the figures exported at least once
+        self._exported = set()
+        self._events = 0
+        self._last_export = time.monotonic()
+        self.exports = 0
+
+    def on_new_data(self, event):
+        self._events += sum(getattr(event, "updated", {}).values()) or 1
+        if self._events >= self.every or time.monotonic() - self._last_export >= self.interval:
+            self.export()
+
+    def export(self, final=False):
+        """
+        Render the figures that changed, or all of them if final.
+
+        Returns
+        -------
+        filenames : List[String]
+        """
+        artists = self.model.redraw.flush()
+        changed = {
+            artist.axes.figure.uuid
+            for artist in artists
+            if artist.axes is not None and artist.axes.figure is not None
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        filenames = []
+        for figure_spec in self.view.model:
+            uuid = figure_spec.uuid
+            if not final and uuid in self._exported and uuid not in changed:
+                continue
+            filename = thumbnail_filename(self.directory, figure_spec.title, self.format)
+            export_atomically(self.view.figures[uuid], filename, format=self.format)
+            self._exported.add(uuid)
+            filenames.append(filename)
+        self._events = 0
+        self._last_export = time.monotonic()
+        self.exports += 1
+        if filenames and self.on_exported is not None:
+            self.on_exported(filenames)
+        return filenames
+
+
+class ThumbnailRenderer:
+    """
+    Render the thumbnails of completed runs in a bounded pool of processes.
+
+    Parameters
+    ----------
+    max_workers : Integer, optional
+        Number of worker processes. Default is 2.
+    root : String, optional
+        Thumbnails go in a directory per run uid under this. Default is
+        ``ariadne`` in the temporary directory.
+    on_exported : Callable, optional
+        Called with the list of filenames each time a run is exported. It
+        runs in a thread of this process, not in the consumer's thread. The
+        default prints them, one quoted filename per line.
+    cache : ThumbnailCache, optional
+        If given, runs whose thumbnails are current are skipped, and the
+        thumbnails of each run are recorded once all are exported. Its root
+        and plot specs should be the same as this one's.
+    plot_specs : PlotSpecs, optional
+        Which plots to render for each plan. Default is ``PLOT_SPECS``.
+
+    Attributes
+    ----------
+    stats : Dict[String, Integer]
+        Counts of runs submitted, of runs skipped because their thumbnails
+        were current, and of runs queued (submitted but not started), being
+        rendered, done and failed.
+
+    Examples
+    --------
+
+    >>> renderer = ThumbnailRenderer(max_workers=4)
+    >>> dispatcher.subscribe(stream_documents_into_runs(renderer.export_when_complete))
+    """
+
+    def __init__(self, max_workers=2, root=None, on_exported=None, cache=None, plot_specs=None):
+        self.root = root
+        self.plot_specs = PLOT_SPECS if plot_specs is None else plot_specs
+        self.on_exported = on_exported or _print_filenames
+        self.cache = cache
+        # Use fresh processes rather than forks of one whose other threads
+        # (e.g. a Kafka consumer's) may hold locks.
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._skipped = 0
+        self._pending = set()
+        self._done = 0
+        self._failed = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            running = sum(future.running() for future in self._pending)
+            return {
+                "runs": self._runs,
+                "skipped": self._skipped,
+                "queued": len(self._pending) - running,
+                "running": running,
+                "done": self._done,
+                "failed": self._failed,
+            }
+
+    @property
+    def queue_depth(self):
+        "Number of runs submitted and not yet exported"
+        with self._lock:
+            return len(self._pending)
+
+    def export_when_complete(self, run):
+        "Submit a BlueskyRun for rendering now if it is complete, or else when it completes."
+        if run_is_live_and_not_completed(run):
+
+            def on_completed(event):
+                run.events.completed.disconnect(on_completed)
+                self.submit(run)
+
+            run.events.completed.connect(on_completed)
+        else:
+            self.submit(run)
+
+    def submit(self, run):
+        """
+        Submit a complete run for rendering, as one task.
+
+        This returns as soon as the task is queued.
+
+        Returns
+        -------
+        futures : List[concurrent.futures.Future]
+            Resolving to the list of filenames exported. Empty if the run was
+            skipped.
+        """
+        start, stop = run.metadata["start"], run.metadata["stop"]
+        if self.cache is not None and self.cache.is_current(start["uid"], stop):
+            with self._lock:
+                self._runs += 1
+                self._skipped += 1
+            return []
+        if not figure_titles(start, self.plot_specs):
+            with self._lock:
+                self._runs += 1
+            return []
+        with lock_if_live(run):
+            documents = list(run.documents(fill="no"))
+        directory = thumbnail_directory(start["uid"], self.root)
+        with self._lock:
+            self._runs += 1
+            future = self._executor.submit(render_thumbnails, documents, directory, plot_specs=self.plot_specs)
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+        if self.cache is not None:
+            future.add_done_callback(functools.partial(self._record, start["uid"], stop))
+        return [future]
+
+    def _record(self, uid, stop, future):
+        "Record the thumbnails of a run in the cache once they are exported."
+        if not future.cancelled() and future.exception() is None:
+            self.cache.record(uid, stop, future.result())
+
+    def _on_done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            failed = future.cancelled() or future.exception() is not None
+            if failed:
+                self._failed += 1
+            else:
+                self._done += 1
+        if failed:
+            if not future.cancelled():
+                logger.error("Error rendering thumbnail", exc_info=future.exception())
+            return
+        self.on_exported(future.result())
+
+    def shutdown(self, wait=True):
+        "Stop the worker processes, by default after the queued runs are rendered."
+        self._executor.shutdown(wait=wait)
+
+
+def _print_filenames(filenames):
+    print("\n".join(f'"{filename}"' for filename in filenames))
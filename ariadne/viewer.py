@@ -1,32 +1,146 @@
+import concurrent.futures
 import os
+import threading
 
 from bluesky_widgets.models.run_engine_client import RunEngineClient
 from bluesky_widgets.qt import Window
 from bluesky_widgets.models.plot_specs import Axes, Figure
 from bluesky_widgets.models.plot_builders import Lines
 from bluesky_widgets.models.auto_plot_builders import AutoPlotter
+from bluesky_widgets.utils.streaming import stream_documents_into_runs
+from qtpy.QtCore import QObject, Signal
 
+from .widget_search import QtCaller
 from .widgets import QtViewer
 from .models import SearchWithButton
 from .settings import SETTINGS
 
+from .compute import plot_executor
+from .ingest import EventPageCoalescer, FieldProjection, IngestService
 from .plots import AutoBMMPlot
+from .run_index import RunIndex
 
 
 class ViewerModel:
     """
     This encapsulates on the models in the application.
+
+    Parameters
+    ----------
+    call_soon : Callable, optional
+        Expected signature ``f(function)``, calling function in the GUI
+        thread. Results of searches, and plot data, computed in worker threads
+        are shown that way.
+    call_later : Callable, optional
+        Expected signature ``f(delay, function)``. Deferred redraws of the
+        plots are scheduled with it. By default, each starts a timer thread.
     """
 
-    def __init__(self):
-        self.search = SearchWithButton(SETTINGS.catalog, columns=SETTINGS.columns)
+    def __init__(self, call_soon=None, call_later=None):
+        # Plot data are computed on these threads, to keep the GUI responsive.
+        self.plot_executor = plot_executor(SETTINGS.plot_workers)
         # auto_plot_builder for live plotting
-        self.live_auto_plot_builder = AutoBMMPlot()
-        # auto_plot_builder for databroker plotting
-        self.databroker_auto_plot_builder = AutoBMMPlot()
+        self.live_auto_plot_builder = AutoBMMPlot(
+            plot_specs=SETTINGS.plot_specs,
+            redraw_rate=SETTINGS.redraw_rate,
+            call_later=call_later,
+            executor=self.plot_executor,
+            max_points=SETTINGS.max_plot_points,
+            memory_budget=SETTINGS.plot_memory_budget,
+            call_soon=call_soon,
+        )
+        # Built when first used, which with lazy tabs is when the Data Broker tab is first shown.
+        self._search = None
+        self._databroker_auto_plot_builder = None
+        self.call_soon = call_soon
+        self.call_later = call_later
+        # Kept up to date from the catalog and the live documents, and searched instead of the catalog.
+        self.run_index = None if SETTINGS.run_index_path is None else RunIndex(SETTINGS.run_index_path)
 
         self.run_engine = RunEngineClient(zmq_server_address=os.environ.get("QSERVER_ZMQ_ADDRESS", None))
 
+    @property
+    def search(self):
+        if self._search is None:
+            self._search = SearchWithButton(columns=SETTINGS.columns, rows=SETTINGS.rows, call_soon=self.call_soon)
+            # Opening the catalog, and checking the index against it, take a while, so they are done in a worker.
+            self._search.open(self._open_catalog_and_index)
+        return self._search
+
+    def _open_catalog_and_index(self):
+        "The catalog to search, and the run index to search instead, if it is up to date with the catalog."
+        catalog = _open_catalog()
+        index = self.run_index
+        if index is None or not SearchWithButton._has_runs(catalog):
+            return catalog, None
+        # The first time, the index is built from the whole catalog, to be used from the next start.
+        synced = index.synced(catalog)
+        update = threading.Thread(target=index.update_from_catalog, args=(catalog,), name="ariadne-run-index")
+        update.daemon = True
+        update.start()
+        return catalog, index if synced else None
+
+    @property
+    def databroker_auto_plot_builder(self):
+        "auto_plot_builder for databroker plotting"
+        if self._databroker_auto_plot_builder is None:
+            self._databroker_auto_plot_builder = AutoBMMPlot(
+                plot_specs=SETTINGS.plot_specs,
+                call_later=self.call_later,
+                executor=self.plot_executor,
+                max_points=SETTINGS.max_plot_points,
+                memory_budget=SETTINGS.plot_memory_budget,
+                call_soon=self.call_soon,
+            )
+        return self._databroker_auto_plot_builder
+
+
+def _open_catalog():
+    "The catalog to search: SETTINGS.catalog, or else the one named SETTINGS.catalog_name."
+    if SETTINGS.catalog is None and SETTINGS.catalog_name:
+        # Imported here, as it takes a while and is not needed until the catalog is searched.
+        import databroker
+
+        SETTINGS.catalog = databroker.catalog[SETTINGS.catalog_name]
+    return SETTINGS.catalog
+
+
+class QtBridge(QObject):
+    """
+    Deliver batches of documents to a callback in the thread this was made in.
+
+    Made in the GUI thread, it is the one way documents received on other
+    threads reach the Qt models. Calling it returns a Future that resolves
+    once the batch is delivered.
+
+    Parameters
+    ----------
+    callback : Callable
+        Expected signature ``f(name, doc)``
+    """
+
+    batch = Signal(object, object)
+
+    def __init__(self, callback):
+        super().__init__()
+        self._callback = callback
+        # Emitted from another thread, so the slot is queued to this one.
+        self.batch.connect(self._deliver)
+
+    def __call__(self, batch):
+        future = concurrent.futures.Future()
+        self.batch.emit(batch, future)
+        return future
+
+    def _deliver(self, batch, future):
+        try:
+            for name, doc in batch:
+                self._callback(name, doc)
+        except Exception as error:
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+
 
 class Viewer(ViewerModel):
     """
@@ -37,50 +151,44 @@ class Viewer(ViewerModel):
 
     def __init__(self, *, show=True, title="Demo App"):
         # TODO Where does title thread through?
-        super().__init__()
+        # Calls into the GUI thread: search results, and deferred redraws on a Qt timer.
+        caller = QtCaller()
+        super().__init__(call_soon=caller, call_later=caller.call_later)
+        # Documents from all the sources reach the models in the GUI thread, in batches.
+        self._bridge = QtBridge(stream_documents_into_runs(self.live_auto_plot_builder.add_run))
+        self.ingest = IngestService(self._bridge, max_queue=SETTINGS.ingest_queue, max_batch=SETTINGS.ingest_batch)
+        self.ingest.start()
         for source in SETTINGS.subscribe_to:
             if source["protocol"] == "zmq":
-                from bluesky_widgets.qt.zmq_dispatcher import RemoteDispatcher
-                from bluesky_widgets.utils.streaming import stream_documents_into_runs
-
-                zmq_addr = source["zmq_addr"]
+                from bluesky.callbacks.zmq import RemoteDispatcher
 
-                dispatcher = RemoteDispatcher(zmq_addr)
-                dispatcher.subscribe(stream_documents_into_runs(self.live_auto_plot_builder.add_run))
-                dispatcher.start()
+                dispatcher = RemoteDispatcher(source["zmq_addr"])
 
             elif source["protocol"] == "kafka":
-                from bluesky_kafka import RemoteDispatcher
-                from bluesky_widgets.utils.streaming import stream_documents_into_runs
-                from qtpy.QtCore import QThread
-
-                bootstrap_servers = source["servers"]
-                topics = source["topics"]
-
-                consumer_config = {"auto.commit.interval.ms": 100, "auto.offset.reset": "latest"}
-
-                self.dispatcher = RemoteDispatcher(
-                    topics=topics,
-                    bootstrap_servers=bootstrap_servers,
-                    group_id="widgets_test",
-                    consumer_config=consumer_config,
+                from .catchup import CatchUpSource, RunStartIndex, default_index_path, kafka_consumer
+
+                consumer_config = {"auto.offset.reset": "latest"}
+
+                # Replay the run in progress, if any, and draw only once caught up.
+                redraw = self.live_auto_plot_builder.redraw
+                redraw.suspend()
+                dispatcher = CatchUpSource(
+                    kafka_consumer(source["servers"], "widgets_test", consumer_config),
+                    source["topics"],
+                    RunStartIndex(default_index_path()),
+                    on_caught_up=redraw.resume,
                 )
 
-                self.dispatcher.subscribe(stream_documents_into_runs(self.live_auto_plot_builder.add_run))
-
-                class DispatcherStart(QThread):
-                    def __init__(self, dispatcher):
-                        super().__init__()
-                        self._dispatcher = dispatcher
-
-                    def run(self):
-                        self._dispatcher.start()
-
-                self.dispatcher_thread = DispatcherStart(self.dispatcher)
-                self.dispatcher_thread.start()
-
             else:
                 print(f"Unknown protocol: {source['protocol']}")
+                continue
+
+            dispatcher.subscribe(self._ingest(self.ingest.put))
+            # Search results show runs that were open when listed as stopped once they are.
+            dispatcher.subscribe(SETTINGS.rows.observe)
+            if self.run_index is not None:
+                dispatcher.subscribe(self.run_index.observe)
+            self.ingest.add_source(dispatcher)
 
         # Customize Run Engine model for BMM:
         #   - name of the module that contains custom code modules
@@ -89,9 +197,18 @@ class Viewer(ViewerModel):
         #   - list of names of spreadsheet types
         self.run_engine.plan_spreadsheet_data_types = ["wheel_xafs"]
 
-        widget = QtViewer(self)
+        widget = QtViewer(self, lazy=SETTINGS.lazy_tabs)
         self._window = Window(widget, show=show)
 
+    def _ingest(self, callback):
+        "Put the ingestion stages in front of a document callback."
+        coalescer = EventPageCoalescer(
+            callback, max_rows=SETTINGS.coalesce_rows, max_latency=SETTINGS.coalesce_latency
+        )
+        return FieldProjection(
+            coalescer, plot_specs=self.live_auto_plot_builder.plot_specs, timestamps=SETTINGS.keep_timestamps
+        )
+
     @property
     def window(self):
         return self._window
@@ -103,3 +220,5 @@ class Viewer(ViewerModel):
     def close(self):
         """Close the window."""
         self._window.close()
+        self.ingest.close()
+        self.plot_executor.shutdown(wait=False)
@@ -0,0 +1,180 @@
+"""
+A table of search results that shows only the rows on view, for PagedSearchResults.
+
+The stock table of bluesky-widgets adds rows as it is scrolled and keeps
+every cell it has shown, so showing the results of a search over years of
+runs takes time and memory in proportion to their number. This one has a
+row for every result from the start, for the scroll bar, but asks the model
+only for the rows on view and keeps none.
+"""
+import functools
+
+from bluesky_widgets.qt.search import QtSearch
+from bluesky_widgets.qt._search_input import QtSearchInput
+from bluesky_widgets.qt._search_results import LOADING_PLACEHOLDER, QtSearchResults
+from qtpy import QtCore
+from qtpy.QtCore import QAbstractTableModel, QObject, Qt, QTimer, Signal
+from qtpy.QtWidgets import QAbstractItemView, QHeaderView, QSizePolicy, QTableView
+
+from .search_rows import PagedSearchResults
+
+REQUEST_LATENCY = 20  # ms
+
+
+class QtCaller(QObject):
+    """
+    Call functions in the thread this was made in, e.g. the GUI thread, from any thread.
+
+    For ``SearchWithButton(..., call_soon=QtCaller())``, and with
+    :meth:`call_later`, for ``RedrawScheduler(call_later=caller.call_later)``.
+    """
+
+    _call = Signal(object)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._call.connect(self._on_call)
+
+    def __call__(self, function):
+        self._call.emit(function)
+
+    def call_later(self, delay, function):
+        "Call function in this object's thread after delay seconds, with a single-shot Qt timer."
+        self._call.emit(functools.partial(QTimer.singleShot, max(int(delay * 1000), 0), function))
+
+    def _on_call(self, function):
+        function()
+
+
+class _PagedSearchResultsModel(QAbstractTableModel):
+    """
+    Qt model connecting a PagedSearchResults to Qt's model--view machinery
+
+    Cells not loaded are shown as LOADING_PLACEHOLDER, and the rows asked for
+    in the meantime are requested of the model together, shortly after.
+    """
+
+    # Rows loaded, (first, last). Emitted from worker threads, received in the GUI thread.
+    _page_loaded = Signal(int, int)
+
+    def __init__(self, model, *args, **kwargs):
+        self.model = model
+        super().__init__(*args, **kwargs)
+        self._num_rows = model.length
+        # Rows asked for and not loaded since the last request, as [first, last].
+        self._wanted = None
+        self._request_timer = QTimer(self)
+        self._request_timer.setSingleShot(True)
+        self._request_timer.setInterval(REQUEST_LATENCY)
+        self._request_timer.timeout.connect(self._request)
+
+        self._page_loaded.connect(self.on_page_loaded)
+        self.model.events.page_loaded.connect(self._on_page_loaded_in_worker)
+        self.model.events.begin_reset.connect(self.on_begin_reset)
+        self.model.events.end_reset.connect(self.on_end_reset)
+
+    def _on_page_loaded_in_worker(self, event):
+        self._page_loaded.emit(event.first, event.last)
+
+    def _request(self):
+        if self._wanted is not None:
+            first, last = self._wanted
+            self._wanted = None
+            self.model.request(first, last)
+
+    def on_page_loaded(self, first, last):
+        last = min(last, self._num_rows - 1)
+        if first <= last:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, self.columnCount() - 1), [])
+
+    def on_begin_reset(self, event):
+        self.beginResetModel()
+        self._wanted = None
+
+    def on_end_reset(self, event):
+        self._num_rows = self.model.length
+        self.endResetModel()
+
+    def rowCount(self, parent=None):
+        return self._num_rows
+
+    def columnCount(self, parent=None):
+        return len(self.model.headings)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return super().headerData(section, orientation, role)
+        if orientation == Qt.Horizontal and section < self.columnCount():
+            return str(self.model.headings[section])
+        elif orientation == Qt.Vertical and section < self.rowCount():
+            return section
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return QtCore.QVariant()
+        if index.column() >= self.columnCount() or index.row() >= self.rowCount():
+            return QtCore.QVariant()
+        if role != QtCore.Qt.DisplayRole:
+            return QtCore.QVariant()
+        item = self.model.peek(index.row(), index.column())
+        if item is not None:
+            return item
+        row = index.row()
+        if self._wanted is None:
+            self._wanted = [row, row]
+        else:
+            self._wanted = [min(self._wanted[0], row), max(self._wanted[1], row)]
+        if not self._request_timer.isActive():
+            self._request_timer.start()
+        return LOADING_PLACEHOLDER
+
+
+class QtPagedSearchResults(QTableView):
+    """
+    Table of search results, for a PagedSearchResults
+
+    Parameters
+    ----------
+    model: PagedSearchResults
+    """
+
+    def __init__(self, model, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.model = model
+
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setSortingEnabled(False)
+        self.setSelectionBehavior(QTableView.SelectRows)
+        self.setShowGrid(True)
+        self.setAlternatingRowColors(True)
+        self.verticalHeader().setVisible(False)
+        # Rows of one height, so that Qt need not measure every row to scroll.
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.horizontalHeader().setDefaultAlignment(Qt.AlignLeft)
+        self.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        # Fit the columns to the rows on view, not to the first thousand.
+        self.horizontalHeader().setResizeContentsPrecision(0)
+        self.horizontalHeader().setStretchLastSection(True)
+        self._abstract_table_model = _PagedSearchResultsModel(model)
+        self.setModel(self._abstract_table_model)
+
+        # Notify model of changes to selection and activation, as QtSearchResults does.
+        self.selectionModel().selectionChanged.connect(self.on_selection_changed)
+        self.clicked.connect(self.on_clicked)
+
+    on_selection_changed = QtSearchResults.on_selection_changed
+    on_clicked = QtSearchResults.on_clicked
+
+
+class QtPagedSearch(QtSearch):
+    """
+    A Qt view for a Search model, showing PagedSearchResults with a QtPagedSearchResults.
+    """
+
+    def _initialize_run_search(self, search_input, search_results):
+        if not isinstance(search_results, PagedSearchResults):
+            return super()._initialize_run_search(search_input, search_results)
+        self._run_search_widgets.extend([QtSearchInput(search_input), QtPagedSearchResults(search_results)])
+        for w in self._run_search_widgets:
+            self.layout().addWidget(w)
+        self._vspacer.changeSize(0, 0, QSizePolicy.Minimum, QSizePolicy.Minimum)
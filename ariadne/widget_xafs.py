@@ -1,5 +1,4 @@
 import copy
-import xraylib
 import re
 
 from qtpy.QtWidgets import (
@@ -322,6 +321,9 @@ class PlanEditorXafs(QWidget):
         """
         Returns the list of all elements in the order of atomic numbers (1..107)
         """
+        # Imported here, so that it loads only once the XAFS plan editor is shown.
+        import xraylib
+
         return [xraylib.AtomicNumberToSymbol(_) for _ in range(1, 108)]
 
     def _get_default_parameters(self):
@@ -3,7 +3,6 @@ Extendeding and supplementing the widgets import bluesky-widgets
 """
 from bluesky_widgets.models.plot_builders import Lines
 from bluesky_widgets.models.plot_specs import Figure, Axes
-from bluesky_widgets.qt.search import QtSearch
 from bluesky_widgets.qt.figures import QtFigures
 from bluesky_widgets.qt.run_engine_client import (
     QtReEnvironmentControls,
@@ -27,10 +26,13 @@ from qtpy.QtWidgets import (
     QTabWidget,
     QSplitter,
     QFrame,
+    QProgressBar,
 )
 from qtpy.QtCore import Qt
 
 from .models import RunAndView, SearchAndView
+from .settings import SETTINGS
+from .widget_search import QtPagedSearch
 from .widget_xafs import PlanEditorXafs
 
 
@@ -38,7 +40,8 @@ class QtSearchWithButton(QWidget):
     """
     A view for SearchWithButton.
 
-    Combines the QtSearch widget with a button that processes the selected Runs.
+    Combines the QtSearch widget with a button that processes the selected Runs,
+    and a note shown while the catalog is opened or searched.
     """
 
     def __init__(self, model, *args, **kwargs):
@@ -46,12 +49,20 @@ class QtSearchWithButton(QWidget):
         self.model = model
         layout = QVBoxLayout()
         self.setLayout(layout)
-        layout.addWidget(QtSearch(model))
+        layout.addWidget(QtPagedSearch(model))
+
+        self._loading = QLabel("Loading...")
+        self._loading.setVisible(model.loading)
+        layout.addWidget(self._loading)
+        model.events.loading.connect(self._on_loading)
 
         go_button = QPushButton("View Selected Runs")
         layout.addWidget(go_button)
         go_button.clicked.connect(self._on_go_button_clicked)
 
+    def _on_loading(self, event):
+        self._loading.setVisible(event.loading)
+
     def _on_go_button_clicked(self):
         events = self.model.events
         if events is not None:
@@ -140,13 +151,42 @@ class QtAddCustomPlot(QWidget):
             self.add_button.setEnabled(True)
 
 
+class QtViewProgress(QWidget):
+    """
+    Progress of loading the runs to view, with a button to cancel it. Hidden when idle.
+    """
+
+    def __init__(self, prefetcher, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefetcher = prefetcher
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+        self._progress_bar = QProgressBar()
+        self._progress_bar.setFormat("Loading runs: %v of %m")
+        layout.addWidget(self._progress_bar)
+        cancel_button = QPushButton("Cancel")
+        cancel_button.clicked.connect(prefetcher.cancel)
+        layout.addWidget(cancel_button)
+        self.setVisible(False)
+        prefetcher.events.progress.connect(self._on_progress)
+
+    def _on_progress(self, event):
+        self._progress_bar.setMaximum(event.total)
+        self._progress_bar.setValue(event.done)
+        self.setVisible(event.done < event.total)
+
+
 class QtSearchAndView(QWidget):
     def __init__(self, model, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.model = model
         layout = QHBoxLayout()
         self.setLayout(layout)
-        layout.addWidget(QtSearchWithButton(model.search))
+        search_layout = QVBoxLayout()
+        search_layout.addWidget(QtSearchWithButton(model.search))
+        search_layout.addWidget(QtViewProgress(model.prefetcher))
+        layout.addLayout(search_layout)
         plot_layout = QVBoxLayout()
         plot_layout.addWidget(QtAddCustomPlot(self.model))
         plot_layout.addWidget(QtFigures(model.databroker_auto_plot_builder.figures))
@@ -287,18 +327,72 @@ class QtOrganizeQueue(QWidget):
         self.setLayout(hbox)
 
 
+class QtLazyTab(QWidget):
+    """
+    A tab whose contents are built the first time it is shown.
+
+    Parameters
+    ----------
+    build : Callable
+        Returns the widget to show in the tab
+    """
+
+    def __init__(self, build, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._build = build
+        self.widget = None
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+    def ensure_built(self):
+        "Build the contents, if not done yet, and return them."
+        if self.widget is None:
+            self.widget = self._build()
+            self.layout().addWidget(self.widget)
+        return self.widget
+
+
 class QtViewer(QTabWidget):
-    def __init__(self, model, *args, **kwargs):
+    """
+    The tabs of the application.
+
+    Parameters
+    ----------
+    model : ViewerModel
+    lazy : Boolean, optional
+        If True, the default, the tabs and the models they show are built when
+        first shown, rather than all at startup.
+    """
+
+    def __init__(self, model, *args, lazy=True, **kwargs):
         super().__init__(*args, **kwargs)
         self.model = model
 
         self.setTabPosition(QTabWidget.West)
 
-        self._run_experiment = QtRunExperiment(RunAndView(model.run_engine, model.live_auto_plot_builder))
-        self.addTab(self._run_experiment, "Run Experiment")
-
-        self._organize_queue = QtOrganizeQueue(model.run_engine)
-        self.addTab(self._organize_queue, "Organize Queue")
-
-        self._search_and_view = QtSearchAndView(SearchAndView(model.search, model.databroker_auto_plot_builder))
-        self.addTab(self._search_and_view, "Data Broker")
+        self._run_experiment = self._add_tab(
+            lambda: QtRunExperiment(RunAndView(model.run_engine, model.live_auto_plot_builder)), "Run Experiment"
+        )
+        self._organize_queue = self._add_tab(lambda: QtOrganizeQueue(model.run_engine), "Organize Queue")
+        self._search_and_view = self._add_tab(
+            lambda: QtSearchAndView(
+                SearchAndView(model.search, model.databroker_auto_plot_builder, max_workers=SETTINGS.view_workers)
+            ),
+            "Data Broker",
+        )
+
+        self.currentChanged.connect(self._on_current_changed)
+        self.currentWidget().ensure_built()
+        if not lazy:
+            for index in range(self.count()):
+                self.widget(index).ensure_built()
+
+    def _add_tab(self, build, label):
+        tab = QtLazyTab(build)
+        self.addTab(tab, label)
+        return tab
+
+    def _on_current_changed(self, index):
+        if index >= 0:
+            self.widget(index).ensure_built()
@@ -0,0 +1,85 @@
+"""
+Time searches of the local run index.
+
+Run like:
+python benchmarks/run_index.py               # 100000 synthetic runs
+python benchmarks/run_index.py --runs 20000
+
+It builds an index of synthetic BMM start documents in a temporary file and
+prints the time taken by searches as the search tab makes them: by text, by
+element, by time range, and listing the first page of the results.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+ELEMENTS = ["Fe", "Cu", "Zn", "Mn", "Ni", "Co", "Cr", "Ti", "V", "As", "Se", "Pt"]
+PLANS = ["scan_nd xafs fluorescence", "scan_nd xafs transmission", "rel_scan linescan xafs_y It alignment"]
+
+
+def synthetic_runs(num, seed=0):
+    "(start, stop) of num runs, one a minute"
+    rng = random.Random(seed)
+    now = time.time() - 60 * num
+    for i in range(num):
+        start = {
+            "uid": str(uuid.UUID(int=rng.getrandbits(128))),
+            "time": now + 60 * i,
+            "scan_id": i,
+            "plan_name": rng.choice(PLANS),
+            "motors": ["dcm_energy"],
+            "XDI": {
+                "Element": {"symbol": rng.choice(ELEMENTS), "edge": "K"},
+                "Sample": {"name": f"sample {rng.randrange(1000)}"},
+                "Facility": {"SAF": 300000 + rng.randrange(500)},
+            },
+        }
+        yield start, {"run_start": start["uid"], "time": start["time"] + 30}
+
+
+def timed(function, repeat=20):
+    "Median seconds taken by function"
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time searches of the local run index")
+    parser.add_argument("--runs", type=int, default=100_000, help="Number of synthetic runs (default: 100000)")
+    args = parser.parse_args(argv)
+
+    from ariadne.run_index import RunIndex
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = RunIndex(os.path.join(directory, "runs.sqlite"))
+        start = time.perf_counter()
+        index.add(synthetic_runs(args.runs))
+        print(f"indexed {args.runs} runs in {time.perf_counter() - start:.1f} s")
+        since = time.time() - 60 * args.runs / 2
+        searches = {
+            "count all": lambda: index.count(),
+            "first page of all": lambda: index.search(limit=100),
+            "text 'xafs fluor'": lambda: index.count("xafs fluor"),
+            "first page of text 'fe xafs'": lambda: index.search("fe xafs", limit=100),
+            "element Cu": lambda: index.count(fields={"XDI.Element.symbol": "Cu"}),
+            "element Cu, newer half, first page": lambda: index.search(
+                since=since, fields={"XDI.Element.symbol": "Cu"}, limit=100
+            ),
+            "scan_id": lambda: index.search(fields={"scan_id": args.runs // 2}),
+        }
+        for name, search in searches.items():
+            print(f"{name}: {1000 * timed(search):.2f} ms")
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
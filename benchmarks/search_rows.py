@@ -0,0 +1,73 @@
+"""
+Rows of search results per second, one run at a time versus batched and cached.
+
+Run like:
+python benchmarks/search_rows.py             # 2000 synthetic runs
+python benchmarks/search_rows.py --runs 20000
+
+It writes the start and stop documents of synthetic BMM runs as JSONL files
+in a temporary directory, opens them as a databroker catalog and times
+formatting a row for every run in it: as the table of search results did,
+with ``extract_results_row_from_run(catalog[uid])``, and with a RowCache,
+both cold and warm.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import event_model
+
+
+def write_runs(directory, num):
+    "Write num runs of a start and a stop document each, one file per run."
+    for i in range(num):
+        bundle = event_model.compose_run(
+            metadata={
+                "plan_name": "scan_nd xafs fluorescence",
+                "scan_id": i,
+                "XDI": {"Element": {"symbol": "Fe", "edge": "K"}, "Sample": {"name": f"sample {i}"}},
+            }
+        )
+        with open(os.path.join(directory, f"{bundle.start_doc['uid']}.jsonl"), "w") as file:
+            for name, doc in [("start", bundle.start_doc), ("stop", bundle.compose_stop())]:
+                file.write(json.dumps([name, doc]) + "\n")
+
+
+def rate(function, num):
+    "Call function and return how many rows per second it made, num in all."
+    start = time.perf_counter()
+    function()
+    return num / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rows of search results per second")
+    parser.add_argument("--runs", type=int, default=2000, help="Number of synthetic runs (default: 2000)")
+    parser.add_argument("--batch-size", type=int, default=100, help="RowCache batch size (default: 100)")
+    args = parser.parse_args(argv)
+
+    from databroker._drivers.jsonl import BlueskyJSONLCatalog
+
+    from ariadne.search_rows import RowCache
+    from ariadne.settings import extract_results_row_from_metadata, extract_results_row_from_run
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_runs(directory, args.runs)
+        catalog = BlueskyJSONLCatalog(os.path.join(directory, "*.jsonl"), name="benchmark")
+        uids = list(catalog)
+        rows = RowCache(extract_results_row_from_metadata, max_rows=args.runs, batch_size=args.batch_size)
+        results = {
+            "per run": rate(lambda: [extract_results_row_from_run(catalog[uid]) for uid in uids], len(uids)),
+            "cold cache": rate(lambda: rows.get(catalog, uids), len(uids)),
+            "warm cache": rate(lambda: rows.get(catalog, uids), len(uids)),
+        }
+    for name, value in results.items():
+        print(f"{name}: {value:,.0f} rows/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Time from startup to the first paint of the Viewer's window.
+
+Run like:
+python benchmarks/startup.py              # lazy tabs, the default
+python benchmarks/startup.py --eager      # all tabs built at startup
+python benchmarks/startup.py --repeat 5 --catalog bmm
+
+Each measurement runs in a fresh interpreter, so that the time to import the
+application (and e.g. databroker, xraylib) is counted. For each, it prints the
+seconds until the application is imported, until the Viewer is constructed,
+and until its window is first painted.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# Taken first thing, before any import below counts.
+_start = time.perf_counter()
+
+
+def measure(eager, catalog=None):
+    "In this process: start the Viewer and return the times to import, construct and first paint."
+    import os
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qtpy.QtCore import QEvent, QObject, QTimer
+    from qtpy.QtWidgets import QApplication
+
+    from ariadne.settings import SETTINGS
+    from ariadne.viewer import Viewer
+
+    times = {"import": time.perf_counter() - _start}
+    app = QApplication.instance() or QApplication(["ariadne-benchmark"])
+    SETTINGS.lazy_tabs = not eager
+    SETTINGS.catalog_name = catalog
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and "paint" not in times:
+                times["paint"] = time.perf_counter() - _start
+                QTimer.singleShot(0, app.quit)
+            return False
+
+    first_paint = FirstPaint()
+    app.installEventFilter(first_paint)
+    viewer = Viewer(show=True)
+    times["construct"] = time.perf_counter() - _start
+    # Give up if nothing is painted, e.g. on a platform with no display.
+    QTimer.singleShot(60_000, app.quit)
+    app.exec_()
+    viewer.close()
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time to first paint of the Viewer")
+    parser.add_argument("--eager", action="store_true", help="Build all tabs at startup")
+    parser.add_argument("--catalog", help="Databroker catalog to search")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of fresh processes to time (default: 3)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.eager, args.catalog)))
+        return 0
+
+    command = [sys.executable, __file__, "--child"]
+    if args.eager:
+        command.append("--eager")
+    if args.catalog:
+        command += ["--catalog", args.catalog]
+    runs = []
+    for _ in range(args.repeat):
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    mode = "eager" if args.eager else "lazy"
+    for key in ("import", "construct", "paint"):
+        values = [run[key] for run in runs if key in run]
+        if values:
+            print(f"{mode} {key}: median {statistics.median(values):.3f} s, min {min(values):.3f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
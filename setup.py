@@ -47,7 +47,8 @@ setup(
     packages=find_packages(exclude=["docs", "tests"]),
     entry_points={
         "console_scripts": [
-            "ariadne = ariadne.main:main"
+            "ariadne = ariadne.main:main",
+            "ariadne-backfill = ariadne.backfill:main",
             # 'command = some.module:some_function',
         ],
         "databroker.handlers": [